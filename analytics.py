@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Per-institute registration funnel from the daily_stats rollup
+
+Triggers on registrations and pdf_downloads keep one daily_stats row per
+institute and day, so a funnel reads at most ANALYTICS_MAX_DAYS primary-key
+rows however much history the institute has. Payments and revenue are
+counted on the day the aspirant registered.
+
+    python analytics.py backfill     # rebuild daily_stats and institute_stats from the raw tables
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+from database import connect
+from migrations import backfill_daily_stats, backfill_institute_stats, migrate
+
+ANALYTICS_DEFAULT_DAYS = int(os.environ.get('ANALYTICS_DEFAULT_DAYS', 30))
+ANALYTICS_MAX_DAYS = int(os.environ.get('ANALYTICS_MAX_DAYS', 730))
+
+BUCKETS = {
+    'day': lambda day: day,
+    'week': lambda day: day - timedelta(days=day.weekday()),
+    'month': lambda day: day.replace(day=1),
+}
+
+COUNTERS = ('registrations', 'payments', 'revenue', 'downloads')
+
+
+def rates(counts):
+    """Add conversion rates to a dict of funnel counts"""
+    registrations = counts['registrations']
+    counts['payment_rate'] = round(counts['payments'] / registrations, 4) if registrations else None
+    counts['registration_rate'] = round(registrations / counts['downloads'], 4) if counts['downloads'] else None
+    return counts
+
+
+def funnel(cursor, institute_id, days=ANALYTICS_DEFAULT_DAYS, bucket='day', today=None):
+    """Funnel counts for the last ``days`` days (UTC) grouped into ``bucket``s, oldest first"""
+    today = today or datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+    cursor.execute('''
+        SELECT day, registrations, payments, revenue, downloads
+        FROM daily_stats
+        WHERE institute_id = ? AND day >= ? AND day <= ?
+    ''', (institute_id, start.isoformat(), today.isoformat()))
+    rows = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    # Every bucket in the range is listed, empty ones with zeros
+    key = BUCKETS[bucket]
+    buckets = {}
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        counts = buckets.setdefault(key(day), dict.fromkeys(COUNTERS, 0))
+        for name, value in zip(COUNTERS, rows.get(day.isoformat(), ())):
+            counts[name] += value
+
+    totals = dict.fromkeys(COUNTERS, 0)
+    series = []
+    for bucket_start, counts in buckets.items():
+        for name in COUNTERS:
+            totals[name] += counts[name]
+        series.append({'start': bucket_start.isoformat(), **rates(counts)})
+
+    return {
+        'from': start.isoformat(),
+        'to': today.isoformat(),
+        'bucket': bucket,
+        'buckets': series,
+        'totals': rates(totals),
+    }
+
+
+def backfill(conn):
+    """Recompute daily_stats and institute_stats in one transaction; returns the daily rows written"""
+    cursor = conn.cursor()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        backfill_daily_stats(cursor)
+        days = cursor.rowcount
+        backfill_institute_stats(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return days
+
+
+def main(args):
+    if args[:1] != ['backfill']:
+        print(__doc__.strip())
+        return 2
+    conn = connect()
+    migrate(conn)
+    print(f"[ANALYTICS] Rebuilt daily_stats: {backfill(conn)} rows")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,608 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the Coach Institute SaaS hot paths
+
+Usage:
+    python benchmark.py                 # run every benchmark
+    python benchmark.py connections     # run a single benchmark
+    python benchmark.py downloads       # concurrent 20 MB PDF downloads
+    python benchmark.py confirmations   # parallel payment confirmations of one registration
+    python benchmark.py reconcile       # payments.db / coach_saas.db reconciliation at scale
+    python benchmark.py exports         # streaming CSV/XLSX export of 500k registrations
+    python benchmark.py search          # FTS5 lead search versus LIKE '%...%' over 1M registrations
+    python benchmark.py serving         # requests/s per server and worker type (gunicorn.conf.py)
+    python benchmark.py group_commit    # registration bursts: commit per insert versus group commit
+    python benchmark.py rate_limit      # token-bucket cost per backend; a registration flood across workers
+    python benchmark.py logins          # public page latency during a login burst: inline versus pooled hashing
+
+Each benchmark works on a throwaway database in a temporary directory, so it
+is safe to run next to a live coach_saas.db.
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_workdir = tempfile.mkdtemp(prefix='coach_bench_')
+os.environ.setdefault('DATABASE_PATH', os.path.join(_workdir, 'coach_saas.db'))
+os.environ.setdefault('PAYMENTS_DATABASE_PATH', os.path.join(_workdir, 'payments.db'))
+os.environ.setdefault('RATE_LIMIT_DATABASE', os.path.join(_workdir, 'ratelimit.db'))
+# Every client here shares one address; bench_rate_limit turns the limiter on itself
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'off')
+
+import sqlite3
+
+from werkzeug.security import generate_password_hash
+
+import database
+from coach_saas_app import init_db
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', 5000))
+DOWNLOAD_SIZE = int(os.environ.get('BENCH_DOWNLOAD_MB', 20)) * 1024 * 1024
+DOWNLOAD_CLIENTS = int(os.environ.get('BENCH_DOWNLOAD_CLIENTS', 16))
+CONFIRMATIONS = int(os.environ.get('BENCH_CONFIRMATIONS', 300))
+CONFIRM_THREADS = int(os.environ.get('BENCH_CONFIRM_THREADS', 32))
+RECONCILE_ROWS = int(os.environ.get('BENCH_RECONCILE_ROWS', 1000000))
+EXPORT_ROWS = int(os.environ.get('BENCH_EXPORT_ROWS', 500000))
+SEARCH_ROWS = int(os.environ.get('BENCH_SEARCH_ROWS', 1000000))
+SEARCH_QUERIES = int(os.environ.get('BENCH_SEARCH_QUERIES', 200))
+SERVE_SECONDS = float(os.environ.get('BENCH_SERVE_SECONDS', 10))
+SERVE_CLIENTS = int(os.environ.get('BENCH_SERVE_CLIENTS', 32))
+BURST_SECONDS = float(os.environ.get('BENCH_BURST_SECONDS', 5))
+BURST_THREADS = int(os.environ.get('BENCH_BURST_THREADS', 64))
+FLOOD_REQUESTS = int(os.environ.get('BENCH_FLOOD_REQUESTS', 500))
+LOGIN_SECONDS = float(os.environ.get('BENCH_LOGIN_SECONDS', 5))
+LOGIN_RATE = int(os.environ.get('BENCH_LOGIN_RATE', 20))
+
+INSTITUTE_PAGE_SQL = '''
+    SELECT i.id, i.username, i.password_hash, i.institute_name, i.offer_text, i.upi_id, i.email, i.amount, i.is_active, i.created_at,
+           c.why_choose_us, c.pdf_title, c.pdf_filename, c.testimonials
+    FROM institutes i
+    LEFT JOIN configurations c ON i.id = c.institute_id
+    WHERE i.username = ? AND i.is_active = TRUE
+'''
+
+
+def seed_institutes(count=200):
+    """Create ``count`` institutes named bench0..benchN"""
+    init_db()
+    conn = database.get_connection()
+    password_hash = generate_password_hash('bench123')
+    for n in range(count):
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO institutes (username, password_hash, institute_name, email)
+            VALUES (?, ?, ?, ?)
+        ''', (f'bench{n}', password_hash, f'Bench Institute {n}', f'owner{n}@example.com'))
+        if cursor.rowcount:
+            conn.execute('''
+                INSERT INTO configurations (institute_id, why_choose_us, pdf_title, testimonials)
+                VALUES (?, ?, ?, ?)
+            ''', (cursor.lastrowid, "Quality education", "Download Sample Papers", "[]"))
+    conn.commit()
+    return count
+
+
+def report(label, elapsed, iterations):
+    print(f"  {label:<40} {iterations / elapsed:>10.0f} ops/s  {elapsed / iterations * 1e6:>8.1f} us/op")
+
+
+def _institute_page(conn, n):
+    conn.execute(INSTITUTE_PAGE_SQL, (f'bench{n % 200}',)).fetchone()
+
+
+def _register_aspirant(conn, n):
+    institute = conn.execute(
+        'SELECT id, institute_name, email FROM institutes WHERE username = ?', (f'bench{n % 200}',)
+    ).fetchone()
+    conn.execute('''
+        INSERT INTO registrations (institute_id, name, email, phone)
+        VALUES (?, ?, ?, ?)
+    ''', (institute[0], f'Aspirant {n}', f'aspirant{n}@example.com', '9999999999'))
+    conn.commit()
+
+
+def bench_connections():
+    """Per-request sqlite3.connect() versus the pooled per-thread connection"""
+    seed_institutes()
+    print(f"connections ({ITERATIONS} iterations)")
+
+    for name, operation in (('institute_page', _institute_page), ('register_aspirant', _register_aspirant)):
+        start = time.perf_counter()
+        for n in range(ITERATIONS):
+            conn = sqlite3.connect(database.DATABASE)
+            operation(conn, n)
+            conn.close()
+        report(f'{name} / connect per request', time.perf_counter() - start, ITERATIONS)
+
+        start = time.perf_counter()
+        for n in range(ITERATIONS):
+            operation(database.get_connection(), n)
+        report(f'{name} / pooled', time.perf_counter() - start, ITERATIONS)
+
+
+def bench_downloads():
+    """Concurrent sample-paper downloads: bytes through the app versus proxy offload"""
+    import file_serving
+    from coach_saas_app import app
+
+    seed_institutes()
+    upload_folder = os.path.join(_workdir, 'uploads')
+    os.makedirs(upload_folder, exist_ok=True)
+    app.config['UPLOAD_FOLDER'] = upload_folder
+    with open(os.path.join(upload_folder, 'bench0_paper.pdf'), 'wb') as f:
+        f.write(os.urandom(DOWNLOAD_SIZE))
+
+    url = '/download/bench0/bench0_paper.pdf'
+    form = {'name': 'Aspirant', 'email': 'aspirant@example.com', 'phone': '9999999999'}
+    print(f"downloads ({DOWNLOAD_CLIENTS} concurrent clients, {DOWNLOAD_SIZE // (1024 * 1024)} MB file)")
+
+    def download(headers):
+        with app.test_client() as client:
+            # Browsers resume with a plain GET carrying the Range header
+            if 'Range' in headers:
+                response = client.get(url, headers=headers)
+            else:
+                response = client.post(url, data=form)
+            return response.status_code, len(response.get_data())
+
+    for label, mode, headers in (
+        ('send_file (app streams the bytes)', 'python', None),
+        ('resume second half (206)', 'python', {'Range': f'bytes={DOWNLOAD_SIZE // 2}-'}),
+        ('X-Accel-Redirect (proxy streams)', 'x-accel', None),
+    ):
+        file_serving.FILE_SERVING_MODE = mode
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_CLIENTS) as pool:
+            results = list(pool.map(lambda _: download(headers or {}), range(DOWNLOAD_CLIENTS)))
+        elapsed = time.perf_counter() - start
+        sent = sum(length for _, length in results)
+        report(label, elapsed, DOWNLOAD_CLIENTS)
+        print(f"  {'':<40} {sent / elapsed / 1024 / 1024:>10.0f} MB/s app egress, status {results[0][0]}")
+
+
+def bench_confirmations():
+    """Hundreds of parallel confirmations of one registration must complete it exactly once"""
+    from coach_saas_app import app
+    import payment_service
+    import rate_limit
+
+    # Measure idempotency, not admission control (as in bench_serving)
+    rate_limit.set_max_inflight(0)
+    seed_institutes()
+    conn = database.get_connection()
+    _register_aspirant(conn, 0)
+    registration_id = conn.execute('SELECT MAX(id) FROM registrations').fetchone()[0]
+    print(f"confirmations ({CONFIRMATIONS} requests on {CONFIRM_THREADS} threads)")
+
+    def confirm(n):
+        with app.test_client() as client:
+            response = client.post('/payment/confirm', data={
+                'registration_id': registration_id, 'payment_id': f'pay_{n}'})
+            return response.status_code, response.get_data(as_text=True)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONFIRM_THREADS) as pool:
+        results = list(pool.map(confirm, range(CONFIRMATIONS)))
+    report('confirm_payment', time.perf_counter() - start, CONFIRMATIONS)
+
+    payment_id = conn.execute('SELECT payment_id FROM registrations WHERE id = ?', (registration_id,)).fetchone()[0]
+    emails = conn.execute('''
+        SELECT COUNT(*) FROM email_outbox WHERE kind = 'aspirant_payment' AND body LIKE ?
+    ''', (f'%{payment_id}%',)).fetchone()[0]
+    consistent = all(status == 200 and payment_id in body for status, body in results)
+    print(f"  {'confirmation emails queued':<40} {emails:>10} (expected 1)")
+    print(f"  {'responses naming the stored payment':<40} {'all' if consistent else 'NOT ALL':>10}")
+
+    # The gateway-side verify has the same guarantee
+    client = payment_service.app.test_client()
+    transaction_id = client.post('/payment/create_order', json={
+        'registration_id': registration_id, 'institute_id': 1}).get_json()['transaction_id']
+
+    def verify(n):
+        with payment_service.app.test_client() as client:
+            response = client.post('/payment/verify', json={
+                'transaction_id': transaction_id, 'razorpay_payment_id': f'pay_{n % 2}'})
+            return response.get_json()
+
+    with ThreadPoolExecutor(max_workers=CONFIRM_THREADS) as pool:
+        verified = list(pool.map(verify, range(CONFIRMATIONS)))
+    first_completions = sum(1 for result in verified if result.get('success') and not result['already_completed'])
+    print(f"  {'verify_payment first completions':<40} {first_completions:>10} (expected 1)")
+
+    if emails != 1 or not consistent or first_completions != 1:
+        print("  [FAIL] payment confirmation is not idempotent")
+        sys.exit(1)
+
+
+def bench_reconcile():
+    """Full and incremental reconciliation over RECONCILE_ROWS transactions, 1% of them unrecorded"""
+    import reconcile_payments
+
+    seed_institutes()
+    conn = reconcile_payments.open_databases()
+    print(f"reconcile ({RECONCILE_ROWS} transactions)")
+
+    start = time.perf_counter()
+    first = conn.execute('SELECT COALESCE(MAX(id), 0) FROM registrations').fetchone()[0] + 1
+    conn.executemany('''
+        INSERT INTO registrations (id, institute_id, name, email, phone, payment_status, payment_id)
+        VALUES (?, 1, 'Aspirant', 'aspirant@example.com', '9999999999', ?, ?)
+    ''', ((first + n, 'pending' if n % 100 == 0 else 'completed', f'pay_{n}') for n in range(RECONCILE_ROWS)))
+    conn.executemany('''
+        INSERT INTO payments.payment_transactions
+            (registration_id, institute_id, amount, gateway_order_id, gateway_payment_id, status, updated_at)
+        VALUES (?, 1, 1000, ?, ?, 'completed', datetime('now', ?))
+    ''', ((first + n, f'order_{n}', f'pay_{n}', f'-{3600 + (RECONCILE_ROWS - n) // 10} seconds')
+          for n in range(RECONCILE_ROWS)))
+    conn.commit()
+    print(f"  {'seeded in':<40} {time.perf_counter() - start:>10.1f} s")
+
+    summary = reconcile_payments.reconcile(conn)
+    print(f"  {'full pass':<40} {summary['seconds']:>10.2f} s  checked {summary['checked']}, repaired {summary['repaired']}")
+
+    conn.executemany('''
+        UPDATE payments.payment_transactions SET updated_at = CURRENT_TIMESTAMP WHERE id = ?
+    ''', ((n,) for n in range(1, RECONCILE_ROWS, 1000)))
+    conn.commit()
+    summary = reconcile_payments.reconcile(conn, incremental=True)
+    print(f"  {'incremental pass':<40} {summary['seconds']:>10.2f} s  checked {summary['checked']}, repaired {summary['repaired']}")
+
+
+def bench_exports():
+    """Time to first byte, throughput and peak Python memory of the streaming exports"""
+    import tracemalloc
+    from coach_saas_app import app
+
+    seed_institutes()
+    conn = database.get_connection()
+    conn.executemany('''
+        INSERT INTO registrations (institute_id, name, email, phone, payment_status, registered_at)
+        VALUES (1, ?, ?, '+91 98765 43210', ?, datetime('2026-01-01', ?))
+    ''', ((f'Aspirant {n}', f'aspirant{n}@example.com', 'completed' if n % 3 else 'pending', f'+{n} seconds')
+          for n in range(EXPORT_ROWS)))
+    conn.commit()
+    print(f"exports ({EXPORT_ROWS} registrations)")
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['institute_id'] = 1
+        session['username'] = 'bench0'
+
+    for fmt in ('csv', 'xlsx'):
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.get(f'/admin/export/registrations.{fmt}', buffered=False)
+        first_byte = None
+        sent = 0
+        for chunk in response.response:
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            sent += len(chunk)
+        response.close()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report(f'{fmt} export', elapsed, EXPORT_ROWS)
+        print(f"  {'':<40} {sent / 1024 / 1024:>10.1f} MB body, first byte after {first_byte * 1000:.0f} ms, "
+              f"peak {peak / 1024 / 1024:.1f} MB traced")
+
+
+def bench_search():
+    """Prefix search through the lead_search FTS5 index versus LIKE '%...%' on registrations"""
+    import random
+    from lead_search import search_leads
+
+    first_names = ['Aarav', 'Priya', 'Rohan', 'Ananya', 'Vikram', 'Sneha', 'Arjun', 'Kavya', 'Rahul', 'Meera']
+    last_names = ['Sharma', 'Verma', 'Iyer', 'Reddy', 'Gupta', 'Nair', 'Patel', 'Singh', 'Das', 'Menon']
+
+    seed_institutes()
+    conn = database.get_connection()
+    start = time.perf_counter()
+    conn.executemany('''
+        INSERT INTO registrations (institute_id, name, email, phone)
+        VALUES (1, ?, ?, ?)
+    ''', ((f'{first_names[n % 10]} {last_names[n // 10 % 10]} {n}',
+           f'{first_names[n % 10].lower()}.{last_names[n // 10 % 10].lower()}{n}@example.com',
+           f'+91 9{n:09d}') for n in range(SEARCH_ROWS)))
+    conn.commit()
+    print(f"search ({SEARCH_ROWS} registrations in one institute, {SEARCH_QUERIES} queries per case)")
+    print(f"  {'seeded (with index triggers) in':<40} {time.perf_counter() - start:>10.1f} s")
+
+    rng = random.Random(20)
+    cases = {
+        'common name': lambda: f'{rng.choice(first_names)} {rng.choice(last_names)}',
+        'one email': lambda: (lambda n: f'{first_names[n % 10].lower()}.{last_names[n // 10 % 10].lower()}{n}')(
+            rng.randrange(SEARCH_ROWS)),
+        'one phone': lambda: f'9{rng.randrange(SEARCH_ROWS):09d}',
+        'no match': lambda: 'zzqx',
+    }
+    cursor = conn.cursor()
+    for label, make_query in cases.items():
+        queries = [make_query() for _ in range(SEARCH_QUERIES)]
+
+        start = time.perf_counter()
+        found = sum(len(search_leads(cursor, 1, query)[0]) for query in queries)
+        report(f'{label} / fts5 prefix', time.perf_counter() - start, SEARCH_QUERIES)
+
+        start = time.perf_counter()
+        for query in queries[:max(1, SEARCH_QUERIES // 20)]:
+            pattern = f'%{query}%'
+            cursor.execute('''
+                SELECT id, name, email, phone FROM registrations
+                WHERE institute_id = ? AND (name LIKE ? OR email LIKE ? OR phone LIKE ?)
+                ORDER BY registered_at DESC, id DESC
+                LIMIT 20
+            ''', (1, pattern, pattern, pattern)).fetchall()
+        report(f'{label} / like baseline', time.perf_counter() - start, max(1, SEARCH_QUERIES // 20))
+        print(f"  {'':<40} {found / SEARCH_QUERIES:>10.1f} results per fts5 query")
+
+
+def start_server(command, port, env):
+    """Start ``command`` as an HTTP server on ``port`` and wait until it answers"""
+    import http.client
+    import subprocess
+
+    env = dict(os.environ, PORT=str(port), GUNICORN_ACCESS_LOG='', **env)
+    server = subprocess.Popen(command, cwd=_workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            http.client.HTTPConnection('127.0.0.1', port, timeout=1).request('GET', '/robots.txt')
+            break
+        except OSError:
+            time.sleep(0.1)
+    return server
+
+
+def gunicorn_command():
+    here = os.path.dirname(os.path.abspath(__file__))
+    return [sys.executable, '-m', 'gunicorn', '-c', os.path.join(here, 'gunicorn.conf.py'),
+            '--pythonpath', here, 'coach_saas_app:app']
+
+
+def bench_serving():
+    """institute_page and register_aspirant over HTTP: Flask dev server versus gunicorn sync and gthread"""
+    import http.client
+    from urllib.parse import urlencode
+
+    seed_institutes()
+    database.close_all()
+    here = os.path.dirname(os.path.abspath(__file__))
+    gunicorn = gunicorn_command()
+    profiles = (
+        ('flask dev server', [sys.executable, os.path.join(here, 'coach_saas_app.py')], {}),
+        ('gunicorn sync', gunicorn, {'GUNICORN_WORKER_CLASS': 'sync'}),
+        ('gunicorn gthread', gunicorn, {}),
+    )
+    aspirants = itertools.count()
+
+    def institute_page(conn):
+        conn.request('GET', f'/institute/bench{next(aspirants) % 200}')
+
+    def register_aspirant(conn):
+        n = next(aspirants)
+        conn.request('POST', f'/register/bench{n % 200}', urlencode({
+            'name': f'Aspirant {n}', 'email': f'serve{n}@example.com', 'phone': f'9{n:09d}',
+        }), {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def client(port, send, deadline):
+        ok = errors = 0
+        while time.perf_counter() < deadline:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            try:
+                send(conn)
+                response = conn.getresponse()
+                response.read()
+                if response.status == 200:
+                    ok += 1
+                else:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+            finally:
+                conn.close()
+        return ok, errors
+
+    print(f"serving ({SERVE_CLIENTS} clients, {SERVE_SECONDS:.0f}s per case, {os.cpu_count()} CPUs)")
+    for port, (label, command, env) in enumerate(profiles, start=5600):
+        # Measure the servers, not admission control (which sheds the dev server's unbounded threads)
+        server = start_server(command, port, dict(env, GUNICORN_MAX_REQUESTS='1000', RATE_LIMIT_MAX_INFLIGHT='1000'))
+        try:
+            for name, send in (('institute_page', institute_page), ('register_aspirant', register_aspirant)):
+                deadline = time.perf_counter() + SERVE_SECONDS
+                with ThreadPoolExecutor(max_workers=SERVE_CLIENTS) as pool:
+                    results = list(pool.map(lambda _: client(port, send, deadline), range(SERVE_CLIENTS)))
+                ok = sum(result[0] for result in results)
+                errors = sum(result[1] for result in results)
+                report(f'{name} / {label}', SERVE_SECONDS, max(ok, 1))
+                if errors:
+                    print(f"  {'':<40} {errors:>10} failed requests")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def bench_group_commit():
+    """Registration burst from many threads: one transaction per insert versus the group-commit writer"""
+    import threading
+    from coach_saas_app import save_registration
+    from group_commit import GroupCommitter, commit_write
+
+    seed_institutes()
+    institutes = database.get_connection().execute(
+        "SELECT id, institute_name, email FROM institutes WHERE username LIKE 'bench%'"
+    ).fetchall()
+    print(f"group_commit ({BURST_THREADS} threads, {BURST_SECONDS:.0f}s per case)")
+
+    def burst(label, write, stop=None):
+        counter = itertools.count()
+        acknowledged = []
+        errors = []
+        deadline = time.perf_counter() + BURST_SECONDS
+
+        def client():
+            while time.perf_counter() < deadline:
+                n = next(counter)
+                try:
+                    # Distinct leads per burst, or the second burst only finds the first one's rows
+                    registration_id = write(save_registration, institutes[n % len(institutes)],
+                                            f'Aspirant {n}', f"burst{n}.{label.replace(' ', '-')}@example.com", f'9{n:09d}')
+                except sqlite3.OperationalError:
+                    errors.append(n)
+                    continue
+                if registration_id is None:
+                    break
+                acknowledged.append(registration_id)
+
+        first = database.get_connection().execute('SELECT COALESCE(MAX(id), 0) FROM registrations').fetchone()[0]
+        threads = [threading.Thread(target=client) for _ in range(BURST_THREADS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        if stop:
+            # Shut the writer down while clients are still submitting
+            time.sleep(BURST_SECONDS)
+            stop()
+        for thread in threads:
+            thread.join()
+        report(f'register_aspirant / {label}', time.perf_counter() - start, max(len(acknowledged), 1))
+
+        stored = {row[0] for row in database.get_connection().execute(
+            'SELECT id FROM registrations WHERE id > ?', (first,))}
+        lost = len(set(acknowledged) - stored)
+        print(f"  {'':<40} {len(acknowledged):>10} acknowledged, {lost} lost, {len(errors)} 'database is locked'")
+
+    burst('commit per insert', commit_write)
+
+    committer = GroupCommitter()
+
+    def grouped(operation, *args):
+        future = committer.submit(operation, *args)
+        return future.result() if future else None
+
+    burst('group commit', grouped, committer.shutdown)
+
+
+def bench_rate_limit():
+    """Cost of one token-bucket check per backend, and one address flooding /register across two workers"""
+    import http.client
+    import rate_limit
+    from urllib.parse import urlencode
+
+    print(f"rate_limit ({ITERATIONS} checks, {CONFIRM_THREADS} threads)")
+    for name, backend in rate_limit.BACKENDS.items():
+        buckets = backend()
+        keys = itertools.count()
+
+        def check(_):
+            buckets.take(f'register:ip:10.0.{next(keys) % 4096}', 10, 10 / 60)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=CONFIRM_THREADS) as pool:
+            list(pool.map(check, range(ITERATIONS)))
+        report(f'take / {name}', time.perf_counter() - start, ITERATIONS)
+
+    seed_institutes()
+    database.close_all()
+    limit = rate_limit.RATE_LIMITS['register']['ip'][0]
+    print(f"  flood: {FLOOD_REQUESTS} registrations from one address, 2 gunicorn workers, limit {limit} per address")
+    for port, backend in enumerate(('memory', 'sqlite'), start=5700):
+        server = start_server(gunicorn_command(), port, {
+            'WEB_CONCURRENCY': '2', 'GUNICORN_WORKER_CLASS': 'sync', 'RATE_LIMIT_BACKEND': backend,
+            'RATE_LIMIT_DATABASE': os.path.join(_workdir, f'flood_{backend}.db'),
+        })
+        try:
+            statuses = {}
+            start = time.perf_counter()
+            for n in range(FLOOD_REQUESTS):
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                conn.request('POST', '/register/bench0', urlencode({
+                    'name': f'Bot {n}', 'email': f'flood{backend}{n}@example.com', 'phone': f'8{n:09d}',
+                }), {'Content-Type': 'application/x-www-form-urlencoded'})
+                response = conn.getresponse()
+                response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+                conn.close()
+            elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"  {backend:<40} {statuses.get(200, 0):>10} admitted, {statuses.get(429, 0)} refused with 429"
+              f" ({elapsed / FLOOD_REQUESTS * 1e6:.0f} us/request)")
+
+
+def bench_logins():
+    """institute_page latency in a 4-thread worker flooded with logins: hashing inline versus on the bounded pool"""
+    import passwords
+    from werkzeug.security import check_password_hash
+    from coach_saas_app import app
+
+    seed_institutes()
+    password_hash = passwords.make_hash('bench123')
+    client = app.test_client()
+    client.get('/institute/bench0')
+    passwords.verify_password(password_hash, 'bench123')  # start the pool
+    tick = 1 / LOGIN_RATE
+    print(f"logins ({LOGIN_RATE} logins/s and {LOGIN_RATE} page views/s into 4 request threads,"
+          f" {LOGIN_SECONDS:.0f}s per case, {os.cpu_count()} CPUs)")
+
+    def inline():
+        return check_password_hash(password_hash, 'bench123')
+
+    def pooled():
+        try:
+            return passwords.verify_password(password_hash, 'bench123')[0]
+        except passwords.HashingBusy:
+            return None
+
+    def page(arrived):
+        client.get('/institute/bench0')
+        return time.perf_counter() - arrived
+
+    for label, login in (('inline', inline), ('pool', pooled)):
+        # Like a gthread worker: requests wait for one of 4 threads in arrival order
+        worker = ThreadPoolExecutor(max_workers=4)
+        logins, pages = [], []
+        deadline = time.perf_counter() + LOGIN_SECONDS
+        while time.perf_counter() < deadline:
+            logins.append(worker.submit(login))
+            pages.append(worker.submit(page, time.perf_counter()))
+            time.sleep(tick)
+        worker.shutdown(cancel_futures=True)
+
+        latencies = sorted(future.result() for future in pages if not future.cancelled())
+        served = [future.result() for future in logins if not future.cancelled()]
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        print(f"  institute_page / {label:<23} p50 {p50:>7.1f} ms  p99 {p99:>7.1f} ms"
+              f"  ({len(pages) - len(latencies)} of {len(pages)} never served)")
+        print(f"  {'':<40} logins: {served.count(True)} verified, {served.count(None)} refused busy,"
+              f" {len(logins) - len(served)} never served")
+
+BENCHMARKS = {
+    'connections': bench_connections,
+    'downloads': bench_downloads,
+    'confirmations': bench_confirmations,
+    'reconcile': bench_reconcile,
+    'exports': bench_exports,
+    'search': bench_search,
+    'serving': bench_serving,
+    'group_commit': bench_group_commit,
+    'rate_limit': bench_rate_limit,
+    'logins': bench_logins,
+}
+
+
+def main(names):
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name}. Choose from: {', '.join(BENCHMARKS)}")
+            return 1
+        BENCHMARKS[name]()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+End-to-end checks of the Coach Institute SaaS request paths
+
+Usage:
+    python check_app.py                 # run every check
+    python check_app.py payment_page    # run a single check
+    python check_app.py email_outbox    # outbox delivery against a local stub SMTP server
+
+Each check works on throwaway databases in a temporary directory and exits
+non-zero on the first failed expectation, so it can run in CI.
+"""
+
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: no TLS, no AUTH, every message kept in memory"""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.reply('220 stub ESMTP')
+        recipients = []
+        for line in self.rfile:
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 stub')
+            elif verb in ('MAIL', 'RSET'):
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipient = command.split(':', 1)[1].strip().strip('<>')
+                refusal = self.server.refuse(recipient)
+                if refusal:
+                    self.reply(refusal)
+                else:
+                    recipients.append(recipient)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                for data in self.rfile:
+                    if data == b'.\r\n':
+                        break
+                self.reply(self.server.accept(recipients))
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    """Local SMTP server that fails a recipient while ``failures`` (451 after DATA) or ``greylist`` (450 at RCPT) lasts"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubSMTPHandler)
+        self.received = []
+        self.failures = {}
+        self.greylist = {}
+        self.lock = threading.Lock()
+
+    def refuse(self, recipient):
+        with self.lock:
+            if self.greylist.get(recipient, 0) > 0:
+                self.greylist[recipient] -= 1
+                return '450 4.2.0 Greylisted, try again later'
+        return None
+
+    def accept(self, recipients):
+        with self.lock:
+            for recipient in recipients:
+                if self.failures.get(recipient, 0) > 0:
+                    self.failures[recipient] -= 1
+                    return '451 4.3.0 Temporary failure, try again later'
+            self.received.extend(recipients)
+        return '250 OK: queued'
+
+
+_workdir = tempfile.mkdtemp(prefix='coach_check_')
+os.environ.setdefault('DATABASE_PATH', os.path.join(_workdir, 'coach_saas.db'))
+os.environ.setdefault('PAYMENTS_DATABASE_PATH', os.path.join(_workdir, 'payments.db'))
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'off')
+
+# email_outbox reads its SMTP settings on import, so the stub must be listening first
+smtp_stub = StubSMTPServer()
+os.environ.update({
+    'SMTP_HOST': '127.0.0.1',
+    'SMTP_PORT': str(smtp_stub.server_address[1]),
+    'SMTP_STARTTLS': 'false',
+    'SENDER_EMAIL': 'noreply@check.example.com',
+    'SENDER_PASSWORD': '',
+    'EMAIL_MAX_ATTEMPTS': '3',
+    'EMAIL_RETRY_BASE': '30',
+})
+
+import database
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def expect(condition, message):
+    if not condition:
+        raise CheckFailed(message)
+
+
+def create_institute(username, upi_id, amount):
+    """Insert an institute with its configuration row; returns its id"""
+    from coach_saas_app import init_db
+
+    init_db()
+    conn = database.get_connection()
+    cursor = conn.execute('''
+        INSERT INTO institutes (username, password_hash, institute_name, upi_id, email, amount)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (username, 'unused', f'{username.title()} Academy', upi_id, f'owner@{username}.example.com', amount))
+    institute_id = cursor.lastrowid
+    conn.execute('''
+        INSERT INTO configurations (institute_id, why_choose_us, pdf_title, testimonials)
+        VALUES (?, ?, ?, ?)
+    ''', (institute_id, 'Quality education', 'Download Sample Papers', '[]'))
+    conn.commit()
+    return institute_id
+
+
+def check_payment_page():
+    """The payment page shows the institute's UPI ID and fee, not the aspirant's details"""
+    from coach_saas_app import app
+
+    create_institute('acme', 'acme@okaxis', 2500)
+    client = app.test_client()
+    registration = client.post('/register/acme', data={
+        'name': 'Ravi', 'email': 'ravi@x.com', 'phone': '98765 43210',
+    }).get_json()
+    expect(registration and registration.get('success'), f"registration failed: {registration}")
+
+    response = client.get(registration['payment_url'])
+    html = response.get_data(as_text=True)
+    expect(response.status_code == 200, f"payment page returned {response.status_code}")
+    expect("const upiId = 'acme@okaxis'" in html, "payment page does not use the institute's UPI ID")
+    expect("const amount = '2500'" in html, "payment page does not use the institute's fee")
+    expect('Acme Academy' in html, "payment page does not name the institute")
+    expect('ravi@x.com' in html and 'Ravi' in html, "payment page does not show the aspirant")
+
+
+def outbox_row(conn, email_id):
+    """(status, attempts, seconds until next attempt, last_error) of one outbox row"""
+    return conn.execute('''
+        SELECT status, attempts, CAST(strftime('%s', next_attempt_at) - strftime('%s', 'now') AS INTEGER), last_error
+        FROM email_outbox WHERE id = ?
+    ''', (email_id,)).fetchone()
+
+
+def queue_check_email(conn, to_email):
+    """Queue one mail to ``to_email`` and make every other pending row wait; returns its id"""
+    from email_outbox import queue_email
+
+    conn.execute("UPDATE email_outbox SET next_attempt_at = datetime('now', '+1 day') WHERE status = 'pending'")
+    cursor = conn.cursor()
+    queue_email(cursor, to_email, 'Outbox check', '<p>Hello</p>')
+    conn.commit()
+    return cursor.lastrowid
+
+
+def retry_now(conn, email_id):
+    """Skip the backoff wait, as if it had elapsed"""
+    conn.execute("UPDATE email_outbox SET next_attempt_at = CURRENT_TIMESTAMP WHERE id = ?", (email_id,))
+    conn.commit()
+
+
+def check_email_outbox():
+    """Outbox delivery over SMTP: a send, retries with backoff after 4xx replies, a dead letter after EMAIL_MAX_ATTEMPTS"""
+    import email_outbox
+    from coach_saas_app import init_db
+
+    threading.Thread(target=smtp_stub.serve_forever, daemon=True).start()
+    init_db()
+    conn = database.get_connection()
+    base = email_outbox.EMAIL_RETRY_BASE
+    try:
+        # Delivered on the first attempt
+        email_id = queue_check_email(conn, 'ok@check.example.com')
+        email_outbox.drain_once(conn)
+        expect(outbox_row(conn, email_id)[:2] == ('sent', 1), f"first send not recorded: {outbox_row(conn, email_id)}")
+        expect('ok@check.example.com' in smtp_stub.received, "stub server never received the first send")
+
+        # One temporary failure: rescheduled about EMAIL_RETRY_BASE seconds out, then delivered
+        smtp_stub.failures['flaky@check.example.com'] = 1
+        email_id = queue_check_email(conn, 'flaky@check.example.com')
+        email_outbox.drain_once(conn)
+        status, attempts, wait, error = outbox_row(conn, email_id)
+        expect((status, attempts) == ('pending', 1), f"temporary failure not rescheduled: {status}, {attempts} attempts")
+        expect(0.8 * base - 1 <= wait <= 1.2 * base + 1, f"retry due in {wait}s, expected about {base}s")
+        expect(error and '451' in error, f"temporary failure not recorded: {error}")
+        retry_now(conn, email_id)
+        email_outbox.drain_once(conn)
+        expect(outbox_row(conn, email_id)[:2] == ('sent', 2), f"retry not delivered: {outbox_row(conn, email_id)}")
+
+        # A greylisting RCPT refusal is temporary too, not a dead letter
+        smtp_stub.greylist['grey@check.example.com'] = 1
+        email_id = queue_check_email(conn, 'grey@check.example.com')
+        email_outbox.drain_once(conn)
+        status, attempts, wait, error = outbox_row(conn, email_id)
+        expect((status, attempts) == ('pending', 1), f"greylisted mail not rescheduled: {status}, {attempts} attempts")
+        expect(error and '450' in error, f"greylisting not recorded: {error}")
+        retry_now(conn, email_id)
+        email_outbox.drain_once(conn)
+        expect(outbox_row(conn, email_id)[:2] == ('sent', 2), f"greylisted retry not delivered: {outbox_row(conn, email_id)}")
+
+        # Failing every time: backoff doubles, then the row is dead after EMAIL_MAX_ATTEMPTS
+        smtp_stub.failures['down@check.example.com'] = email_outbox.EMAIL_MAX_ATTEMPTS
+        email_id = queue_check_email(conn, 'down@check.example.com')
+        waits = []
+        for _ in range(email_outbox.EMAIL_MAX_ATTEMPTS):
+            email_outbox.drain_once(conn)
+            waits.append(outbox_row(conn, email_id)[2])
+            retry_now(conn, email_id)
+        status, attempts, _, error = outbox_row(conn, email_id)
+        expect((status, attempts) == ('dead', email_outbox.EMAIL_MAX_ATTEMPTS),
+               f"not dead-lettered after {email_outbox.EMAIL_MAX_ATTEMPTS} attempts: {status}, {attempts} attempts")
+        expect(0.8 * 2 * base - 1 <= waits[1] <= 1.2 * 2 * base + 1, f"second retry due in {waits[1]}s, expected about {2 * base}s")
+        expect('down@check.example.com' not in smtp_stub.received, "stub server accepted a failing recipient")
+    finally:
+        email_outbox.smtp_pool.close()
+        smtp_stub.shutdown()
+
+
+CHECKS = {
+    'payment_page': check_payment_page,
+    'email_outbox': check_email_outbox,
+}
+
+
+def main(names):
+    for name in names or CHECKS:
+        if name not in CHECKS:
+            print(f"Unknown check: {name}. Choose from: {', '.join(CHECKS)}")
+            return 1
+        try:
+            CHECKS[name]()
+        except CheckFailed as e:
+            print(f"[FAIL] {name}: {e}")
+            return 1
+        print(f"[PASS] {name}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Query-plan regression check
+
+Collects every SQL statement passed to ``.execute()`` in the modules below,
+runs ``EXPLAIN QUERY PLAN`` for it against a freshly migrated database and
+fails if any plan falls back to a full table scan. F-string SQL is checked in
+every variant it can produce (see SQL_PARAMETERS); SQL the check cannot
+expand fails as unchecked. Run it after changing a query or the schema:
+
+    python check_query_plans.py
+"""
+
+import ast
+import itertools
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+from migrations import MIGRATIONS, PAYMENT_MIGRATIONS, RATE_LIMIT_MIGRATIONS, migrate
+
+# Module -> migrations describing the database its statements run against
+CHECKED_MODULES = {
+    'coach_saas_app.py': MIGRATIONS,
+    'payment_service.py': PAYMENT_MIGRATIONS,
+    'sitemap.py': MIGRATIONS,
+    'email_outbox.py': MIGRATIONS,
+    'upload_store.py': MIGRATIONS,
+    'image_variants.py': MIGRATIONS,
+    'payment_state.py': MIGRATIONS,
+    'webhook_processor.py': PAYMENT_MIGRATIONS,
+    'reconcile_payments.py': MIGRATIONS,
+    'analytics.py': MIGRATIONS,
+    'exports.py': MIGRATIONS,
+    'lead_search.py': MIGRATIONS,
+    'rate_limit.py': RATE_LIMIT_MIGRATIONS,
+}
+
+# Module -> {schema name: migrations} for databases it ATTACHes
+ATTACHED = {
+    'reconcile_payments.py': {'payments': PAYMENT_MIGRATIONS},
+}
+
+# Statements that are meant to visit every row, keyed by a distinctive fragment
+FULL_SCAN_ALLOWED = {
+    # IT dashboard substring search: one row per tenant, and '%term%' cannot use an index
+    "FROM institutes i WHERE i.username LIKE ?": 'institute search',
+}
+
+
+def module_constant(path, name):
+    """Value of the module-level literal ``name = ...`` in ``path``"""
+    with open(path) as source:
+        tree = ast.parse(source.read(), filename=path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == name for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise LookupError(f"{name} not found in {path}")
+
+
+def institute_orderings(path):
+    """Every ORDER BY clause fetch_institutes_page builds from INSTITUTE_SORTS"""
+    return [', '.join(f'{column} {order}' for column in columns)
+            for columns in module_constant(path, 'INSTITUTE_SORTS').values()
+            for order in ('ASC', 'DESC')]
+
+
+# Module -> {name interpolated into f-string SQL: function(path) -> its possible values}.
+# Names assigned only string literals in the enclosing function need no entry.
+SQL_PARAMETERS = {
+    'coach_saas_app.py': {'order_by': institute_orderings},
+}
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+SKIPPED_PREFIXES = ('CREATE', 'PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'ATTACH', 'DETACH', 'ANALYZE')
+
+
+def literal_assignments(function):
+    """{name: [string literals]} assigned in ``function``, tuple unpacking included"""
+    values = {}
+    for node in ast.walk(function):
+        if not isinstance(node, ast.Assign):
+            continue
+        for target in node.targets:
+            pairs = [(target, node.value)]
+            if isinstance(target, ast.Tuple) and isinstance(node.value, ast.Tuple):
+                pairs = zip(target.elts, node.value.elts)
+            for name, value in pairs:
+                if isinstance(name, ast.Name) and isinstance(value, ast.Constant) and isinstance(value.value, str):
+                    values.setdefault(name.id, []).append(value.value)
+    return values
+
+
+def expand_fstring(sql, known):
+    """Every SQL string the f-string ``sql`` can produce from ``known`` {name: values}, or None"""
+    parts = []
+    for value in sql.values:
+        if isinstance(value, ast.Constant):
+            parts.append([value.value])
+        elif (isinstance(value, ast.FormattedValue) and isinstance(value.value, ast.Name)
+              and value.conversion == -1 and value.format_spec is None and value.value.id in known):
+            parts.append(known[value.value.id])
+        else:
+            return None
+    return [''.join(combination) for combination in itertools.product(*parts)]
+
+
+def collect_statements(path, parameters=None):
+    """Yield (line number, SQL) for every statement passed to .execute()
+
+    Literal strings are taken as they are. F-strings are expanded over every
+    value their interpolated names can take (``parameters`` first, then string
+    literals assigned in the enclosing function); SQL that cannot be expanded
+    is yielded as None so it is reported rather than skipped.
+    """
+    with open(path) as source:
+        tree = ast.parse(source.read(), filename=path)
+    parameters = {name: values(path) for name, values in (parameters or {}).items()}
+
+    # Innermost enclosing function of every node
+    enclosing = {}
+    for function in ast.walk(tree):
+        if isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for node in ast.walk(function):
+                enclosing[node] = function
+
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+            continue
+        if node.func.attr not in ('execute', 'executemany') or not node.args:
+            continue
+        sql = node.args[0]
+        if isinstance(sql, ast.Constant) and isinstance(sql.value, str):
+            variants = [sql.value]
+        elif isinstance(sql, ast.JoinedStr):
+            known = literal_assignments(enclosing[node]) if node in enclosing else {}
+            variants = expand_fstring(sql, {**known, **parameters})
+        else:
+            variants = None
+        if variants is None:
+            yield node.lineno, None
+            continue
+        for variant in variants:
+            statement = ' '.join(variant.split())
+            if not statement.upper().startswith(SKIPPED_PREFIXES):
+                yield node.lineno, statement
+
+
+def full_scans(conn, statement):
+    """Tables the plan for ``statement`` scans end to end"""
+    parameters = (None,) * statement.count('?')
+    plan = conn.execute(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    return [match.group(1) for match in (FULL_SCAN.match(row[-1]) for row in plan) if match]
+
+
+def check_module(path, migrations, workdir):
+    """Return a list of failure messages for ``path``"""
+    name = os.path.basename(path)
+    conn = sqlite3.connect(os.path.join(workdir, name + '.db'))
+    migrate(conn, migrations)
+    for schema, attached_migrations in ATTACHED.get(name, {}).items():
+        attached_path = os.path.join(workdir, f'{name}.{schema}.db')
+        migrate(sqlite3.connect(attached_path), attached_migrations)
+        conn.execute('ATTACH DATABASE ? AS ' + schema, (attached_path,))
+
+    failures = []
+    checked = 0
+    for lineno, statement in collect_statements(path, SQL_PARAMETERS.get(name)):
+        if statement is None:
+            failures.append(f"{name}:{lineno}: unchecked: SQL is not a literal; add its values to SQL_PARAMETERS")
+            continue
+        checked += 1
+        try:
+            scans = full_scans(conn, statement)
+        except sqlite3.Error as e:
+            failures.append(f"{name}:{lineno}: cannot plan statement ({e}): {statement}")
+            continue
+        if scans and not any(fragment in statement for fragment in FULL_SCAN_ALLOWED):
+            failures.append(f"{name}:{lineno}: full scan of {', '.join(scans)}: {statement}")
+
+    conn.close()
+    print(f"{name}: {checked} statements checked")
+    return failures
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    failures = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for module, migrations in CHECKED_MODULES.items():
+            failures.extend(check_module(os.path.join(here, module), migrations, workdir))
+
+    for failure in failures:
+        print(f"[FAIL] {failure}")
+    if failures:
+        return 1
+    print("[SUCCESS] No full table scans")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
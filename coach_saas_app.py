@@ -1,106 +1,82 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, send_file
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, make_response, stream_with_context
 from werkzeug.utils import secure_filename
+import base64
 import json
+import math
 import os
+import re
 import uuid
-from datetime import datetime
 import sqlite3
 from functools import wraps
 
+from database import get_db, init_app as init_database
+from migrations import migrate
+from email_outbox import queue_email
+from group_commit import commit_write
+from lead_keys import lead_keys
+from rate_limit import failures as login_failures, rate_limited, stats as rate_limit_stats
+from passwords import HashingBusy, hash_password, verify_password
+from payment_state import complete_registration
+from page_cache import institute_pages, tenant_versions
+from sitemap import index_body, lastmod, shard_count, shard_metadata, sitemaps, stream_shard
+from file_serving import file_validators, serve_file
+from upload_store import blob_relpath, blob_url, release, resolve, store, variant_dir
+from image_variants import attach_variants, queue_image, ready_variants
+from analytics import ANALYTICS_DEFAULT_DAYS, ANALYTICS_MAX_DAYS, BUCKETS, funnel
+from exports import DATASETS, FORMATS, PAYMENT_STATUSES, parse_range, stream_export
+from lead_search import search_leads
+from http_cache import (BUILD_TIME, apply_validators, make_etag, not_modified, not_modified_response,
+                        page_last_modified, parse_timestamp)
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
+REGISTRATIONS_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 200
+INSTITUTES_PAGE_SIZE = 50
+MAX_UPLOAD_MB = int(os.environ.get('MAX_UPLOAD_MB', 25))
+ROBOTS_MAX_AGE = 24 * 3600
+
+# IT dashboard sort key -> ORDER BY columns, each backed by an index
+INSTITUTE_SORTS = {
+    'created': ('i.created_at', 'i.id'),
+    'name': ('i.institute_name COLLATE NOCASE', 'i.id'),
+    'username': ('i.username',),
+    'registrations': ('s.registrations', 's.institute_id'),
+    'payments': ('s.payments', 's.institute_id'),
+    'revenue': ('s.revenue', 's.institute_id'),
+    'downloads': ('s.downloads', 's.institute_id'),
+}
+
+# Testimonial uploads get a random token in their name and are never rewritten
+IMMUTABLE_UPLOAD = re.compile(r'_testimonial_[0-9a-f]{8}_')
+BLOB_NAME = re.compile(r'[0-9a-f]{64}\.[a-z0-9]+')
+VARIANT_NAME = re.compile(r'v[0-9]+-[0-9]+\.(webp|jpg)')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Oversized uploads are refused with 413 before Werkzeug spools them
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+
+init_database(app)
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 def init_db():
-    """Initialize SQLite database"""
-    conn = sqlite3.connect('coach_saas.db')
-    cursor = conn.cursor()
-    
-    # Institutes table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS institutes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            institute_name TEXT NOT NULL,
-            offer_text TEXT,
-            upi_id TEXT,
-            email TEXT,
-            amount DECIMAL(10,2) DEFAULT 1000,
-            is_active BOOLEAN DEFAULT TRUE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Institute configurations
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS configurations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            institute_id INTEGER,
-            why_choose_us TEXT,
-            pdf_title TEXT,
-            pdf_filename TEXT,
-            testimonials TEXT,
-            FOREIGN KEY (institute_id) REFERENCES institutes (id)
-        )
-    ''')
-    
-    # Aspirant registrations
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS registrations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            institute_id INTEGER,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            payment_status TEXT DEFAULT 'pending',
-            payment_id TEXT,
-            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (institute_id) REFERENCES institutes (id)
-        )
-    ''')
-    
-    # PDF downloads tracking
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS pdf_downloads (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            institute_id INTEGER,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            downloaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (institute_id) REFERENCES institutes (id)
-        )
-    ''')
-    
-    # IT admins table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS it_admins (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create default IT admin if not exists
-    cursor.execute('SELECT COUNT(*) FROM it_admins')
-    if cursor.fetchone()[0] == 0:
-        cursor.execute('''
-            INSERT INTO it_admins (username, password_hash)
-            VALUES (?, ?)
-        ''', ('itadmin', generate_password_hash('itadmin123')))
-    
-    conn.commit()
-    conn.close()
+    """Bring the database schema up to date (a single PRAGMA read when already current)"""
+    applied = migrate(get_db())
+    if applied:
+        print(f"[DB] Applied migrations: {', '.join(applied)}")
+
+# Schema setup happens once per process, never on the request path
+init_db()
+
+@app.before_request
+def sync_tenant_caches():
+    """Pick up institute changes committed by other workers before serving"""
+    tenant_versions.check(get_db())
 
 def login_required(f):
     @wraps(f)
@@ -113,88 +89,102 @@ def login_required(f):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def send_email(to_email, subject, body, institute_email=None):
-    """Send email notification"""
+def locate_upload(filename):
+    """(path, path under the upload folder, ETag, stat) for a tenant file, or None"""
+    filename = secure_filename(filename)
+    blob = resolve(get_db().cursor(), filename)
+    # Files uploaded before the blob store still live directly in the folder
+    relpath = blob_relpath(*blob) if blob else filename
+    file_path = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], relpath))
     try:
-        # Check if email credentials are configured
-        sender_email = os.environ.get('SENDER_EMAIL')
-        sender_password = os.environ.get('SENDER_PASSWORD')
-        
-        if not sender_email or not sender_password:
-            # Fallback to console output for demo
-            print(f"\n=== EMAIL NOTIFICATION ===")
-            print(f"To: {to_email}")
-            print(f"Subject: {subject}")
-            print(f"Body: {body}")
-            print(f"========================\n")
-            return True
-        
-        # Real email sending (when credentials are configured)
-        import smtplib
-        from email.mime.text import MimeText
-        from email.mime.multipart import MimeMultipart
-        
-        msg = MimeMultipart()
-        msg['From'] = sender_email
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MimeText(body, 'html'))
-        
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.send_message(msg)
-        server.quit()
-        
-        print(f"[EMAIL SENT] To: {to_email}, Subject: {subject}")
-        return True
-        
-    except Exception as e:
-        print(f"[EMAIL ERROR] {e}")
-        # Still print to console as fallback
-        print(f"\n=== EMAIL FALLBACK ===")
-        print(f"To: {to_email}")
-        print(f"Subject: {subject}")
-        print(f"Body: {body}")
-        print(f"====================\n")
-        return False
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    etag = blob[0] if blob else file_validators('upload', filename, stat)[0]
+    return file_path, relpath, etag, stat
+
+def check_login(key, password_hash, password):
+    """Verify a login off the request thread with per-username back-off; returns (matches, new hash, error message)"""
+    # A username under back-off is refused without spending a hash on it
+    locked = login_failures.locked_for(key)
+    if locked:
+        return False, None, f'Too many failed attempts. Try again in {math.ceil(locked)} seconds.'
+    try:
+        matches, new_hash = verify_password(password_hash, password) if password_hash else (False, None)
+    except HashingBusy:
+        return False, None, 'Too many sign-ins right now. Please try again in a moment.'
+    if matches:
+        login_failures.succeed(key)
+    else:
+        login_failures.fail(key)
+    return matches, new_hash, None if matches else 'Invalid credentials'
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return f"File too large (limit {MAX_UPLOAD_MB} MB)", 413
 
 @app.route('/')
 def index():
-    # Ensure database exists
-    init_db()
     return render_template('landing.html')
 
 @app.route('/sitemap.xml')
 def sitemap():
-    """Generate dynamic sitemap for SEO"""
+    """Sitemap index pointing at the per-shard sitemaps"""
     from flask import Response
     
-    conn = sqlite3.connect('coach_saas.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT username FROM institutes WHERE is_active = TRUE')
-    institutes = cursor.fetchall()
-    conn.close()
-    
-    sitemap_xml = '''<?xml version="1.0" encoding="UTF-8"?>
-<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
-    <url>
-        <loc>{}</loc>
-        <changefreq>daily</changefreq>
-        <priority>1.0</priority>
-    </url>'''.format(request.url_root)
-    
-    for institute in institutes:
-        sitemap_xml += '''
-    <url>
-        <loc>{}</loc>
-        <changefreq>weekly</changefreq>
-        <priority>0.8</priority>
-    </url>'''.format(request.url_root + 'institute/' + institute[0])
-    
-    sitemap_xml += '\n</urlset>'
-    
-    return Response(sitemap_xml, mimetype='application/xml')
+    url_root = request.url_root
+    index = sitemaps.get_index(url_root)
+    if index is None:
+        generation = sitemaps.generation()
+        cursor = get_db().cursor()
+        
+        shard_urls = []
+        versions = []
+        timestamps = []
+        for shard in range(1, shard_count(cursor) + 1):
+            metadata = shard_metadata(cursor, shard)
+            updated_at = parse_timestamp(metadata['updated_at'])
+            shard_urls.append((f"{url_root}sitemap-{shard}.xml", lastmod(updated_at) if updated_at else None))
+            versions.append(metadata['version'])
+            timestamps.append(updated_at)
+        
+        index = {
+            'body': index_body(shard_urls),
+            'etag': make_etag('sitemap-index', url_root, tuple(versions)),
+            'last_modified': page_last_modified(*timestamps)
+        }
+        sitemaps.put_index(url_root, index, generation)
+    
+    if not_modified(index['etag'], index['last_modified']):
+        return not_modified_response(index['etag'], index['last_modified'])
+    
+    response = Response(index['body'], mimetype='application/xml')
+    return apply_validators(response, index['etag'], index['last_modified'])
+
+@app.route('/sitemap-<int:shard>.xml')
+def sitemap_shard(shard):
+    """One shard of institute URLs, streamed on a cold cache"""
+    from flask import Response
+    
+    url_root = request.url_root
+    generation = sitemaps.generation()
+    metadata = sitemaps.get_shard(shard)
+    if metadata is None:
+        cursor = get_db().cursor()
+        if shard < 1 or shard > shard_count(cursor):
+            return "Sitemap not found", 404
+        metadata = shard_metadata(cursor, shard)
+    
+    etag = make_etag('sitemap', shard, metadata['version'], url_root)
+    last_modified = page_last_modified(parse_timestamp(metadata['updated_at']))
+    if not_modified(etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    
+    body = metadata['bodies'].get(url_root)
+    if body is None:
+        body = stream_with_context(stream_shard(get_db().cursor(), shard, url_root, generation))
+    
+    return apply_validators(Response(body, mimetype='application/xml'), etag, last_modified)
 
 @app.route('/robots.txt')
 def robots():
@@ -210,31 +200,28 @@ Disallow: /payment/
 
 Sitemap: {}sitemap.xml'''.format(request.url_root)
     
-    return Response(robots_txt, mimetype='text/plain')
-
-@app.route('/institute/<username>')
-@app.route('/coaching/<username>')  # SEO-friendly alternative URL
-def institute_page(username):
-    """Main institute landing page for aspirants"""
-    # Ensure database exists
-    init_db()
-    
-    conn = sqlite3.connect('coach_saas.db')
-    cursor = conn.cursor()
+    etag = make_etag('robots', robots_txt)
+    if not_modified(etag, BUILD_TIME):
+        return not_modified_response(etag, BUILD_TIME, max_age=ROBOTS_MAX_AGE)
     
+    return apply_validators(Response(robots_txt, mimetype='text/plain'), etag, BUILD_TIME, max_age=ROBOTS_MAX_AGE)
+
+def load_public_institute(cursor, username):
+    """Public view of an active institute as the landing page needs it, or None"""
     cursor.execute('''
         SELECT i.id, i.username, i.password_hash, i.institute_name, i.offer_text, i.upi_id, i.email, i.amount, i.is_active, i.created_at,
-               c.why_choose_us, c.pdf_title, c.pdf_filename, c.testimonials
+               c.why_choose_us, c.pdf_title, c.pdf_filename, c.testimonials,
+               v.version, v.updated_at
         FROM institutes i
         LEFT JOIN configurations c ON i.id = c.institute_id
+        LEFT JOIN tenant_versions v ON v.institute_id = i.id
         WHERE i.username = ? AND i.is_active = TRUE
     ''', (username,))
     
     institute_data = cursor.fetchone()
-    conn.close()
     
     if not institute_data:
-        return "Institute not found", 404
+        return None
     
     # Safe JSON parsing for testimonials
     try:
@@ -242,7 +229,7 @@ def institute_page(username):
     except (json.JSONDecodeError, TypeError):
         testimonials = []
     
-    institute = {
+    return {
         'id': institute_data[0],
         'username': institute_data[1],
         'institute_name': institute_data[3],
@@ -251,39 +238,76 @@ def institute_page(username):
         'why_choose_us': institute_data[10] or "Quality education, Expert faculty, Proven results",
         'pdf_title': institute_data[11] or "Download Sample Papers",
         'pdf_filename': institute_data[12],
-        'testimonials': testimonials
+        'testimonials': testimonials,
+        'version': institute_data[14] or 0,
+        'updated_at': parse_timestamp(institute_data[15] or institute_data[9])
     }
-    
-    return render_template('institute.html', institute=institute)
 
-@app.route('/register/<username>', methods=['POST'])
-def register_aspirant(username):
-    """Handle aspirant registration"""
-    conn = sqlite3.connect('coach_saas.db')
-    cursor = conn.cursor()
-    
-    # Get institute details
-    cursor.execute('SELECT id, institute_name, email FROM institutes WHERE username = ?', (username,))
-    institute = cursor.fetchone()
-    
-    if not institute:
-        return jsonify({'error': 'Institute not found'}), 404
-    
-    # Save registration
-    name = request.form['name']
-    email = request.form['email']
-    phone = request.form['phone']
-    
+@tenant_versions.on_change
+def tenant_changed(institute_id, username):
+    """Drop every cached view of one institute: its pages and its sitemap shard"""
+    institute_pages.invalidate(username)
+    sitemaps.invalidate(institute_id)
+
+def invalidate_institute(cursor, institute_id):
+    """tenant_changed() for an institute known only by id"""
+    cursor.execute('SELECT username FROM institutes WHERE id = ?', (institute_id,))
+    row = cursor.fetchone()
+    if row:
+        tenant_changed(institute_id, row[0])
+
+@app.route('/institute/<username>')
+@app.route('/coaching/<username>')  # SEO-friendly alternative URL
+def institute_page(username):
+    """Main institute landing page for aspirants"""
+    page_url = request.base_url
+    generation = institute_pages.generation()
+    institute = institute_pages.get_institute(username)
+    if institute is None:
+        institute = load_public_institute(get_db().cursor(), username)
+        if institute is None:
+            return "Institute not found", 404
+        institute_pages.put(username, institute, generation=generation)
+    
+    # Revalidation is answered from the tenant version, without rendering
+    etag = make_etag('institute', institute['id'], institute['version'], page_url)
+    last_modified = page_last_modified(institute['updated_at'])
+    if not_modified(etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    
+    # Warm pages are served straight from the in-process cache
+    html = institute_pages.get_page(username, page_url)
+    if html is None:
+        html = render_template('institute.html', institute=institute)
+        institute_pages.put(username, institute, page_url, html, generation)
+    
+    return apply_validators(make_response(html), etag, last_modified)
+
+def find_registration(cursor, institute_id, keys):
+    """Id of the registration with these normalized (email, phone) keys, or None"""
+    cursor.execute('''
+        SELECT id FROM registrations
+        WHERE institute_id = ? AND email_key = ? AND phone_key = ?
+    ''', (institute_id,) + keys)
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def save_registration(cursor, institute, name, email, phone):
+    """Insert a registration and queue its emails; returns the new or already existing registration id"""
+    keys = lead_keys(email, phone)
     cursor.execute('''
-        INSERT INTO registrations (institute_id, name, email, phone)
-        VALUES (?, ?, ?, ?)
-    ''', (institute[0], name, email, phone))
+        INSERT INTO registrations (institute_id, name, email, phone, email_key, phone_key)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (institute_id, email_key, phone_key) DO NOTHING
+    ''', (institute[0], name, email, phone) + keys)
+    
+    if not cursor.rowcount:
+        # A concurrent submission by the same aspirant got there first
+        return find_registration(cursor, institute[0], keys)
     
     registration_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
     
-    # Send notification emails
+    # Notification emails are queued in the same transaction and sent by the worker
     aspirant_subject = f"Registration Confirmation - {institute[1]}"
     aspirant_body = f"""
     <h2>Thank you for registering with {institute[1]}!</h2>
@@ -302,16 +326,63 @@ def register_aspirant(username):
     <p>Payment Status: Pending</p>
     """
     
-    # Send emails immediately
-    send_email(email, aspirant_subject, aspirant_body)
+    queue_email(cursor, email, aspirant_subject, aspirant_body, institute[0], 'aspirant_registration')
     if institute[2]:
-        send_email(institute[2], owner_subject, owner_body)
+        queue_email(cursor, institute[2], owner_subject, owner_body, institute[0], 'owner_registration')
+    return registration_id
+
+def save_download(cursor, institute, name, email, phone, filename):
+    """Insert a PDF-download lead and queue the owner's notification, unless the lead is already known"""
+    cursor.execute('''
+        INSERT INTO pdf_downloads (institute_id, name, email, phone, email_key, phone_key)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (institute_id, email_key, phone_key) DO NOTHING
+    ''', (institute[0], name, email, phone) + lead_keys(email, phone))
+    if not cursor.rowcount:
+        return
+    
+    # Notify the owner once the download record commits
+    admin_subject = f"PDF Download - {name}"
+    admin_body = f"""
+    <h2>New PDF Download</h2>
+    <p>Name: {name}</p>
+    <p>Email: {email}</p>
+    <p>Phone: {phone}</p>
+    <p>Institute: {institute[1]}</p>
+    <p>File: {filename}</p>
+    """
+    if institute[2]:
+        queue_email(cursor, institute[2], admin_subject, admin_body, institute[0], 'owner_download')
+
+@app.route('/register/<username>', methods=['POST'])
+@rate_limited('register')
+def register_aspirant(username):
+    """Handle aspirant registration"""
+    conn = get_db()
+    cursor = conn.cursor()
     
-    print(f"[EMAIL] Registration emails sent for {name}")
+    # Get institute details
+    cursor.execute('SELECT id, institute_name, email FROM institutes WHERE username = ?', (username,))
+    institute = cursor.fetchone()
+    
+    if not institute:
+        return jsonify({'error': 'Institute not found'}), 404
+    
+    # Save registration (batched with concurrent ones when GROUP_COMMIT is on)
+    name = request.form['name']
+    email = request.form['email']
+    phone = request.form['phone']
+    
+    # A double submit or returning aspirant gets the registration they already have
+    registration_id = find_registration(cursor, institute[0], lead_keys(email, phone))
+    existing = registration_id is not None
+    if not existing:
+        registration_id = commit_write(save_registration, institute, name, email, phone)
     
     return jsonify({
         'success': True,
         'registration_id': registration_id,
+        'existing': existing,
         'payment_url': f'/payment/{registration_id}',
         'redirect': True
     })
@@ -319,132 +390,93 @@ def register_aspirant(username):
 @app.route('/payment/<int:registration_id>')
 def payment_page(registration_id):
     """Payment page for aspirants"""
-    conn = sqlite3.connect('coach_saas.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     cursor.execute('''
-        SELECT r.*, i.institute_name, i.upi_id, i.amount
+        SELECT r.id, r.name, r.email, i.institute_name, i.upi_id, i.amount
         FROM registrations r
         JOIN institutes i ON r.institute_id = i.id
         WHERE r.id = ?
     ''', (registration_id,))
     
     registration = cursor.fetchone()
-    conn.close()
     
     if not registration:
         return "Registration not found", 404
     
     payment_data = {
         'registration_id': registration_id,
-        'name': registration[2],
-        'email': registration[3],
-        'institute_name': registration[7],
-        'upi_id': registration[8] or 'payment@institute.com',
-        'amount': registration[9] or 1000
+        'name': registration[1],
+        'email': registration[2],
+        'institute_name': registration[3],
+        'upi_id': registration[4] or 'payment@institute.com',
+        'amount': registration[5] or 1000
     }
     
     return render_template('payment.html', payment=payment_data)
 
 @app.route('/payment/confirm', methods=['POST'])
+@rate_limited('confirm')
 def confirm_payment():
     """Handle payment confirmation"""
     registration_id = request.form['registration_id']
     payment_id = request.form.get('payment_id', str(uuid.uuid4()))
     
-    conn = sqlite3.connect('coach_saas.db')
+    conn = get_db()
     cursor = conn.cursor()
     
-    # Update payment status
-    cursor.execute('''
-        UPDATE registrations 
-        SET payment_status = 'completed', payment_id = ?
-        WHERE id = ?
-    ''', (payment_id, registration_id))
+    # Only the first confirmation flips the status and queues the emails
+    if not complete_registration(cursor, registration_id, payment_id):
+        conn.rollback()
+        # A repeat (double submit, browser retry) is answered from the stored result
+        cursor.execute('SELECT payment_id FROM registrations WHERE id = ?', (registration_id,))
+        registration = cursor.fetchone()
+        if registration is None:
+            return "Registration not found", 404
+        return render_template('payment_success.html', payment_id=registration[0])
     
-    # Get registration and institute details
-    cursor.execute('''
-        SELECT r.*, i.institute_name, i.email
-        FROM registrations r
-        JOIN institutes i ON r.institute_id = i.id
-        WHERE r.id = ?
-    ''', (registration_id,))
-    
-    registration = cursor.fetchone()
     conn.commit()
-    conn.close()
-    
-    if registration:
-        # Send congratulations emails
-        aspirant_subject = f"Payment Confirmed - Welcome to {registration[8]}!"
-        aspirant_body = f"""
-        <h2>Congratulations {registration[2]}!</h2>
-        <p>Your payment has been confirmed and you are now enrolled with {registration[8]}.</p>
-        <p>Payment ID: {payment_id}</p>
-        <p>We will contact you soon with further details.</p>
-        """
-        
-        owner_subject = f"Payment Received - {registration[2]}"
-        owner_body = f"""
-        <h2>Payment Confirmation</h2>
-        <p>Student: {registration[2]}</p>
-        <p>Email: {registration[3]}</p>
-        <p>Phone: {registration[4]}</p>
-        <p>Payment ID: {payment_id}</p>
-        <p>Status: Completed</p>
-        """
-        
-        send_email(registration[3], aspirant_subject, aspirant_body)
-        if registration[9]:
-            send_email(registration[9], owner_subject, owner_body)
     
     return render_template('payment_success.html', payment_id=payment_id)
 
 @app.route('/download/<username>/<filename>', methods=['GET', 'POST'])
+@rate_limited('download')
 def download_file(username, filename):
     """Download PDF files with user details collection"""
+    # A Range GET is the browser resuming a download the form already started
+    if request.method == 'GET' and not request.range:
+        # Show form for user details
+        return render_template('download_form.html', username=username, filename=filename)
+    
     if request.method == 'POST':
         name = request.form['name']
         email = request.form['email']
         phone = request.form['phone']
         
         # Get institute ID
-        conn = sqlite3.connect('coach_saas.db')
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('SELECT id, institute_name, email FROM institutes WHERE username = ?', (username,))
         institute = cursor.fetchone()
         
         if institute:
-            # Save download record
+            # Save download record; a lead that already downloaded is not recorded again
             cursor.execute('''
-                INSERT INTO pdf_downloads (institute_id, name, email, phone)
-                VALUES (?, ?, ?, ?)
-            ''', (institute[0], name, email, phone))
-            conn.commit()
-            
-            # Send notification to admin
-            admin_subject = f"PDF Download - {name}"
-            admin_body = f"""
-            <h2>New PDF Download</h2>
-            <p>Name: {name}</p>
-            <p>Email: {email}</p>
-            <p>Phone: {phone}</p>
-            <p>Institute: {institute[1]}</p>
-            <p>File: {filename}</p>
-            """
-            if institute[2]:
-                send_email(institute[2], admin_subject, admin_body)
-        
-        conn.close()
-        
-        # Serve the file
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True)
+                SELECT 1 FROM pdf_downloads
+                WHERE institute_id = ? AND email_key = ? AND phone_key = ?
+            ''', (institute[0],) + lead_keys(email, phone))
+            if cursor.fetchone() is None:
+                commit_write(save_download, institute, name, email, phone, filename)
+    
+    # Serve the file
+    upload = locate_upload(filename)
+    if upload is None:
         return "File not found", 404
-    
-    # Show form for user details
-    return render_template('download_form.html', username=username, filename=filename)
+    file_path, relpath, etag, stat = upload
+    last_modified = file_validators('upload', filename, stat)[1]
+    return serve_file(file_path, etag, last_modified, as_attachment=True,
+                      download_name=secure_filename(filename), internal_path=relpath)
 
 # Admin Routes
 @app.route('/admin/login')
@@ -456,21 +488,25 @@ def admin_authenticate():
     username = request.form['username']
     password = request.form['password']
     
-    conn = sqlite3.connect('coach_saas.db')
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute('SELECT id, password_hash, is_active FROM institutes WHERE username = ?', (username,))
     institute = cursor.fetchone()
-    conn.close()
     
-    if institute and check_password_hash(institute[1], password):
+    matches, new_hash, error = check_login(f'institute:{username}', institute and institute[1], password)
+    if matches:
         if not institute[2]:  # Check if institute is disabled
             flash('Institute account is disabled. Contact IT admin.')
             return redirect(url_for('admin_login'))
+        # Hashes made with an older PASSWORD_HASH_METHOD are upgraded on login
+        if new_hash:
+            cursor.execute('UPDATE institutes SET password_hash = ? WHERE id = ?', (new_hash, institute[0]))
+            conn.commit()
         session['institute_id'] = institute[0]
         session['username'] = username
         return redirect(url_for('admin_dashboard'))
     
-    flash('Invalid credentials')
+    flash(error)
     return redirect(url_for('admin_login'))
 
 @app.route('/it/create_institute', methods=['POST'])
@@ -483,14 +519,19 @@ def it_create_institute():
     institute_name = request.form['institute_name']
     email = request.form['email']
     
-    conn = sqlite3.connect('coach_saas.db')
+    try:
+        password_hash = hash_password(password)
+    except HashingBusy:
+        return jsonify({'success': False, 'error': 'Server busy, please try again'}), 503
+    
+    conn = get_db()
     cursor = conn.cursor()
     
     try:
         cursor.execute('''
             INSERT INTO institutes (username, password_hash, institute_name, email)
             VALUES (?, ?, ?, ?)
-        ''', (username, generate_password_hash(password), institute_name, email))
+        ''', (username, password_hash, institute_name, email))
         
         institute_id = cursor.lastrowid
         
@@ -501,22 +542,79 @@ def it_create_institute():
         ''', (institute_id, "Quality education\nExpert faculty\nProven results", "Download Sample Papers", "[]"))
         
         conn.commit()
+        tenant_changed(institute_id, username)
         return jsonify({'success': True, 'message': 'Institute created successfully!'})
     except sqlite3.IntegrityError:
+        conn.rollback()
         return jsonify({'success': False, 'error': 'Username already exists'})
-    finally:
-        conn.close()
+
+def encode_page_cursor(registered_at, registration_id):
+    """Opaque keyset cursor for the registration after which the next page starts"""
+    return base64.urlsafe_b64encode(f"{registered_at}|{registration_id}".encode()).decode()
+
+def decode_page_cursor(cursor_value):
+    """Inverse of encode_page_cursor; returns None for a missing or malformed cursor"""
+    try:
+        registered_at, registration_id = base64.urlsafe_b64decode(cursor_value.encode()).decode().rsplit('|', 1)
+        return registered_at, int(registration_id)
+    except (AttributeError, ValueError, UnicodeDecodeError):
+        return None
+
+def requested_page_size():
+    """Page size from the ``page_size`` query parameter, clamped to MAX_PAGE_SIZE"""
+    page_size = request.args.get('page_size', REGISTRATIONS_PAGE_SIZE, type=int)
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+def fetch_registrations_page(cursor, institute_id, page_size, after=None):
+    """Newest-first page of registrations keyed on (registered_at, id); returns (rows, next_cursor)"""
+    if after:
+        cursor.execute('''
+            SELECT id, institute_id, name, email, phone, payment_status, payment_id, registered_at
+            FROM registrations
+            WHERE institute_id = ? AND (registered_at, id) < (?, ?)
+            ORDER BY registered_at DESC, id DESC
+            LIMIT ?
+        ''', (institute_id, after[0], after[1], page_size + 1))
+    else:
+        cursor.execute('''
+            SELECT id, institute_id, name, email, phone, payment_status, payment_id, registered_at
+            FROM registrations
+            WHERE institute_id = ?
+            ORDER BY registered_at DESC, id DESC
+            LIMIT ?
+        ''', (institute_id, page_size + 1))
+    
+    rows = cursor.fetchall()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_page_cursor(rows[-1][7], rows[-1][0])
+    return rows, next_cursor
+
+def registration_stats(cursor, institute_id):
+    """Total, completed and pending registration counts from one grouped query"""
+    cursor.execute('''
+        SELECT payment_status, COUNT(*) FROM registrations
+        WHERE institute_id = ?
+        GROUP BY payment_status
+    ''', (institute_id,))
+    
+    counts = dict(cursor.fetchall())
+    total = sum(counts.values())
+    completed = counts.get('completed', 0)
+    return {'total': total, 'completed': completed, 'pending': total - completed}
 
 @app.route('/admin/dashboard')
 @login_required
 def admin_dashboard():
-    conn = sqlite3.connect('coach_saas.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     # Get institute data
     cursor.execute('''
         SELECT i.id, i.username, i.password_hash, i.institute_name, i.offer_text, i.upi_id, i.email, i.amount, i.is_active, i.created_at,
-               c.why_choose_us, c.pdf_title, c.pdf_filename, c.testimonials
+               c.why_choose_us, c.pdf_title, c.pdf_filename, c.testimonials,
+               i.notification_digest_minutes
         FROM institutes i
         LEFT JOIN configurations c ON i.id = c.institute_id
         WHERE i.id = ?
@@ -524,15 +622,9 @@ def admin_dashboard():
     
     institute_data = cursor.fetchone()
     
-    # Get registrations
-    cursor.execute('''
-        SELECT * FROM registrations 
-        WHERE institute_id = ? 
-        ORDER BY registered_at DESC
-    ''', (session['institute_id'],))
-    
-    registrations = cursor.fetchall()
-    conn.close()
+    # Summary counts and the first page only; later pages load from /admin/registrations
+    stats = registration_stats(cursor, session['institute_id'])
+    registrations, next_cursor = fetch_registrations_page(cursor, session['institute_id'], requested_page_size())
     
     # Safe JSON parsing for testimonials
     try:
@@ -549,21 +641,97 @@ def admin_dashboard():
         'why_choose_us': institute_data[10] or '',
         'pdf_title': institute_data[11] or '',
         'pdf_filename': institute_data[12] or '',
-        'testimonials': testimonials
+        'testimonials': testimonials,
+        'notification_digest_minutes': institute_data[14] or 0
     }
     
-    return render_template('admin_dashboard.html', institute=institute, registrations=registrations)
+    return render_template('admin_dashboard.html', institute=institute, registrations=registrations,
+                           stats=stats, next_cursor=next_cursor, page_size=requested_page_size())
+
+@app.route('/admin/registrations')
+@login_required
+def admin_registrations():
+    """JSON page of registrations after ``cursor`` for the dashboard's "Load more" """
+    after = None
+    if request.args.get('cursor'):
+        after = decode_page_cursor(request.args['cursor'])
+        if after is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    rows, next_cursor = fetch_registrations_page(get_db().cursor(), session['institute_id'], requested_page_size(), after)
+    
+    return jsonify({
+        'registrations': [{
+            'id': row[0],
+            'name': row[2],
+            'email': row[3],
+            'phone': row[4],
+            'payment_status': row[5],
+            'payment_id': row[6],
+            'registered_at': row[7]
+        } for row in rows],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/admin/analytics')
+@login_required
+def admin_analytics():
+    """JSON funnel (registrations, payments, downloads) for the last ``days`` days by ``bucket``"""
+    days = request.args.get('days', ANALYTICS_DEFAULT_DAYS, type=int)
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        return jsonify({'error': f"bucket must be one of {', '.join(BUCKETS)}"}), 400
+    
+    days = max(1, min(days, ANALYTICS_MAX_DAYS))
+    return jsonify(funnel(get_db().cursor(), session['institute_id'], days, bucket))
+
+@app.route('/admin/export/<dataset>.<fmt>')
+@login_required
+def admin_export(dataset, fmt):
+    """Stream registrations or PDF-download leads as CSV/XLSX, filtered by ``from``/``to`` dates and ``status``"""
+    from flask import Response
+    
+    if dataset not in DATASETS or fmt not in FORMATS:
+        return jsonify({'error': 'Unknown export'}), 404
+    
+    status = request.args.get('status') or None
+    if status is not None and (dataset != 'registrations' or status not in PAYMENT_STATUSES):
+        return jsonify({'error': 'Invalid status filter'}), 400
+    try:
+        lower, upper = parse_range(request.args.get('from'), request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    
+    body = stream_export(get_db().cursor(), dataset, fmt, session['institute_id'], lower, upper, status)
+    response = Response(stream_with_context(body), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{session["username"]}-{dataset}.{fmt}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/admin/search')
+@login_required
+def admin_search():
+    """JSON page of registrations and PDF-download leads whose name, email or phone start with ``q``"""
+    before = request.args.get('cursor', type=int)
+    page = search_leads(get_db().cursor(), session['institute_id'], request.args.get('q', ''),
+                        requested_page_size(), before)
+    if page is None:
+        return jsonify({'error': 'Enter a name, email or phone to search for'}), 400
+    
+    results, next_cursor = page
+    return jsonify({'results': results, 'next_cursor': next_cursor})
 
 @app.route('/admin/update', methods=['POST'])
 @login_required
 def admin_update():
-    conn = sqlite3.connect('coach_saas.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     # Update institute details
     cursor.execute('''
         UPDATE institutes 
-        SET institute_name = ?, offer_text = ?, upi_id = ?, email = ?, amount = ?
+        SET institute_name = ?, offer_text = ?, upi_id = ?, email = ?, amount = ?,
+            notification_digest_minutes = ?
         WHERE id = ?
     ''', (
         request.form['institute_name'],
@@ -571,6 +739,7 @@ def admin_update():
         request.form['upi_id'],
         request.form['email'],
         float(request.form['amount']),
+        request.form.get('notification_digest_minutes', 0, type=int),
         session['institute_id']
     ))
     
@@ -586,7 +755,7 @@ def admin_update():
     ))
     
     conn.commit()
-    conn.close()
+    tenant_changed(session['institute_id'], session['username'])
     
     flash('Settings updated successfully!')
     return redirect(url_for('admin_dashboard'))
@@ -605,18 +774,19 @@ def upload_pdf():
     
     if file and allowed_file(file.filename):
         filename = secure_filename(f"{session['username']}_{file.filename}")
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        conn = get_db()
+        store(conn, app.config['UPLOAD_FOLDER'], file.stream, filename, session['institute_id'], 'pdf')
         
-        # Update database
-        conn = sqlite3.connect('coach_saas.db')
+        # Update database; the replaced PDF's blob is freed once nothing else uses it
         cursor = conn.cursor()
         cursor.execute('''
             UPDATE configurations 
             SET pdf_filename = ?
             WHERE institute_id = ?
         ''', (filename, session['institute_id']))
+        release(cursor, session['institute_id'], 'pdf', lambda name, url: name == filename)
         conn.commit()
-        conn.close()
+        tenant_changed(session['institute_id'], session['username'])
         
         flash('PDF uploaded successfully!')
     else:
@@ -636,17 +806,66 @@ def upload_image():
     
     if file and file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
         filename = secure_filename(f"{session['username']}_testimonial_{uuid.uuid4().hex[:8]}_{file.filename}")
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        conn = get_db()
+        sha256, extension = store(conn, app.config['UPLOAD_FOLDER'], file.stream, filename,
+                                  session['institute_id'], 'testimonial')
+        queue_image(conn.cursor(), sha256, extension)
+        conn.commit()
         
-        # Return the file URL
-        image_url = f"/uploads/{filename}"
-        return jsonify({'success': True, 'image_url': image_url})
+        # Return the content-addressed URL, cacheable forever
+        return jsonify({'success': True, 'image_url': blob_url(sha256, extension)})
     else:
         return jsonify({'success': False, 'error': 'Invalid file type'})
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_file(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+    upload = locate_upload(filename)
+    if upload is None:
+        return "File not found", 404
+    
+    # Validators come from the lookup and stat alone, so a 304 never opens the file
+    file_path, relpath, etag, stat = upload
+    last_modified = file_validators('upload', filename, stat)[1]
+    immutable = bool(IMMUTABLE_UPLOAD.search(filename))
+    if not_modified(etag, last_modified):
+        return not_modified_response(etag, last_modified, immutable=immutable)
+    
+    return serve_file(file_path, etag, last_modified, immutable=immutable, internal_path=relpath)
+
+@app.route('/blobs/<sha256>.<extension>')
+def blob_file(sha256, extension):
+    """Content-addressed upload; the hash is the ETag and the URL never changes meaning"""
+    if not BLOB_NAME.fullmatch(f'{sha256}.{extension}'):
+        return "File not found", 404
+    if not_modified(sha256):
+        return not_modified_response(sha256, immutable=True)
+    
+    relpath = blob_relpath(sha256, extension)
+    file_path = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], relpath))
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return "File not found", 404
+    last_modified = file_validators('blob', sha256, stat)[1]
+    return serve_file(file_path, sha256, last_modified, immutable=True, internal_path=relpath)
+
+@app.route('/variants/<sha256>/<name>')
+def variant_file(sha256, name):
+    """Resized testimonial photo; the name carries the pipeline version, so it never changes"""
+    if not BLOB_NAME.fullmatch(f'{sha256}.x') or not VARIANT_NAME.fullmatch(name):
+        return "File not found", 404
+    etag = f'{sha256}-{name}'
+    if not_modified(etag):
+        return not_modified_response(etag, immutable=True)
+    
+    relpath = os.path.join(variant_dir(sha256), name)
+    file_path = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], relpath))
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return "File not found", 404
+    last_modified = file_validators('variant', name, stat)[1]
+    return serve_file(file_path, etag, last_modified, immutable=True, internal_path=relpath)
 
 @app.route('/admin/update_testimonials', methods=['POST'])
 @login_required
@@ -654,15 +873,23 @@ def update_testimonials():
     try:
         testimonials = request.json.get('testimonials', []) if request.json else []
         
-        conn = sqlite3.connect('coach_saas.db')
+        conn = get_db()
         cursor = conn.cursor()
+        # Locked first, so the image worker cannot publish variants in between
+        conn.execute('BEGIN IMMEDIATE')
+        attach_variants(testimonials, ready_variants(cursor, testimonials).get)
         cursor.execute('''
             UPDATE configurations 
             SET testimonials = ?
             WHERE institute_id = ?
         ''', (json.dumps(testimonials), session['institute_id']))
+        
+        # Images no testimonial shows any more stop holding their blobs
+        images = {testimonial.get('image') for testimonial in testimonials}
+        release(cursor, session['institute_id'], 'testimonial',
+                lambda name, url: url in images or f"/uploads/{name}" in images)
         conn.commit()
-        conn.close()
+        tenant_changed(session['institute_id'], session['username'])
         
         return jsonify({'success': True})
     except Exception as e:
@@ -671,12 +898,7 @@ def update_testimonials():
 # IT Admin Routes
 @app.route('/it/login')
 def it_login():
-    try:
-        # Ensure database is initialized
-        init_db()
-        return render_template('it_login.html')
-    except Exception as e:
-        return f"Error: {str(e)}", 500
+    return render_template('it_login.html')
 
 @app.route('/it/authenticate', methods=['POST'])
 def it_authenticate():
@@ -684,53 +906,87 @@ def it_authenticate():
         username = request.form['username']
         password = request.form['password']
         
-        # Ensure database is initialized
-        init_db()
-        
-        conn = sqlite3.connect('coach_saas.db')
+        conn = get_db()
         cursor = conn.cursor()
         cursor.execute('SELECT id, password_hash FROM it_admins WHERE username = ?', (username,))
         admin = cursor.fetchone()
-        conn.close()
         
-        if admin and check_password_hash(admin[1], password):
+        matches, new_hash, error = check_login(f'it:{username}', admin and admin[1], password)
+        if matches:
+            if new_hash:
+                cursor.execute('UPDATE it_admins SET password_hash = ? WHERE id = ?', (new_hash, admin[0]))
+                conn.commit()
             session['it_admin_id'] = admin[0]
             session['it_username'] = username
             return redirect(url_for('it_dashboard'))
         
-        flash('Invalid credentials')
+        flash(error)
         return redirect(url_for('it_login'))
     except Exception as e:
         flash(f'Database error: {str(e)}')
         return redirect(url_for('it_login'))
 
+def fetch_institutes_page(cursor, search, sort, order, page, per_page):
+    """One page of institutes with their activity totals; returns (rows, matching institute count)"""
+    where, params = '', ()
+    if search:
+        pattern = '%' + re.sub(r'([\\%_])', r'\\\1', search) + '%'
+        where = "WHERE i.username LIKE ? ESCAPE '\\' OR i.institute_name LIKE ? ESCAPE '\\'"
+        params = (pattern, pattern)
+    
+    order_by = ', '.join(f'{column} {order.upper()}' for column in INSTITUTE_SORTS[sort])
+    cursor.execute(f'''
+        SELECT i.id, i.username, i.institute_name, i.email, i.amount, i.is_active, i.created_at,
+               s.registrations, s.payments, s.revenue, s.downloads
+        FROM institutes i
+        JOIN institute_stats s ON s.institute_id = i.id
+        {where}
+        ORDER BY {order_by}
+        LIMIT ? OFFSET ?
+    ''', params + (per_page, (page - 1) * per_page))
+    rows = cursor.fetchall()
+    
+    cursor.execute(f'SELECT COUNT(*) FROM institutes i {where}', params)
+    return rows, cursor.fetchone()[0]
+
 @app.route('/it/dashboard')
 def it_dashboard():
     if 'it_admin_id' not in session:
         return redirect(url_for('it_login'))
     
-    conn = sqlite3.connect('coach_saas.db')
-    cursor = conn.cursor()
+    search = request.args.get('q', '').strip()
+    sort = request.args.get('sort', 'created')
+    if sort not in INSTITUTE_SORTS:
+        sort = 'created'
+    order = 'asc' if request.args.get('order') == 'asc' else 'desc'
+    per_page = max(1, min(request.args.get('per_page', INSTITUTES_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    page = max(1, request.args.get('page', 1, type=int))
+    
+    institutes, total = fetch_institutes_page(get_db().cursor(), search, sort, order, page, per_page)
+    pages = max(1, -(-total // per_page))
     
-    # Get all institutes
-    cursor.execute('SELECT * FROM institutes ORDER BY created_at DESC')
-    institutes = cursor.fetchall()
+    return render_template('it_dashboard.html', institutes=institutes, total=total, page=page, pages=pages,
+                           query={'q': search, 'sort': sort, 'order': order, 'per_page': per_page})
+
+@app.route('/it/cache_stats')
+def it_cache_stats():
+    if 'it_admin_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
     
-    conn.close()
-    return render_template('it_dashboard.html', institutes=institutes)
+    return jsonify({'institute_pages': institute_pages.stats(), 'rate_limit': rate_limit_stats})
 
 @app.route('/it/toggle_institute/<int:institute_id>', methods=['POST'])
 def toggle_institute(institute_id):
     if 'it_admin_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = sqlite3.connect('coach_saas.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     # Toggle active status
     cursor.execute('UPDATE institutes SET is_active = NOT is_active WHERE id = ?', (institute_id,))
     conn.commit()
-    conn.close()
+    invalidate_institute(cursor, institute_id)
     
     return jsonify({'success': True})
 
@@ -753,7 +1009,7 @@ def edit_institute(institute_id):
         except ValueError:
             return jsonify({'error': 'Invalid amount'}), 400
         
-        conn = sqlite3.connect('coach_saas.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -763,11 +1019,10 @@ def edit_institute(institute_id):
         ''', (institute_name, email, upi_id, amount, institute_id))
         
         if cursor.rowcount == 0:
-            conn.close()
             return jsonify({'error': 'Institute not found'}), 404
         
         conn.commit()
-        conn.close()
+        invalidate_institute(cursor, institute_id)
         
         return jsonify({'success': True, 'message': 'Institute updated successfully'})
         
@@ -779,11 +1034,10 @@ def it_edit_institute(institute_id):
     if 'it_admin_id' not in session:
         return redirect(url_for('it_login'))
     
-    conn = sqlite3.connect('coach_saas.db')
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM institutes WHERE id = ?', (institute_id,))
     institute = cursor.fetchone()
-    conn.close()
     
     if not institute:
         flash('Institute not found')
@@ -796,7 +1050,7 @@ def it_update_institute(institute_id):
     if 'it_admin_id' not in session:
         return redirect(url_for('it_login'))
     
-    conn = sqlite3.connect('coach_saas.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -812,7 +1066,7 @@ def it_update_institute(institute_id):
     ))
     
     conn.commit()
-    conn.close()
+    invalidate_institute(cursor, institute_id)
     
     flash('Institute updated successfully!')
     return redirect(url_for('it_dashboard'))
@@ -828,6 +1082,5 @@ def admin_logout():
     return redirect(url_for('index'))
 
 if __name__ == '__main__':
-    init_db()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,94 @@
+"""
+Shared SQLite data-access layer
+
+Each thread (gunicorn gthread worker thread, script main thread, ...) keeps
+one long-lived connection per database file, opened once with the platform
+PRAGMAs applied. Flask routes borrow it through get_db(), which binds it to
+``flask.g`` for the duration of the request; the teardown handler rolls back
+anything the route left uncommitted so the connection goes back clean.
+"""
+
+import os
+import sqlite3
+import threading
+
+from flask import g, has_app_context
+
+# Database files
+DATABASE = os.environ.get('DATABASE_PATH', 'coach_saas.db')
+PAYMENTS_DATABASE = os.environ.get('PAYMENTS_DATABASE_PATH', 'payments.db')
+RATE_LIMIT_DATABASE = os.environ.get('RATE_LIMIT_DATABASE', 'ratelimit.db')
+
+# Connection tuning
+BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+CACHE_SIZE_KIB = int(os.environ.get('SQLITE_CACHE_SIZE_KIB', 16384))
+MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))
+STATEMENT_CACHE_SIZE = int(os.environ.get('SQLITE_STATEMENT_CACHE_SIZE', 256))
+
+_local = threading.local()
+
+
+def connect(path=DATABASE):
+    """Open a new connection with the platform PRAGMAs applied"""
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KIB}')
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+
+def get_connection(path=DATABASE):
+    """Return this thread's long-lived connection to ``path``, opening it on first use"""
+    # A forked worker must never reuse a handle inherited from its parent
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.pid = os.getpid()
+        _local.connections = {}
+
+    conn = _local.connections.get(path)
+    if conn is None:
+        conn = connect(path)
+        _local.connections[path] = conn
+    return conn
+
+
+def get_db(path=DATABASE):
+    """Request-scoped database handle, released in the app teardown"""
+    if not has_app_context():
+        return get_connection(path)
+
+    handles = g.setdefault('_database_handles', {})
+    conn = handles.get(path)
+    if conn is None:
+        conn = get_connection(path)
+        handles[path] = conn
+    return conn
+
+
+def release_db(exception=None):
+    """Teardown handler: hand the request's connections back without open transactions"""
+    handles = g.pop('_database_handles', {})
+    for conn in handles.values():
+        if conn.in_transaction:
+            conn.rollback()
+
+
+def close_all():
+    """Close every connection owned by the current thread"""
+    connections = getattr(_local, 'connections', None) or {}
+    if getattr(_local, 'pid', None) == os.getpid():
+        for conn in connections.values():
+            conn.close()
+    _local.connections = {}
+    _local.pid = os.getpid()
+
+
+def init_app(app):
+    """Register the request teardown for ``app``"""
+    app.teardown_appcontext(release_db)
@@ -3,7 +3,7 @@
 Demo setup script - Creates a sample institute for testing
 """
 
-import sqlite3
+from database import connect
 from werkzeug.security import generate_password_hash
 import json
 import os
@@ -16,7 +16,7 @@ def create_demo_institute():
     from coach_saas_app import init_db
     init_db()
     
-    conn = sqlite3.connect('coach_saas.db')
+    conn = connect()
     cursor = conn.cursor()
     
     # Check if demo institute already exists
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Durable email outbox and its delivery worker
+
+Request handlers call queue_email() inside the transaction that writes the
+registration, payment or download row, so a mail exists exactly when the row
+does and the request never waits on SMTP. The worker process (``worker:`` in
+Procfile_saas) claims due rows under a short lease, delivers them and then
+marks them sent, schedules a retry with exponential backoff, or dead-letters
+them after EMAIL_MAX_ATTEMPTS.
+
+Delivery reuses a small pool of authenticated SMTP sessions, spread over
+EMAIL_SMTP_POOL_SIZE sender threads and throttled to EMAIL_RATE_PER_SECOND.
+Institutes with a notification digest interval get their owner "New
+Registration"/"PDF Download" mails held back and folded into one summary per
+interval.
+
+    python email_outbox.py                 # run until SIGTERM
+    python email_outbox.py --once          # deliver what is due, then exit
+    python email_outbox.py --requeue-dead  # give dead letters another round
+
+Point SMTP_HOST/SMTP_PORT at a local stub server (and set SMTP_STARTTLS=false)
+to exercise delivery without a real mail account; ``python check_app.py
+email_outbox`` does that with its own stub.
+"""
+
+import os
+import queue
+import random
+import signal
+import smtplib
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from database import get_connection
+from migrations import migrate
+
+# SMTP settings
+SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', 'true').lower() != 'false'
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', 30))
+
+# Session reuse and throttling
+EMAIL_SMTP_POOL_SIZE = int(os.environ.get('EMAIL_SMTP_POOL_SIZE', 4))
+EMAIL_SMTP_MAX_MESSAGES = int(os.environ.get('EMAIL_SMTP_MAX_MESSAGES', 100))
+EMAIL_SMTP_MAX_IDLE = float(os.environ.get('EMAIL_SMTP_MAX_IDLE', 60))
+EMAIL_RATE_PER_SECOND = float(os.environ.get('EMAIL_RATE_PER_SECOND', 10))
+
+# Worker behaviour
+EMAIL_BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', 50))
+EMAIL_POLL_INTERVAL = float(os.environ.get('EMAIL_POLL_INTERVAL', 2))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 8))
+EMAIL_RETRY_BASE = int(os.environ.get('EMAIL_RETRY_BASE', 30))
+EMAIL_RETRY_MAX = int(os.environ.get('EMAIL_RETRY_MAX', 3600))
+
+# A claimed row becomes due again if its worker dies before reporting back
+EMAIL_LEASE_SECONDS = int(os.environ.get('EMAIL_LEASE_SECONDS', 300))
+
+# Held notifications listed in full in one digest; the rest are only counted
+DIGEST_MAX_ITEMS = 500
+
+
+def queue_email(cursor, to_email, subject, body, institute_id=None, kind=None):
+    """Record an email in the caller's transaction; the worker delivers it after commit"""
+    # Owner notifications wait in 'digest' when the institute asked for summaries
+    cursor.execute('''
+        INSERT INTO email_outbox (institute_id, kind, to_email, subject, body, status)
+        VALUES (?, ?, ?, ?, ?,
+                CASE WHEN ? IN ('owner_registration', 'owner_download')
+                      AND (SELECT notification_digest_minutes FROM institutes WHERE id = ?) > 0
+                     THEN 'digest' ELSE 'pending' END)
+    ''', (institute_id, kind, to_email, subject, body, kind, institute_id))
+
+
+def sender_credentials():
+    """(SENDER_EMAIL, SENDER_PASSWORD) from the environment"""
+    return os.environ.get('SENDER_EMAIL'), os.environ.get('SENDER_PASSWORD')
+
+
+def build_message(sender_email, to_email, subject, body):
+    msg = MIMEMultipart()
+    msg['From'] = sender_email
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'html'))
+    return msg
+
+
+def print_email(to_email, subject, body):
+    """Console fallback used when no sender is configured"""
+    print(f"\n=== EMAIL NOTIFICATION ===")
+    print(f"To: {to_email}")
+    print(f"Subject: {subject}")
+    print(f"Body: {body}")
+    print(f"========================\n")
+
+
+def open_smtp():
+    """Connected (and, with a password, authenticated) SMTP session"""
+    sender_email, sender_password = sender_credentials()
+    server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    if SMTP_STARTTLS:
+        server.starttls()
+    if sender_password:
+        server.login(sender_email, sender_password)
+    return server
+
+
+def close_smtp(server):
+    try:
+        server.quit()
+    except (smtplib.SMTPException, OSError):
+        server.close()
+
+
+class SMTPPool:
+    """Bounded pool of authenticated SMTP sessions reused across many messages
+
+    A session is retired after EMAIL_SMTP_MAX_MESSAGES sends (providers cap
+    messages per connection) or EMAIL_SMTP_MAX_IDLE seconds without use, and
+    a reused session that turns out to be dead is replaced once per send.
+    """
+
+    def __init__(self, size=EMAIL_SMTP_POOL_SIZE, max_messages=EMAIL_SMTP_MAX_MESSAGES,
+                 max_idle=EMAIL_SMTP_MAX_IDLE, connect=open_smtp):
+        self.size = size
+        self.max_messages = max_messages
+        self.max_idle = max_idle
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.connections_opened = 0
+
+    def _checkout(self):
+        """(server, messages sent, reused?) from the idle stack, or a fresh session"""
+        while True:
+            try:
+                server, sent, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                self.connections_opened += 1
+                return self._connect(), 0, False
+            if time.monotonic() - last_used <= self.max_idle:
+                return server, sent, True
+            close_smtp(server)
+
+    def _checkin(self, server, sent):
+        if sent >= self.max_messages:
+            close_smtp(server)
+        else:
+            self._idle.put((server, sent, time.monotonic()))
+
+    def send(self, msg):
+        """Send ``msg`` on a pooled session"""
+        with self._slots:
+            server, sent, reused = self._checkout()
+            try:
+                server.send_message(msg)
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                # The server rejected this message but the session is still usable.
+                # Caught first: SMTPException subclasses OSError
+                self._checkin(server, sent + 1)
+                raise
+            except (smtplib.SMTPServerDisconnected, OSError):
+                server.close()
+                if not reused:
+                    raise
+                # The pooled session went stale; one retry on a fresh one
+                self.connections_opened += 1
+                server, sent = self._connect(), 0
+                try:
+                    server.send_message(msg)
+                except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                    self._checkin(server, sent + 1)
+                    raise
+                except (smtplib.SMTPServerDisconnected, OSError):
+                    server.close()
+                    raise
+            self._checkin(server, sent + 1)
+
+    def close(self):
+        """Quit every idle session"""
+        while True:
+            try:
+                server, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            close_smtp(server)
+
+
+class RateLimiter:
+    """Spaces calls to wait() at least 1 / ``per_second`` apart across threads"""
+
+    def __init__(self, per_second=EMAIL_RATE_PER_SECOND):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+smtp_pool = SMTPPool()
+rate_limiter = RateLimiter()
+
+
+def deliver(to_email, subject, body):
+    """Send one email; raises on failure so the caller can retry"""
+    sender_email, _ = sender_credentials()
+    if not sender_email:
+        print_email(to_email, subject, body)
+        return
+
+    rate_limiter.wait()
+    smtp_pool.send(build_message(sender_email, to_email, subject, body))
+
+    print(f"[EMAIL SENT] To: {to_email}, Subject: {subject}")
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, capped at EMAIL_RETRY_MAX seconds"""
+    delay = min(EMAIL_RETRY_BASE * 2 ** max(attempts - 1, 0), EMAIL_RETRY_MAX)
+    return int(delay * random.uniform(0.8, 1.2))
+
+
+def claim_due(conn, limit=EMAIL_BATCH_SIZE):
+    """Lease up to ``limit`` due emails to this worker; returns their rows"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = conn.execute('''
+            SELECT id, to_email, subject, body, attempts + 1
+            FROM email_outbox
+            WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+            ORDER BY next_attempt_at
+            LIMIT ?
+        ''', (limit,)).fetchall()
+        conn.executemany('''
+            UPDATE email_outbox
+            SET attempts = attempts + 1, next_attempt_at = datetime('now', ?)
+            WHERE id = ?
+        ''', [(f'+{EMAIL_LEASE_SECONDS} seconds', row[0]) for row in rows])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rows
+
+
+def record_results(conn, sent, failed):
+    """Mark ``sent`` ids delivered and reschedule or dead-letter ``failed`` (id, attempts, error, permanent)"""
+    conn.executemany('''
+        UPDATE email_outbox
+        SET status = 'sent', sent_at = CURRENT_TIMESTAMP, last_error = NULL
+        WHERE id = ?
+    ''', [(email_id,) for email_id in sent])
+
+    for email_id, attempts, error, permanent in failed:
+        if permanent or attempts >= EMAIL_MAX_ATTEMPTS:
+            conn.execute('''
+                UPDATE email_outbox SET status = 'dead', last_error = ? WHERE id = ?
+            ''', (error, email_id))
+            print(f"[EMAIL DEAD] #{email_id} after {attempts} attempts: {error}")
+        else:
+            conn.execute('''
+                UPDATE email_outbox SET next_attempt_at = datetime('now', ?), last_error = ? WHERE id = ?
+            ''', (f'+{retry_delay(attempts)} seconds', error, email_id))
+    conn.commit()
+
+
+def deliver_row(row):
+    """Deliver one claimed row; returns (id, attempts, error or None, permanent)"""
+    email_id, to_email, subject, body, attempts = row
+    try:
+        deliver(to_email, subject, body)
+        return email_id, attempts, None, False
+    except smtplib.SMTPRecipientsRefused as e:
+        # Only 5xx refusals are final; a 4xx (greylisting, full mailbox) is retried
+        permanent = all(code >= 500 for code, _ in e.recipients.values())
+        if not permanent:
+            print(f"[EMAIL ERROR] #{email_id}: {e}")
+        return email_id, attempts, str(e), permanent
+    except Exception as e:
+        print(f"[EMAIL ERROR] #{email_id}: {e}")
+        return email_id, attempts, str(e), False
+
+
+_senders = ThreadPoolExecutor(max_workers=EMAIL_SMTP_POOL_SIZE, thread_name_prefix='smtp')
+
+
+def drain_once(conn, limit=EMAIL_BATCH_SIZE):
+    """Deliver one batch of due emails over the SMTP pool; returns how many were claimed"""
+    rows = claim_due(conn, limit)
+    if not rows:
+        return 0
+
+    sent = []
+    failed = []
+    for email_id, attempts, error, permanent in _senders.map(deliver_row, rows):
+        if error is None:
+            sent.append(email_id)
+        else:
+            failed.append((email_id, attempts, error, permanent))
+
+    record_results(conn, sent, failed)
+    return len(rows)
+
+
+def digest_body(rows):
+    """HTML summary of held owner notifications [(kind, subject, body)]"""
+    registrations = sum(1 for kind, _, _ in rows if kind == 'owner_registration')
+    downloads = sum(1 for kind, _, _ in rows if kind == 'owner_download')
+    parts = [
+        '<h2>Activity Summary</h2>',
+        f'<p>New registrations: {registrations}<br>PDF downloads: {downloads}</p>',
+    ]
+    for _, subject, body in rows[:DIGEST_MAX_ITEMS]:
+        parts.append(f'<hr><h4>{subject}</h4>{body}')
+    if len(rows) > DIGEST_MAX_ITEMS:
+        parts.append(f'<hr><p>... and {len(rows) - DIGEST_MAX_ITEMS} more in your dashboard.</p>')
+    return '\n'.join(parts)
+
+
+def fold_digests(conn):
+    """Fold held owner notifications whose interval has elapsed into one summary each"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        groups = conn.execute('''
+            SELECT o.institute_id, o.to_email, i.institute_name
+            FROM email_outbox o
+            JOIN institutes i ON i.id = o.institute_id
+            WHERE o.status = 'digest'
+            GROUP BY o.institute_id, o.to_email
+            HAVING MIN(o.created_at) <= datetime('now', '-' || COALESCE(i.notification_digest_minutes, 0) || ' minutes')
+        ''').fetchall()
+
+        for institute_id, to_email, institute_name in groups:
+            rows = conn.execute('''
+                SELECT id, kind, subject, body FROM email_outbox
+                WHERE status = 'digest' AND institute_id = ? AND to_email = ?
+                ORDER BY id
+            ''', (institute_id, to_email)).fetchall()
+            queue_email(conn.cursor(), to_email, f"Activity Summary - {institute_name} ({len(rows)} updates)",
+                        digest_body([row[1:] for row in rows]), institute_id, 'owner_digest')
+            conn.executemany('''
+                UPDATE email_outbox SET status = 'digested' WHERE id = ?
+            ''', [(row[0],) for row in rows])
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(groups)
+
+
+def requeue_dead(conn):
+    """Reset dead letters for another full round of attempts; returns how many"""
+    cursor = conn.execute('''
+        UPDATE email_outbox
+        SET status = 'pending', attempts = 0, next_attempt_at = CURRENT_TIMESTAMP
+        WHERE status = 'dead'
+    ''')
+    conn.commit()
+    return cursor.rowcount
+
+
+def run_worker():
+    """Drain the outbox until SIGTERM/SIGINT"""
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *args: stopping.append(True))
+
+    conn = get_connection()
+    migrate(conn)
+    print(f"[EMAIL WORKER] Started (batch {EMAIL_BATCH_SIZE}, poll {EMAIL_POLL_INTERVAL}s)")
+
+    while not stopping:
+        try:
+            fold_digests(conn)
+            claimed = drain_once(conn)
+        except Exception as e:
+            print(f"[EMAIL WORKER] Batch failed: {e}")
+            claimed = 0
+        # A full batch means more is probably due; otherwise wait for new mail
+        if claimed < EMAIL_BATCH_SIZE:
+            time.sleep(EMAIL_POLL_INTERVAL)
+
+    smtp_pool.close()
+    print("[EMAIL WORKER] Stopped")
+
+
+def main(args):
+    conn = get_connection()
+    if '--requeue-dead' in args:
+        migrate(conn)
+        print(f"Requeued {requeue_dead(conn)} dead emails")
+    elif '--once' in args:
+        migrate(conn)
+        fold_digests(conn)
+        total = 0
+        while True:
+            claimed = drain_once(conn)
+            total += claimed
+            if claimed < EMAIL_BATCH_SIZE:
+                break
+        print(f"Processed {total} emails")
+        smtp_pool.close()
+    else:
+        run_worker()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,180 @@
+"""
+Streaming CSV and XLSX exports of an institute's registrations and PDF-download leads
+
+Rows are read straight off the SQLite cursor and written out in chunks of
+EXPORT_CHUNK_ROWS, so an export of any size runs in constant memory and the
+first bytes reach the client before the query has finished. XLSX files are
+written as a minimal SpreadsheetML package whose sheet is deflated into the
+response as it is generated.
+"""
+
+import csv
+import io
+import os
+import re
+import zipfile
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 1000))
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+DATASETS = {
+    'registrations': ('Registrations', ('ID', 'Name', 'Email', 'Phone', 'Payment Status', 'Payment ID', 'Registered At')),
+    'downloads': ('PDF Downloads', ('ID', 'Name', 'Email', 'Phone', 'Downloaded At')),
+}
+
+PAYMENT_STATUSES = ('pending', 'completed')
+
+# Spreadsheet apps run cells starting with these as formulas; phone numbers like +91 98... stay as they are
+FORMULA_PREFIX = re.compile(r'^[=@\t\r]|^[+-](?![\d\s()-]*$)')
+XML_ILLEGAL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def parse_range(date_from, date_to):
+    """Inclusive YYYY-MM-DD bounds -> (lower, upper) timestamps for ``>= lower AND < upper``; raises ValueError"""
+    lower = datetime.strptime(date_from, '%Y-%m-%d').strftime('%Y-%m-%d') if date_from else ''
+    upper = '9999-12-31'
+    if date_to:
+        upper = (datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    return lower, upper
+
+
+def query_rows(cursor, dataset, institute_id, lower, upper, status=None):
+    """Execute the export query and return the cursor, oldest rows first"""
+    if dataset == 'registrations':
+        cursor.execute('''
+            SELECT id, name, email, phone, payment_status, payment_id, registered_at
+            FROM registrations
+            WHERE institute_id = ? AND registered_at >= ? AND registered_at < ?
+              AND (? IS NULL OR payment_status = ?)
+            ORDER BY registered_at, id
+        ''', (institute_id, lower, upper, status, status))
+    else:
+        cursor.execute('''
+            SELECT id, name, email, phone, downloaded_at
+            FROM pdf_downloads
+            WHERE institute_id = ? AND downloaded_at >= ? AND downloaded_at < ?
+            ORDER BY downloaded_at, id
+        ''', (institute_id, lower, upper))
+    return cursor
+
+
+def safe_cell(value):
+    if isinstance(value, str) and FORMULA_PREFIX.match(value):
+        return "'" + value
+    return value
+
+
+def stream_csv(header, rows):
+    """Yield UTF-8 CSV (with a BOM so Excel detects the encoding) in chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for n, row in enumerate(rows, start=1):
+        writer.writerow([safe_cell(value) for value in row])
+        if n % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+class ChunkSink:
+    """Write-only file object for zipfile that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(XML_ILLEGAL.sub('', str(safe_cell(value))))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_row(values):
+    return '<row>' + ''.join(xlsx_cell(value) for value in values) + '</row>'
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{title}" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'),
+}
+
+
+def stream_xlsx(title, header, rows):
+    """Yield a single-sheet XLSX workbook in chunks as the sheet is compressed"""
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_PARTS.items():
+            workbook.writestr(name, content.replace('{title}', escape(title)))
+        yield sink.drain()
+
+        with workbook.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            parts = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                     '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>',
+                     xlsx_row(header)]
+            for n, row in enumerate(rows, start=1):
+                parts.append(xlsx_row(row))
+                if n % EXPORT_CHUNK_ROWS == 0:
+                    sheet.write(''.join(parts).encode())
+                    parts = []
+                    yield sink.drain()
+            parts.append('</sheetData></worksheet>')
+            sheet.write(''.join(parts).encode())
+    yield sink.drain()
+
+
+def stream_export(cursor, dataset, fmt, institute_id, lower, upper, status=None):
+    """Generator of the export body for one dataset and format"""
+    title, header = DATASETS[dataset]
+    rows = query_rows(cursor, dataset, institute_id, lower, upper, status)
+    if fmt == 'csv':
+        return stream_csv(header, rows)
+    return stream_xlsx(title, header, rows)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the payment gateway's webhook delivery
+
+Replays recorded events (one JSON event per line, as the gateway posts them)
+against /webhook/razorpay, signed with RAZORPAY_WEBHOOK_SECRET. Each event is
+delivered --repeat times from --concurrency threads to mimic a retry storm,
+then the batch processor runs and a summary is printed.
+
+    python fake_gateway.py events.jsonl                   # in-process, temp databases
+    python fake_gateway.py events.jsonl --repeat 20
+    python fake_gateway.py events.jsonl --url http://localhost:5001
+    python fake_gateway.py --record events.jsonl          # synthesize events for every created order
+
+Without --url the payment service runs in-process on throwaway databases
+seeded with one institute, registration and order per recorded event.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+if '--url' not in sys.argv and '--record' not in sys.argv:
+    _workdir = tempfile.mkdtemp(prefix='fake_gateway_')
+    os.environ.setdefault('DATABASE_PATH', os.path.join(_workdir, 'coach_saas.db'))
+    os.environ.setdefault('PAYMENTS_DATABASE_PATH', os.path.join(_workdir, 'payments.db'))
+    os.environ.setdefault('RAZORPAY_WEBHOOK_SECRET', 'fake_gateway_secret')
+
+from database import DATABASE, PAYMENTS_DATABASE, get_connection
+from migrations import MIGRATIONS, PAYMENT_MIGRATIONS, migrate
+import payment_service
+import webhook_processor
+
+
+def captured_event(order_id, payment_id, amount, method='upi'):
+    """A payment.captured event shaped like the gateway's"""
+    return {
+        'entity': 'event',
+        'event': 'payment.captured',
+        'contains': ['payment'],
+        'payload': {'payment': {'entity': {
+            'id': payment_id, 'entity': 'payment', 'order_id': order_id,
+            'amount': int(amount * 100), 'currency': 'INR', 'status': 'captured', 'method': method,
+        }}},
+        'created_at': int(time.time()),
+    }
+
+
+def record(path):
+    """Write a captured event for every order still in 'created' state"""
+    conn = get_connection(PAYMENTS_DATABASE)
+    migrate(conn, PAYMENT_MIGRATIONS)
+    rows = conn.execute('''
+        SELECT id, gateway_order_id, amount FROM payment_transactions WHERE status = 'created'
+    ''').fetchall()
+    with open(path, 'w') as out:
+        for transaction_id, order_id, amount in rows:
+            out.write(json.dumps(captured_event(order_id, f'pay_fake{transaction_id:08d}', amount)) + '\n')
+    print(f"Recorded {len(rows)} events to {path}")
+
+
+def seed_orders(events):
+    """Create the registrations and orders the recorded events refer to"""
+    main_conn = get_connection(DATABASE)
+    payments_conn = get_connection(PAYMENTS_DATABASE)
+    migrate(main_conn, MIGRATIONS)
+    migrate(payments_conn, PAYMENT_MIGRATIONS)
+
+    institute_id = main_conn.execute('''
+        INSERT INTO institutes (username, password_hash, institute_name, email)
+        VALUES ('fakegateway', '-', 'Fake Gateway Institute', 'owner@example.com')
+    ''').lastrowid
+    orders = set()
+    for n, event in enumerate(events):
+        try:
+            payment = webhook_processor.payment_entity(event)
+        except (KeyError, TypeError):
+            continue
+        if payment['order_id'] in orders:
+            continue
+        orders.add(payment['order_id'])
+        registration_id = main_conn.execute('''
+            INSERT INTO registrations (institute_id, name, email, phone) VALUES (?, ?, ?, ?)
+        ''', (institute_id, f'Aspirant {n}', f'aspirant{n}@example.com', '9999999999')).lastrowid
+        payments_conn.execute('''
+            INSERT INTO payment_transactions (registration_id, institute_id, amount, gateway_order_id, status)
+            VALUES (?, ?, ?, ?, 'created')
+        ''', (registration_id, institute_id, payment['amount'] / 100, payment['order_id']))
+    main_conn.commit()
+    payments_conn.commit()
+    return len(orders)
+
+
+def deliver(url, body, event_id):
+    """POST one signed event; returns the HTTP status"""
+    headers = {
+        'Content-Type': 'application/json',
+        'X-Razorpay-Signature': payment_service.webhook_signature(body),
+        'X-Razorpay-Event-Id': event_id,
+    }
+    if url is None:
+        with payment_service.app.test_client() as client:
+            return client.post('/webhook/razorpay', data=body, headers=headers).status_code
+
+    request = urllib.request.Request(url.rstrip('/') + '/webhook/razorpay', data=body, headers=headers)
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+
+def replay(path, url=None, repeat=1, concurrency=16):
+    with open(path) as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    if url is None:
+        orders = seed_orders(events)
+
+    deliveries = [(json.dumps(event).encode(), f'evt_{n:08d}') for n, event in enumerate(events)] * repeat
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        statuses = list(pool.map(lambda delivery: deliver(url, *delivery), deliveries))
+    elapsed = time.perf_counter() - start
+    print(f"Delivered {len(deliveries)} webhooks ({len(events)} events x {repeat}) "
+          f"in {elapsed:.2f}s, {len(deliveries) / elapsed:.0f}/s, "
+          f"{sum(1 for status in statuses if status == 200)} accepted")
+
+    if url is not None:
+        return 0
+
+    payments_conn, main_conn = webhook_processor.connections()
+    start = time.perf_counter()
+    processed = webhook_processor.process_all(payments_conn, main_conn)
+    print(f"Processed {processed} stored events in {time.perf_counter() - start:.2f}s")
+
+    completed = main_conn.execute(
+        "SELECT COUNT(*) FROM registrations WHERE payment_status = 'completed'").fetchone()[0]
+    emails = main_conn.execute(
+        "SELECT COUNT(*) FROM email_outbox WHERE kind = 'aspirant_payment'").fetchone()[0]
+    print(f"Registrations completed: {completed}/{orders}, confirmation emails: {emails}")
+    return 0 if processed == len(events) and completed == emails == orders else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('events', nargs='?', help='recorded events, one JSON object per line')
+    parser.add_argument('--url', help='payment service base URL (default: in-process)')
+    parser.add_argument('--repeat', type=int, default=1, help='deliveries per event')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--record', metavar='PATH', help='write events for every created order and exit')
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record)
+        return 0
+    if not args.events:
+        parser.error('an events file is required')
+    if not payment_service.RAZORPAY_WEBHOOK_SECRET:
+        parser.error("set RAZORPAY_WEBHOOK_SECRET to the payment service's webhook secret")
+    return replay(args.events, args.url, args.repeat, args.concurrency)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Serving uploaded files without tying up a worker for the transfer
+
+FILE_SERVING_MODE picks who moves the bytes once a route has authorized a
+download:
+
+    python      send_file() from the app, with Range / 206 support (default)
+    x-accel     empty response with X-Accel-Redirect for nginx
+    x-sendfile  empty response with X-Sendfile for Apache / lighttpd
+
+In the proxy modes the front server streams the file itself (and answers
+Range requests), so a 20 MB sample paper costs the app one stat().
+X_ACCEL_PREFIX must match an ``internal`` nginx location aliased to the
+upload folder, e.g.
+
+    location /protected-uploads/ {
+        internal;
+        alias /app/uploads/;
+    }
+"""
+
+import mimetypes
+import os
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import make_response, send_file
+
+from http_cache import apply_validators, make_etag
+
+FILE_SERVING_MODE = os.environ.get('FILE_SERVING_MODE', 'python').lower()
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/protected-uploads/')
+
+SERVING_MODES = ('python', 'x-accel', 'x-sendfile')
+if FILE_SERVING_MODE not in SERVING_MODES:
+    raise ValueError(f"FILE_SERVING_MODE must be one of {', '.join(SERVING_MODES)}, not {FILE_SERVING_MODE!r}")
+
+
+def file_validators(kind, filename, stat):
+    """(ETag, Last-Modified) for a file, from its stat alone"""
+    etag = make_etag(kind, filename, stat.st_size, stat.st_mtime_ns)
+    last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+    return etag, last_modified
+
+
+def serve_file(file_path, etag, last_modified, as_attachment=False, immutable=False, mode=None,
+               download_name=None, internal_path=None):
+    """Response delivering ``file_path``; the caller has already checked it exists
+
+    ``internal_path`` is the file's path under the upload folder (what
+    X_ACCEL_PREFIX maps to) and ``download_name`` the name offered to the
+    browser; both default to the file's own name.
+    """
+    mode = mode or FILE_SERVING_MODE
+    file_path = os.path.abspath(file_path)
+    download_name = download_name or os.path.basename(file_path)
+
+    if mode == 'python':
+        # conditional=True lets Werkzeug answer Range / If-Range with 206 or 416
+        response = send_file(file_path, as_attachment=as_attachment, download_name=download_name,
+                             conditional=True, etag=etag, last_modified=last_modified)
+        return apply_validators(response, etag, last_modified, immutable=immutable)
+
+    response = make_response('')
+    response.mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    if mode == 'x-accel':
+        internal_path = (internal_path or os.path.basename(file_path)).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = X_ACCEL_PREFIX + quote(internal_path)
+    else:
+        response.headers['X-Sendfile'] = file_path
+    if as_attachment:
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    return apply_validators(response, etag, last_modified, immutable=immutable)
@@ -3,47 +3,19 @@
 Database repair script - Fixes JSON parsing issues
 """
 
-import sqlite3
-import json
+from database import connect
+from migrations import migrate, repair_testimonials
 
 def fix_database():
     """Fix corrupted JSON data in database"""
     print("=== Database Repair Tool ===")
     
     try:
-        conn = sqlite3.connect('coach_saas.db')
-        cursor = conn.cursor()
-        
-        # Check configurations table
-        cursor.execute('SELECT id, testimonials FROM configurations')
-        configs = cursor.fetchall()
-        
-        fixed_count = 0
-        for config_id, testimonials in configs:
-            if testimonials:
-                try:
-                    # Try to parse existing JSON
-                    json.loads(testimonials)
-                    print(f"Config {config_id}: JSON is valid")
-                except json.JSONDecodeError:
-                    # Fix corrupted JSON
-                    print(f"Config {config_id}: Fixing corrupted JSON")
-                    cursor.execute('''
-                        UPDATE configurations 
-                        SET testimonials = ? 
-                        WHERE id = ?
-                    ''', ('[]', config_id))
-                    fixed_count += 1
-            else:
-                # Set empty JSON array for NULL values
-                print(f"Config {config_id}: Setting default empty array")
-                cursor.execute('''
-                    UPDATE configurations 
-                    SET testimonials = ? 
-                    WHERE id = ?
-                ''', ('[]', config_id))
-                fixed_count += 1
+        conn = connect()
+        migrate(conn)
         
+        # The same repair runs as a migration; this re-applies it on demand
+        fixed_count = repair_testimonials(conn.cursor())
         conn.commit()
         conn.close()
         
@@ -54,4 +26,4 @@ def fix_database():
         print(f"[ERROR] Database repair failed: {e}")
 
 if __name__ == '__main__':
-    fix_database()
\ No newline at end of file
+    fix_database()
@@ -0,0 +1,190 @@
+"""
+Group commit for registration and PDF-download inserts
+
+When results are announced, hundreds of aspirants register at once and every
+request takes SQLite's write lock for its own INSERT and COMMIT. With
+GROUP_COMMIT=1 a worker's request threads hand their writes to one writer
+thread instead and wait on a Future. The writer runs whatever arrived within
+GROUP_COMMIT_MAX_DELAY_MS (up to GROUP_COMMIT_MAX_ROWS writes) in a single
+transaction. Each write runs inside its own savepoint, so a failing write is
+rolled back alone. Futures are resolved only after the COMMIT, so a caller
+never hands out a registration id that is not on disk.
+
+shutdown() (gunicorn's worker_exit hook, and atexit) stops taking writes,
+flushes everything already queued and waits for the writer, so a recycled or
+stopped worker loses nothing it accepted. Writes submitted after that run
+directly on the caller's connection.
+
+If the writer thread dies, every write it held fails with the error that
+killed it and the next submit starts a fresh writer. Callers never wait
+longer than GROUP_COMMIT_TIMEOUT seconds (default: SQLite's busy timeout
+plus a margin); a write still queued by then is dropped, one already running
+may still commit.
+
+Batching only pays off when a process has several request threads
+(gthread workers); a sync worker has one writer at a time anyway.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, TimeoutError
+
+from database import BUSY_TIMEOUT_MS, DATABASE, connect, get_db
+
+GROUP_COMMIT = os.environ.get('GROUP_COMMIT', '0') == '1'
+GROUP_COMMIT_MAX_ROWS = int(os.environ.get('GROUP_COMMIT_MAX_ROWS', 200))
+GROUP_COMMIT_MAX_DELAY_MS = float(os.environ.get('GROUP_COMMIT_MAX_DELAY_MS', 1))
+GROUP_COMMIT_TIMEOUT = float(os.environ.get('GROUP_COMMIT_TIMEOUT', BUSY_TIMEOUT_MS / 1000 + 5))
+
+
+def fail(future, error):
+    """Resolve ``future`` with ``error`` unless its caller already gave up on it"""
+    try:
+        future.set_exception(error)
+    except InvalidStateError:
+        pass
+
+
+class GroupCommitter:
+    """One writer thread per process that commits queued writes in batches"""
+
+    def __init__(self, path=DATABASE, max_rows=GROUP_COMMIT_MAX_ROWS, max_delay_ms=GROUP_COMMIT_MAX_DELAY_MS):
+        self.path = path
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.lock = threading.Lock()
+        self.pid = None
+        self.closed = False
+
+    def submit(self, operation, *args):
+        """Queue ``operation(cursor, *args)`` for the next batch; returns a Future, or None once shut down"""
+        future = Future()
+        with self.lock:
+            if self.closed:
+                return None
+            # The writer thread is started lazily and never survives a fork
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.queue = queue.Queue()
+                self.thread = threading.Thread(target=self.run, name='group-commit', daemon=True)
+                self.thread.start()
+            self.queue.put((future, operation, args))
+        return future
+
+    def shutdown(self):
+        """Stop taking writes, commit everything queued so far and wait for the writer"""
+        with self.lock:
+            running = not self.closed and self.pid == os.getpid()
+            self.closed = True
+            if running:
+                self.queue.put(None)
+        if running:
+            self.thread.join()
+
+    def run(self):
+        batch = []
+        try:
+            conn = connect(self.path)
+            try:
+                stopping = False
+                while not stopping:
+                    item = self.queue.get()
+                    if item is None:
+                        break
+                    batch = [item]
+                    deadline = time.monotonic() + self.max_delay
+                    while len(batch) < self.max_rows:
+                        try:
+                            item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                        except queue.Empty:
+                            break
+                        if item is None:
+                            stopping = True
+                            break
+                        batch.append(item)
+                    self.flush(conn, batch)
+                    batch = []
+            finally:
+                conn.close()
+        except BaseException as e:
+            print(f"[GROUP COMMIT] Writer thread failed: {e!r}")
+            self.abandon(batch, e)
+
+    def abandon(self, batch, error):
+        """Fail ``batch`` and everything queued behind it; the next submit starts a new writer"""
+        with self.lock:
+            # Under the lock no submit can queue behind the drain below
+            if self.pid == os.getpid():
+                self.pid = None
+            queued = []
+            while True:
+                try:
+                    queued.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+        for item in batch + queued:
+            if item is not None:
+                fail(item[0], error)
+
+    def flush(self, conn, batch):
+        """Run one batch in a single transaction, then resolve its futures"""
+        # Writes whose callers timed out while queued are dropped
+        batch = [item for item in batch if item[0].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        cursor = conn.cursor()
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for future, operation, args in batch:
+                cursor.execute('SAVEPOINT group_write')
+                try:
+                    outcomes.append((future, operation(cursor, *args), None))
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO group_write')
+                    outcomes.append((future, None, e))
+                cursor.execute('RELEASE group_write')
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"[GROUP COMMIT] Batch of {len(batch)} writes failed: {e}")
+            for future, operation, args in batch:
+                fail(future, e)
+            return
+
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+committer = GroupCommitter()
+atexit.register(committer.shutdown)
+
+
+def commit_write(operation, *args):
+    """Run ``operation(cursor, *args)`` and commit it, batched when GROUP_COMMIT is on; returns its result"""
+    future = committer.submit(operation, *args) if GROUP_COMMIT else None
+    if future is not None:
+        try:
+            return future.result(timeout=GROUP_COMMIT_TIMEOUT)
+        except TimeoutError:
+            # Dropped if still queued; if already running it may yet commit,
+            # and a retried registration finds it by its lead keys
+            future.cancel()
+            raise
+
+    conn = get_db()
+    result = operation(conn.cursor(), *args)
+    conn.commit()
+    return result
+
+
+def shutdown():
+    """Flush and stop this process's writer thread (no-op if it never started)"""
+    committer.shutdown()
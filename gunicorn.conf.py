@@ -0,0 +1,74 @@
+"""
+Production serving profile for coach_saas_app (and payment_service)
+
+    gunicorn -c gunicorn.conf.py coach_saas_app:app
+
+The app is imported once in the master (preload_app), so migrations run
+once and workers fork with the code already loaded. SQLite handles must not
+cross a fork: the master closes its connections before forking and each
+worker starts with an empty per-thread connection table, opening its own
+handles on first use.
+
+Requests are served by gthread workers (serving.ThreadWorker, which fixes
+requests dropped on max_requests restarts): page renders are mostly cache
+hits and SQLite releases the GIL while it waits, so a few threads per
+process keep a worker busy while one of them waits on the write lock.
+
+Environment:
+    WEB_CONCURRENCY           worker processes (default: CPU count)
+    GUNICORN_THREADS          threads per worker (default 4, or 1 for sync)
+    GUNICORN_WORKER_CLASS     serving.ThreadWorker (default, gthread) or sync
+    GUNICORN_MAX_REQUESTS     recycle a worker after this many requests (default 2000, 0 = never)
+    GUNICORN_TIMEOUT          seconds before a silent worker is restarted (default 60)
+    GUNICORN_ACCESS_LOG       access log path (default stdout, empty to disable)
+    GROUP_COMMIT              1 = batch registration/download inserts per worker (see group_commit.py)
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+preload_app = True
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'serving.ThreadWorker')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# gunicorn silently swaps sync for its stock gthread worker when threads > 1
+threads = int(os.environ.get('GUNICORN_THREADS', 1 if worker_class == 'sync' else 4))
+
+# Recycle workers gradually so slow leaks never accumulate; the jitter keeps
+# them from all restarting at the same moment
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+graceful_timeout = 30
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+keepalive = 5
+
+# Heartbeat files on tmpfs: a slow disk must not get workers killed
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+
+
+def pre_fork(server, worker):
+    """Master: close the handles opened while loading the app so no worker inherits them"""
+    import database
+    database.close_all()
+
+
+def post_fork(server, worker):
+    """Worker: start from an empty connection table; each thread connects on first use"""
+    import database
+    database.close_all()
+    # Admission control sheds public writes before they occupy every thread
+    import rate_limit
+    rate_limit.configure_worker(server.cfg.threads)
+    server.log.info(f"[DB] Worker {worker.pid} ready ({worker_class}, {threads} threads)")
+
+
+def worker_exit(server, worker):
+    """Worker: commit queued group-commit writes, then close this thread's connections on the way out"""
+    import database
+    import group_commit
+    group_commit.shutdown()
+    database.close_all()
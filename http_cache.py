@@ -0,0 +1,74 @@
+"""
+HTTP validators (ETag / Last-Modified) and Cache-Control helpers
+
+Routes compute their validators from cheap metadata (a tenant version, a
+file stat) and call not_modified() *before* rendering or opening anything,
+so a revalidating crawler costs a lookup and an empty 304.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timezone
+
+from flask import request, make_response
+
+TEMPLATE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+# Public tenant pages may be reused for this long before revalidating
+PUBLIC_PAGE_MAX_AGE = int(os.environ.get('PUBLIC_PAGE_MAX_AGE', 60))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _templates_modified_at():
+    """Newest template mtime, so a deploy that changes markup changes every validator"""
+    mtimes = [os.path.getmtime(os.path.join(TEMPLATE_FOLDER, name)) for name in os.listdir(TEMPLATE_FOLDER)]
+    return datetime.fromtimestamp(int(max(mtimes, default=0)), tz=timezone.utc)
+
+
+BUILD_TIME = _templates_modified_at()
+
+
+def parse_timestamp(value):
+    """SQLite CURRENT_TIMESTAMP text (UTC) to an aware datetime; None stays None"""
+    if not value:
+        return None
+    return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+
+def make_etag(*parts):
+    """Strong ETag value derived from ``parts`` and the deployed templates"""
+    digest = hashlib.sha1(repr((BUILD_TIME.timestamp(),) + parts).encode()).hexdigest()
+    return digest[:32]
+
+
+def page_last_modified(*timestamps):
+    """Latest of ``timestamps`` and the template build time"""
+    return max([BUILD_TIME] + [timestamp for timestamp in timestamps if timestamp])
+
+
+def not_modified(etag, last_modified=None):
+    """True when the client's cached copy is still current"""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def apply_validators(response, etag, last_modified=None, max_age=PUBLIC_PAGE_MAX_AGE, immutable=False):
+    """Attach ETag, Last-Modified and public Cache-Control headers to ``response``"""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = IMMUTABLE_MAX_AGE if immutable else max_age
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+
+def not_modified_response(etag, last_modified=None, **kwargs):
+    """Empty 304 carrying the same validators a full response would"""
+    response = make_response('', 304)
+    return apply_validators(response, etag, last_modified, **kwargs)
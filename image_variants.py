@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Background resizing of testimonial photos
+
+upload_image() queues the stored blob with queue_image(); this worker (the
+``images:`` entry in Procfile_saas) turns it into square, width-bounded JPEG
+and WebP variants under ``uploads/variants/`` and writes their srcsets into
+every testimonial that shows the image. Jobs are keyed by blob hash, so a
+photo shared by several institutes is processed once. The original stays at
+its /blobs/ URL and is only fetched when someone asks for it.
+
+    python image_variants.py          # run until SIGTERM
+    python image_variants.py --once   # process what is queued, then exit
+"""
+
+import json
+import os
+import signal
+import sys
+import time
+
+from PIL import Image, ImageOps
+
+from database import get_connection
+from migrations import migrate
+from upload_store import blob_relpath, blob_url, variant_dir
+
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
+
+# Testimonial avatars render at 60px; these cover 1x, 2x and 4x screens
+IMAGE_VARIANT_WIDTHS = tuple(int(width) for width in os.environ.get('IMAGE_VARIANT_WIDTHS', '60,120,240').split(','))
+IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', 82))
+IMAGE_WEBP_QUALITY = int(os.environ.get('IMAGE_WEBP_QUALITY', 78))
+
+# Bump when the output changes so variant URLs (cached as immutable) change too
+PIPELINE_VERSION = 1
+
+IMAGE_POLL_INTERVAL = float(os.environ.get('IMAGE_POLL_INTERVAL', 2))
+IMAGE_MAX_ATTEMPTS = int(os.environ.get('IMAGE_MAX_ATTEMPTS', 3))
+IMAGE_LEASE_SECONDS = int(os.environ.get('IMAGE_LEASE_SECONDS', 300))
+
+# Refuse decompression bombs well before they exhaust the worker's memory
+Image.MAX_IMAGE_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 40_000_000))
+
+FORMATS = (
+    ('image/webp', 'webp', 'WEBP', {'quality': IMAGE_WEBP_QUALITY, 'method': 6}),
+    ('image/jpeg', 'jpg', 'JPEG', {'quality': IMAGE_JPEG_QUALITY, 'optimize': True, 'progressive': True}),
+)
+
+
+def queue_image(cursor, sha256, extension):
+    """Ask for variants of an uploaded blob in the caller's transaction"""
+    cursor.execute('''
+        INSERT OR IGNORE INTO image_jobs (sha256, extension)
+        VALUES (?, ?)
+    ''', (sha256, extension))
+
+
+def variant_name(width, extension):
+    return f'v{PIPELINE_VERSION}-{width}.{extension}'
+
+
+def variant_url(sha256, name):
+    return f'/variants/{sha256}/{name}'
+
+
+def flatten(image):
+    """RGB copy of ``image`` with any transparency composited onto white"""
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(sha256, extension, upload_folder=UPLOAD_FOLDER):
+    """Write every variant of one blob; returns {'src': url, 'srcset': {mime: srcset}}"""
+    with Image.open(os.path.join(upload_folder, blob_relpath(sha256, extension))) as original:
+        image = ImageOps.exif_transpose(original)
+        image.load()
+
+    # Never upscale: widths beyond the photo's short side collapse into one
+    side = min(image.size)
+    widths = sorted({min(width, side) for width in IMAGE_VARIANT_WIDTHS})
+
+    folder = os.path.join(upload_folder, variant_dir(sha256))
+    os.makedirs(folder, exist_ok=True)
+
+    srcset = {}
+    for mime, suffix, pil_format, options in FORMATS:
+        entries = []
+        for width in widths:
+            square = ImageOps.fit(image, (width, width), Image.LANCZOS)
+            if pil_format == 'JPEG':
+                square = flatten(square)
+            name = variant_name(width, suffix)
+            tmp_path = os.path.join(folder, f'.{name}.tmp')
+            square.save(tmp_path, pil_format, **options)
+            os.replace(tmp_path, os.path.join(folder, name))
+            entries.append(f'{variant_url(sha256, name)} {width}w')
+        srcset[mime] = ', '.join(entries)
+
+    fallback = min(widths, key=lambda width: abs(width - IMAGE_VARIANT_WIDTHS[0]))
+    return {'src': variant_url(sha256, variant_name(fallback, 'jpg')), 'srcset': srcset}
+
+
+def attach_variants(testimonials, variants_for):
+    """Copy ready variants onto testimonial dicts whose image is a blob; returns whether any changed"""
+    changed = False
+    for testimonial in testimonials:
+        variants = variants_for(testimonial.get('image'))
+        if variants and testimonial.get('variants') != variants:
+            testimonial['variants'] = variants
+            changed = True
+    return changed
+
+
+def ready_variants(cursor, testimonials):
+    """{image url: variants} for the finished jobs behind ``testimonials``"""
+    ready = {}
+    for testimonial in testimonials:
+        url = testimonial.get('image') or ''
+        if not url.startswith('/blobs/'):
+            continue
+        sha256 = url[len('/blobs/'):].split('.', 1)[0]
+        cursor.execute("SELECT variants FROM image_jobs WHERE sha256 = ? AND status = 'done'", (sha256,))
+        row = cursor.fetchone()
+        if row:
+            ready[url] = json.loads(row[0])
+    return ready
+
+
+def publish(conn, sha256, extension, variants):
+    """Record a finished job and add its variants to every testimonial showing the image"""
+    url = blob_url(sha256, extension)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('''
+            UPDATE image_jobs
+            SET status = 'done', variants = ?, last_error = NULL, finished_at = CURRENT_TIMESTAMP
+            WHERE sha256 = ?
+        ''', (json.dumps(variants), sha256))
+
+        rows = conn.execute('''
+            SELECT c.institute_id, c.testimonials
+            FROM uploads u
+            JOIN configurations c ON c.institute_id = u.institute_id
+            WHERE u.sha256 = ? AND u.kind = 'testimonial'
+            GROUP BY c.institute_id
+        ''', (sha256,)).fetchall()
+        for institute_id, raw in rows:
+            testimonials = json.loads(raw) if raw else []
+            # The trigger on configurations bumps the tenant version, so every
+            # worker drops its cached page
+            if attach_variants(testimonials, {url: variants}.get):
+                conn.execute('''
+                    UPDATE configurations SET testimonials = ? WHERE institute_id = ?
+                ''', (json.dumps(testimonials), institute_id))
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def claim_next(conn):
+    """Lease the oldest due job to this worker; returns (sha256, extension, attempts) or None"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute('''
+            SELECT sha256, extension, attempts + 1
+            FROM image_jobs
+            WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+            ORDER BY next_attempt_at
+            LIMIT 1
+        ''').fetchone()
+        if row:
+            conn.execute('''
+                UPDATE image_jobs
+                SET attempts = attempts + 1, next_attempt_at = datetime('now', ?)
+                WHERE sha256 = ?
+            ''', (f'+{IMAGE_LEASE_SECONDS} seconds', row[0]))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return row
+
+
+def process_next(conn):
+    """Render one due job; returns False when nothing was due"""
+    job = claim_next(conn)
+    if job is None:
+        return False
+
+    sha256, extension, attempts = job
+    try:
+        variants = render_variants(sha256, extension)
+    except Exception as e:
+        # Unreadable or oversized images keep being served as uploaded
+        status = 'failed' if attempts >= IMAGE_MAX_ATTEMPTS else 'pending'
+        conn.execute('''
+            UPDATE image_jobs SET status = ?, last_error = ? WHERE sha256 = ?
+        ''', (status, str(e), sha256))
+        conn.commit()
+        print(f"[IMAGES] {sha256[:12]} attempt {attempts} failed: {e}")
+        return True
+
+    publish(conn, sha256, extension, variants)
+    print(f"[IMAGES] {sha256[:12]} -> {len(variants['srcset'])} formats")
+    return True
+
+
+def run_worker():
+    """Process image jobs until SIGTERM/SIGINT"""
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *args: stopping.append(True))
+
+    conn = get_connection()
+    migrate(conn)
+    print(f"[IMAGES] Worker started (widths {IMAGE_VARIANT_WIDTHS}, poll {IMAGE_POLL_INTERVAL}s)")
+
+    while not stopping:
+        try:
+            worked = process_next(conn)
+        except Exception as e:
+            print(f"[IMAGES] Job failed: {e}")
+            worked = False
+        if not worked:
+            time.sleep(IMAGE_POLL_INTERVAL)
+
+    print("[IMAGES] Worker stopped")
+
+
+def main(args):
+    if '--once' in args:
+        conn = get_connection()
+        migrate(conn)
+        processed = 0
+        while process_next(conn):
+            processed += 1
+        print(f"Processed {processed} images")
+    else:
+        run_worker()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,40 @@
+"""
+Normalized email and phone keys for recognising a returning aspirant
+
+registrations and pdf_downloads carry ``email_key`` and ``phone_key`` next to
+what the aspirant typed, with a unique index on (institute_id, email_key,
+phone_key). A double-click, a refresh or the same aspirant coming back finds
+the existing row with one indexed lookup instead of inserting again and
+re-sending the owner's notification.
+"""
+
+import os
+import re
+
+# Country code assumed for numbers entered without one (10-digit Indian mobiles)
+DEFAULT_COUNTRY_CODE = os.environ.get('DEFAULT_COUNTRY_CODE', '91')
+
+
+def email_key(email):
+    """Trimmed, lowercased email"""
+    return (email or '').strip().lower()
+
+
+def phone_key(phone):
+    """E.164-style digits (country code included, no +) for a phone number as typed"""
+    phone = (phone or '').strip()
+    digits = re.sub(r'\D', '', phone)
+    if phone.startswith('+'):
+        return digits
+    if digits.startswith('00'):
+        return digits[2:]
+    if len(digits) == 11 and digits.startswith('0'):
+        digits = digits[1:]
+    if len(digits) == 10:
+        return DEFAULT_COUNTRY_CODE + digits
+    return digits
+
+
+def lead_keys(email, phone):
+    """(email_key, phone_key) as stored on registrations and pdf_downloads"""
+    return email_key(email), phone_key(phone)
@@ -0,0 +1,71 @@
+"""
+Prefix search over an institute's aspirant leads using the lead_search FTS5 index
+
+Every word typed is matched as a prefix of a word in the name, email or
+phone, and all words must match. A query that looks like a phone number is
+collapsed to its digits first. Results come newest first, paged on the index
+rowid, so each page reads only the entries it returns.
+"""
+
+import os
+import re
+
+SEARCH_PAGE_SIZE = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+SEARCH_MAX_TERMS = 8
+
+PHONE_QUERY = re.compile(r'[\d\s()+-]+')
+KINDS = ('registration', 'download')
+
+
+def match_expression(institute_id, query):
+    """FTS5 MATCH string for ``query`` inside one institute, or None if it has no searchable words"""
+    if PHONE_QUERY.fullmatch(query) and re.search(r'\d', query):
+        terms = [re.sub(r'\D', '', query)]
+    else:
+        terms = re.findall(r'\w+', query.lower())[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    prefixes = ' '.join(f'"{term}"*' for term in terms)
+    return f'tenant : "t{int(institute_id)}" AND {{name email phone}} : ({prefixes})'
+
+
+def search_leads(cursor, institute_id, query, page_size=SEARCH_PAGE_SIZE, before=None):
+    """One page of matching leads, newest first; returns (results, next_cursor) or None for an empty query"""
+    expression = match_expression(institute_id, query)
+    if expression is None:
+        return None
+
+    cursor.execute('''
+        SELECT rowid FROM lead_search
+        WHERE lead_search MATCH ? AND rowid < ?
+        ORDER BY rowid DESC
+        LIMIT ?
+    ''', (expression, before if before is not None else 2 ** 63 - 1, page_size + 1))
+    rowids = [row[0] for row in cursor.fetchall()]
+    next_cursor = rowids[page_size - 1] if len(rowids) > page_size else None
+
+    results = []
+    for rowid in rowids[:page_size]:
+        kind = KINDS[rowid % 2]
+        if kind == 'registration':
+            cursor.execute('''
+                SELECT id, name, email, phone, registered_at, payment_status FROM registrations
+                WHERE id = ? AND institute_id = ?
+            ''', (rowid // 2, institute_id))
+        else:
+            cursor.execute('''
+                SELECT id, name, email, phone, downloaded_at, NULL FROM pdf_downloads
+                WHERE id = ? AND institute_id = ?
+            ''', (rowid // 2, institute_id))
+        row = cursor.fetchone()
+        if row:
+            results.append({
+                'kind': kind,
+                'id': row[0],
+                'name': row[1],
+                'email': row[2],
+                'phone': row[3],
+                'date': row[4],
+                'payment_status': row[5],
+            })
+    return results, next_cursor
@@ -0,0 +1,749 @@
+"""
+Versioned schema migrations
+
+Every database records how many migrations have been applied to it in
+``PRAGMA user_version``. migrate() compares that single integer with the
+length of the migration list, so an up-to-date database is checked with one
+read and without taking the write lock. Pending steps run in order, each in
+its own IMMEDIATE transaction that also bumps user_version, and every step is
+written to be idempotent so pre-versioning databases upgrade cleanly.
+
+Append new steps to the end of a list; never reorder or edit shipped ones.
+"""
+
+import json
+
+from lead_keys import lead_keys
+from werkzeug.security import generate_password_hash
+
+
+def create_core_tables(cursor):
+    """Institutes, configurations, registrations, PDF downloads and IT admins"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS institutes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            institute_name TEXT NOT NULL,
+            offer_text TEXT,
+            upi_id TEXT,
+            email TEXT,
+            amount DECIMAL(10,2) DEFAULT 1000,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS configurations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            institute_id INTEGER,
+            why_choose_us TEXT,
+            pdf_title TEXT,
+            pdf_filename TEXT,
+            testimonials TEXT,
+            FOREIGN KEY (institute_id) REFERENCES institutes (id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS registrations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            institute_id INTEGER,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            payment_status TEXT DEFAULT 'pending',
+            payment_id TEXT,
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (institute_id) REFERENCES institutes (id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pdf_downloads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            institute_id INTEGER,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            downloaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (institute_id) REFERENCES institutes (id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS it_admins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def add_institute_columns(cursor):
+    """Course amount and enable/disable flag for databases created before they existed"""
+    cursor.execute('PRAGMA table_info(institutes)')
+    columns = [column[1] for column in cursor.fetchall()]
+
+    if 'amount' not in columns:
+        cursor.execute('ALTER TABLE institutes ADD COLUMN amount DECIMAL(10,2) DEFAULT 1000')
+
+    if 'is_active' not in columns:
+        cursor.execute('ALTER TABLE institutes ADD COLUMN is_active BOOLEAN DEFAULT TRUE')
+
+
+def create_default_it_admin(cursor):
+    """Default IT admin (itadmin / itadmin123) when none exists"""
+    cursor.execute('SELECT COUNT(*) FROM it_admins')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('''
+            INSERT INTO it_admins (username, password_hash)
+            VALUES (?, ?)
+        ''', ('itadmin', generate_password_hash('itadmin123')))
+
+
+def repair_testimonials(cursor):
+    """Normalize configurations.testimonials to clean JSON arrays; returns rows rewritten"""
+    cursor.execute('SELECT id, testimonials FROM configurations')
+    configs = cursor.fetchall()
+
+    fixed_count = 0
+    for config_id, testimonials in configs:
+        try:
+            parsed = json.loads(testimonials) if testimonials else []
+            clean_json = json.dumps(parsed if isinstance(parsed, list) else [])
+        except (json.JSONDecodeError, TypeError):
+            clean_json = '[]'
+
+        if clean_json != testimonials:
+            cursor.execute('''
+                UPDATE configurations
+                SET testimonials = ?
+                WHERE id = ?
+            ''', (clean_json, config_id))
+            fixed_count += 1
+
+    return fixed_count
+
+
+def create_tenant_indexes(cursor):
+    """Secondary indexes for the per-institute lookups on the request path"""
+    # Older databases may hold several configuration rows per institute; the
+    # app always updated them together, so the oldest one is kept
+    cursor.execute('''
+        DELETE FROM configurations
+        WHERE institute_id IS NOT NULL
+          AND id NOT IN (SELECT MIN(id) FROM configurations GROUP BY institute_id)
+    ''')
+
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_configurations_institute
+        ON configurations (institute_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_institutes_active_username
+        ON institutes (is_active, username)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_institutes_created_at
+        ON institutes (created_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_registrations_institute_registered
+        ON registrations (institute_id, registered_at, id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_pdf_downloads_institute_downloaded
+        ON pdf_downloads (institute_id, downloaded_at)
+    ''')
+
+
+def create_registration_status_index(cursor):
+    """Covering index for the per-institute payment status counts"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_registrations_institute_status
+        ON registrations (institute_id, payment_status)
+    ''')
+
+
+def create_tenant_versions(cursor):
+    """Per-institute change versions, bumped by triggers in the writing transaction"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tenant_versions (
+            institute_id INTEGER PRIMARY KEY,
+            username TEXT,
+            version INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tenant_versions_version
+        ON tenant_versions (version)
+    ''')
+
+    # Versions come from one platform-wide sequence so a worker can ask for
+    # everything newer than the highest version it has already seen
+    bump = '''
+        INSERT INTO tenant_versions (institute_id, username, version, updated_at)
+        VALUES ({institute_id}, {username},
+                (SELECT COALESCE(MAX(version), 0) + 1 FROM tenant_versions), CURRENT_TIMESTAMP)
+        ON CONFLICT (institute_id) DO UPDATE
+        SET username = excluded.username, version = excluded.version, updated_at = excluded.updated_at;
+    '''
+    triggers = {
+        ('institutes', 'INSERT'): ('NEW.id', 'NEW.username'),
+        ('institutes', 'UPDATE'): ('NEW.id', 'NEW.username'),
+        ('institutes', 'DELETE'): ('OLD.id', 'OLD.username'),
+        ('configurations', 'INSERT'): (
+            'NEW.institute_id', '(SELECT username FROM institutes WHERE id = NEW.institute_id)'),
+        ('configurations', 'UPDATE'): (
+            'NEW.institute_id', '(SELECT username FROM institutes WHERE id = NEW.institute_id)'),
+        ('configurations', 'DELETE'): (
+            'OLD.institute_id', '(SELECT username FROM institutes WHERE id = OLD.institute_id)'),
+    }
+    for (table, event), (institute_id, username) in triggers.items():
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+            AFTER {event} ON {table}
+            WHEN {institute_id} IS NOT NULL
+            BEGIN
+                {bump.format(institute_id=institute_id, username=username)}
+            END
+        ''')
+
+
+def seed_tenant_versions(cursor):
+    """Give institutes created before tenant_versions existed a version row"""
+    cursor.execute('''
+        INSERT OR IGNORE INTO tenant_versions (institute_id, username, version, updated_at)
+        SELECT id, username,
+               (SELECT COALESCE(MAX(version), 0) FROM tenant_versions) + id,
+               COALESCE(created_at, CURRENT_TIMESTAMP)
+        FROM institutes
+    ''')
+
+
+def create_email_outbox(cursor):
+    """Outgoing mail, written with the row that triggered it and drained by email_outbox.py"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            institute_id INTEGER,
+            kind TEXT,
+            to_email TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_email_outbox_due
+        ON email_outbox (status, next_attempt_at)
+    ''')
+
+
+def add_notification_digest(cursor):
+    """Per-institute owner notification digest interval (0 = send immediately)"""
+    cursor.execute('PRAGMA table_info(institutes)')
+    columns = [column[1] for column in cursor.fetchall()]
+
+    if 'notification_digest_minutes' not in columns:
+        cursor.execute('ALTER TABLE institutes ADD COLUMN notification_digest_minutes INTEGER DEFAULT 0')
+
+
+def create_upload_store(cursor):
+    """Content-addressed upload blobs and the tenant filenames that reference them"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_blobs (
+            sha256 TEXT PRIMARY KEY,
+            extension TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            unreferenced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS uploads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            institute_id INTEGER,
+            kind TEXT NOT NULL,
+            filename TEXT UNIQUE NOT NULL,
+            sha256 TEXT NOT NULL REFERENCES upload_blobs (sha256),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_uploads_institute_kind
+        ON uploads (institute_id, kind)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_upload_blobs_unreferenced
+        ON upload_blobs (unreferenced_at) WHERE refcount = 0
+    ''')
+
+    # refcount always equals the number of uploads rows pointing at the blob
+    acquire = '''
+        UPDATE upload_blobs SET refcount = refcount + 1, unreferenced_at = NULL
+        WHERE sha256 = NEW.sha256;
+    '''
+    release = '''
+        UPDATE upload_blobs
+        SET refcount = refcount - 1,
+            unreferenced_at = CASE WHEN refcount = 1 THEN CURRENT_TIMESTAMP END
+        WHERE sha256 = OLD.sha256;
+    '''
+    triggers = {
+        'insert': ('AFTER INSERT ON uploads', acquire),
+        'delete': ('AFTER DELETE ON uploads', release),
+        'update': ('AFTER UPDATE OF sha256 ON uploads WHEN OLD.sha256 != NEW.sha256', release + acquire),
+    }
+    for event, (timing, body) in triggers.items():
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_uploads_{event}_refcount
+            {timing}
+            BEGIN
+                {body}
+            END
+        ''')
+
+
+def create_image_jobs(cursor):
+    """Testimonial images waiting for (or holding) their resized variants, one row per blob"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_jobs (
+            sha256 TEXT PRIMARY KEY,
+            extension TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            variants TEXT,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_image_jobs_due
+        ON image_jobs (status, next_attempt_at)
+    ''')
+    # Finding the institutes that show an image once its variants are ready
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_uploads_sha256
+        ON uploads (sha256)
+    ''')
+
+
+def create_job_watermarks(cursor):
+    """Where incremental maintenance jobs (payment reconciliation, ...) stopped last time"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_watermarks (
+            job TEXT PRIMARY KEY,
+            watermark TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def create_payment_tables(cursor):
+    """Payment transactions and raw gateway webhooks"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payment_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            registration_id INTEGER NOT NULL,
+            institute_id INTEGER NOT NULL,
+            amount DECIMAL(10,2) NOT NULL,
+            currency TEXT DEFAULT 'INR',
+            payment_method TEXT,
+            gateway_payment_id TEXT,
+            gateway_order_id TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payment_webhooks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            gateway TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            processed BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def prepare_webhook_ingestion(cursor):
+    """Gateway event ids for deduplicating retries, processing results and lookup indexes"""
+    cursor.execute('PRAGMA table_info(payment_webhooks)')
+    columns = [column[1] for column in cursor.fetchall()]
+
+    if 'event_id' not in columns:
+        cursor.execute('ALTER TABLE payment_webhooks ADD COLUMN event_id TEXT')
+    if 'processed_at' not in columns:
+        cursor.execute('ALTER TABLE payment_webhooks ADD COLUMN processed_at TIMESTAMP')
+    if 'last_error' not in columns:
+        cursor.execute('ALTER TABLE payment_webhooks ADD COLUMN last_error TEXT')
+
+    # A redelivered event is ignored by the insert instead of stored twice
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_payment_webhooks_event
+        ON payment_webhooks (gateway, event_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_payment_webhooks_unprocessed
+        ON payment_webhooks (id) WHERE processed = FALSE
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_payment_transactions_order
+        ON payment_transactions (gateway_order_id)
+    ''')
+
+
+def create_transaction_updated_index(cursor):
+    """Lets reconciliation walk transactions changed since its watermark"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_payment_transactions_updated
+        ON payment_transactions (updated_at, id)
+    ''')
+
+
+# Rollup triggers: name part -> (event, condition, deltas for one row change)
+_PAID = "(NEW.payment_status IS 'completed')"
+STATS_TRIGGERS = {
+    'registrations_insert': (
+        'AFTER INSERT ON registrations', 'NEW.institute_id IS NOT NULL',
+        dict(institute_id='NEW.institute_id', day='NEW.registered_at',
+             registrations=1, payments=_PAID, downloads=0)),
+    'registrations_paid': (
+        'AFTER UPDATE OF payment_status ON registrations',
+        f"NEW.institute_id IS NOT NULL AND (OLD.payment_status IS 'completed') != {_PAID}",
+        dict(institute_id='NEW.institute_id', day='NEW.registered_at',
+             registrations=0, payments=f"(CASE WHEN {_PAID} THEN 1 ELSE -1 END)", downloads=0)),
+    'registrations_delete': (
+        'AFTER DELETE ON registrations', 'OLD.institute_id IS NOT NULL',
+        dict(institute_id='OLD.institute_id', day='OLD.registered_at',
+             registrations=-1, payments="-(OLD.payment_status IS 'completed')", downloads=0)),
+    'pdf_downloads_insert': (
+        'AFTER INSERT ON pdf_downloads', 'NEW.institute_id IS NOT NULL',
+        dict(institute_id='NEW.institute_id', day='NEW.downloaded_at',
+             registrations=0, payments=0, downloads=1)),
+}
+
+
+def create_stats_triggers(cursor, suffix, bump):
+    """One trigger per STATS_TRIGGERS entry running ``bump`` with that change's deltas"""
+    for name, (event, condition, values) in STATS_TRIGGERS.items():
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{name}_{suffix}
+            {event}
+            WHEN {condition}
+            BEGIN
+                {bump.format(**values)}
+            END
+        ''')
+
+
+def create_daily_stats(cursor):
+    """Per-institute daily funnel counts, kept current by triggers on the raw tables"""
+    # Payments and revenue are counted on the day the aspirant registered, so
+    # payments / registrations for any range is that cohort's conversion rate
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            institute_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            registrations INTEGER NOT NULL DEFAULT 0,
+            payments INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            downloads INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (institute_id, day)
+        ) WITHOUT ROWID
+    ''')
+
+    bump = '''
+        INSERT INTO daily_stats (institute_id, day, registrations, payments, revenue, downloads)
+        VALUES ({institute_id}, date(COALESCE({day}, CURRENT_TIMESTAMP)), {registrations}, {payments},
+                {payments} * COALESCE((SELECT amount FROM institutes WHERE id = {institute_id}), 0), {downloads})
+        ON CONFLICT (institute_id, day) DO UPDATE
+        SET registrations = registrations + excluded.registrations,
+            payments = payments + excluded.payments,
+            revenue = revenue + excluded.revenue,
+            downloads = downloads + excluded.downloads;
+    '''
+    create_stats_triggers(cursor, 'stats', bump)
+
+
+def backfill_daily_stats(cursor):
+    """Rebuild daily_stats from registrations and pdf_downloads"""
+    cursor.execute('DELETE FROM daily_stats')
+    cursor.execute('''
+        INSERT INTO daily_stats (institute_id, day, registrations, payments, revenue, downloads)
+        SELECT institute_id, day, SUM(registrations), SUM(payments), SUM(revenue), SUM(downloads)
+        FROM (
+            SELECT r.institute_id, date(COALESCE(r.registered_at, CURRENT_TIMESTAMP)) AS day,
+                   1 AS registrations, r.payment_status IS 'completed' AS payments,
+                   CASE WHEN r.payment_status IS 'completed' THEN COALESCE(i.amount, 0) ELSE 0 END AS revenue,
+                   0 AS downloads
+            FROM registrations r
+            LEFT JOIN institutes i ON i.id = r.institute_id
+            WHERE r.institute_id IS NOT NULL
+            UNION ALL
+            SELECT institute_id, date(COALESCE(downloaded_at, CURRENT_TIMESTAMP)), 0, 0, 0, 1
+            FROM pdf_downloads
+            WHERE institute_id IS NOT NULL
+        )
+        GROUP BY institute_id, day
+    ''')
+
+
+def create_institute_stats(cursor):
+    """Running per-institute totals for the IT dashboard, maintained like daily_stats"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS institute_stats (
+            institute_id INTEGER PRIMARY KEY,
+            registrations INTEGER NOT NULL DEFAULT 0,
+            payments INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            downloads INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # The dashboard sorts on any counter and reads one page in index order
+    for column in ('registrations', 'payments', 'revenue', 'downloads'):
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_institute_stats_{column}
+            ON institute_stats ({column}, institute_id)
+        ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_institutes_name
+        ON institutes (institute_name COLLATE NOCASE, id)
+    ''')
+
+    bump = '''
+        INSERT INTO institute_stats (institute_id, registrations, payments, revenue, downloads)
+        VALUES ({institute_id}, {registrations}, {payments},
+                {payments} * COALESCE((SELECT amount FROM institutes WHERE id = {institute_id}), 0), {downloads})
+        ON CONFLICT (institute_id) DO UPDATE
+        SET registrations = registrations + excluded.registrations,
+            payments = payments + excluded.payments,
+            revenue = revenue + excluded.revenue,
+            downloads = downloads + excluded.downloads;
+    '''
+    create_stats_triggers(cursor, 'totals', bump)
+
+    # Every institute has a row, so the dashboard can inner join on it
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_institutes_insert_totals
+        AFTER INSERT ON institutes
+        BEGIN
+            INSERT OR IGNORE INTO institute_stats (institute_id) VALUES (NEW.id);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_institutes_delete_totals
+        AFTER DELETE ON institutes
+        BEGIN
+            DELETE FROM institute_stats WHERE institute_id = OLD.id;
+        END
+    ''')
+
+
+def backfill_institute_stats(cursor):
+    """Rebuild institute_stats from daily_stats"""
+    cursor.execute('DELETE FROM institute_stats')
+    cursor.execute('''
+        INSERT INTO institute_stats (institute_id, registrations, payments, revenue, downloads)
+        SELECT i.id, COALESCE(SUM(d.registrations), 0), COALESCE(SUM(d.payments), 0),
+               COALESCE(SUM(d.revenue), 0), COALESCE(SUM(d.downloads), 0)
+        FROM institutes i
+        LEFT JOIN daily_stats d ON d.institute_id = i.id
+        GROUP BY i.id
+    ''')
+
+
+# Digits of a phone number, then its last ten digits, so "+91 98765-43210"
+# is found by both 9198765... and 98765...
+_PHONE_DIGITS = "replace(replace(replace(replace(replace({phone}, ' ', ''), '-', ''), '+', ''), '(', ''), ')', '')"
+_PHONE_TOKENS = f"{_PHONE_DIGITS} || ' ' || substr({_PHONE_DIGITS}, -10)"
+
+
+def create_lead_search(cursor):
+    """FTS5 index over the name, email and phone of registrations and PDF-download leads"""
+    # rowid = source id * 2, plus 1 for pdf_downloads. ``tenant`` holds a
+    # single "t<institute id>" token so a search is scoped inside the index.
+    # Prefix indexes up to six characters keep "sharma"* from merging the
+    # doclists of every sharma123-style email token.
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS lead_search
+        USING fts5(tenant, name, email, phone, tokenize = 'unicode61', prefix = '2 3 4 5 6')
+    ''')
+
+    for table, kind in (('registrations', 0), ('pdf_downloads', 1)):
+        insert = f'''
+            INSERT INTO lead_search (rowid, tenant, name, email, phone)
+            VALUES (NEW.id * 2 + {kind}, 't' || NEW.institute_id, NEW.name, NEW.email,
+                    {_PHONE_TOKENS.format(phone='NEW.phone')});
+        '''
+        delete = f"DELETE FROM lead_search WHERE rowid = OLD.id * 2 + {kind};"
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_insert_search
+            AFTER INSERT ON {table}
+            BEGIN
+                {insert}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_update_search
+            AFTER UPDATE OF institute_id, name, email, phone ON {table}
+            BEGIN
+                {delete}
+                {insert}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_delete_search
+            AFTER DELETE ON {table}
+            BEGIN
+                {delete}
+            END
+        ''')
+
+        cursor.execute(f'''
+            INSERT INTO lead_search (rowid, tenant, name, email, phone)
+            SELECT id * 2 + {kind}, 't' || institute_id, name, email, {_PHONE_TOKENS.format(phone='phone')}
+            FROM {table}
+        ''')
+
+
+def add_lead_keys(cursor):
+    """Normalized email/phone keys, unique per institute, on registrations and pdf_downloads"""
+    for table in ('registrations', 'pdf_downloads'):
+        cursor.execute(f'PRAGMA table_info({table})')
+        columns = [column[1] for column in cursor.fetchall()]
+        if 'email_key' not in columns:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN email_key TEXT')
+        if 'phone_key' not in columns:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN phone_key TEXT')
+
+        # Existing duplicates are kept; only the oldest row of each gets the keys
+        # (NULL keys never conflict in a unique index)
+        seen = set()
+        keys = []
+        cursor.execute(f'SELECT id, institute_id, email, phone FROM {table} WHERE email_key IS NULL ORDER BY id')
+        for row_id, institute_id, email, phone in cursor.fetchall():
+            key = (institute_id,) + lead_keys(email, phone)
+            if key not in seen:
+                seen.add(key)
+                keys.append(key[1:] + (row_id,))
+        cursor.executemany(f'UPDATE {table} SET email_key = ?, phone_key = ? WHERE id = ?', keys)
+
+        cursor.execute(f'''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_lead_key
+            ON {table} (institute_id, email_key, phone_key)
+        ''')
+
+
+def create_rate_buckets(cursor):
+    """Token buckets shared by every worker (rate_limit.SQLiteBuckets)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rate_buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_rate_buckets_updated
+        ON rate_buckets (updated)
+    ''')
+
+
+def create_login_failures(cursor):
+    """Consecutive failed logins per username for the login back-off (rate_limit.failures)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS login_failures (
+            key TEXT PRIMARY KEY,
+            failures INTEGER NOT NULL,
+            updated REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_login_failures_updated
+        ON login_failures (updated)
+    ''')
+
+
+# coach_saas.db
+MIGRATIONS = [
+    create_core_tables,
+    add_institute_columns,
+    create_default_it_admin,
+    repair_testimonials,
+    create_tenant_indexes,
+    create_registration_status_index,
+    create_tenant_versions,
+    seed_tenant_versions,
+    create_email_outbox,
+    add_notification_digest,
+    create_upload_store,
+    create_image_jobs,
+    create_job_watermarks,
+    create_daily_stats,
+    backfill_daily_stats,
+    create_institute_stats,
+    backfill_institute_stats,
+    create_lead_search,
+    add_lead_keys,
+]
+
+# payments.db
+PAYMENT_MIGRATIONS = [
+    create_payment_tables,
+    prepare_webhook_ingestion,
+    create_transaction_updated_index,
+]
+
+# ratelimit.db
+RATE_LIMIT_MIGRATIONS = [
+    create_rate_buckets,
+    create_login_failures,
+]
+
+
+def schema_version(conn):
+    """Number of migrations already applied to ``conn``"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Apply pending migrations in order; returns the names of the steps applied"""
+    if schema_version(conn) >= len(migrations):
+        return []
+
+    applied = []
+    for version, migration in enumerate(migrations, start=1):
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another worker may have migrated while we waited for the lock
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            migration(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(migration.__name__)
+
+    return applied
@@ -0,0 +1,157 @@
+"""
+In-process LRU cache for rendered public pages
+
+Entries are keyed by institute username and hold the parsed institute dict
+plus the rendered HTML for each URL it was requested under (/institute/ and
+/coaching/, per host). Writers call invalidate() for the username they
+changed; the least recently used institutes are evicted once the cache is
+full.
+
+Other gunicorn workers learn about those writes through TenantVersionWatcher,
+which follows the trigger-maintained ``tenant_versions`` table.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+INSTITUTE_PAGE_CACHE_SIZE = int(os.environ.get('INSTITUTE_PAGE_CACHE_SIZE', 1024))
+
+# Distinct URLs kept per institute; anything beyond this is rendered uncached
+MAX_VARIANTS_PER_ENTRY = 8
+
+
+class PageCache:
+    """Thread-safe, bounded LRU of {username: {'institute': dict, 'pages': {url: html}}}"""
+
+    def __init__(self, max_entries=INSTITUTE_PAGE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._generation = 0
+
+    def generation(self):
+        """Token to pass to put(); a put is dropped if anything was invalidated since"""
+        with self._lock:
+            return self._generation
+
+    def get_institute(self, username):
+        """Cached institute dict for ``username`` or None"""
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            self._entries.move_to_end(username)
+            return entry['institute']
+
+    def get_page(self, username, url):
+        """Cached HTML for ``username`` rendered at ``url`` or None; counts hits and misses"""
+        with self._lock:
+            entry = self._entries.get(username)
+            html = entry['pages'].get(url) if entry else None
+            if html is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return html
+
+    def put(self, username, institute, url=None, html=None, generation=None):
+        """Store the parsed institute and, optionally, one rendered page for it"""
+        with self._lock:
+            # The data was read before a concurrent write invalidated it
+            if generation is not None and generation != self._generation:
+                return
+
+            entry = self._entries.get(username)
+            if entry is None or entry['institute'] is not institute:
+                entry = {'institute': institute, 'pages': {}}
+                self._entries[username] = entry
+            self._entries.move_to_end(username)
+
+            if url is not None and len(entry['pages']) < MAX_VARIANTS_PER_ENTRY:
+                entry['pages'][url] = html
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, username):
+        """Drop everything cached for ``username``"""
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(username, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+class TenantVersionWatcher:
+    """Replays tenant changes committed by other processes into local caches
+
+    check() costs one ``PRAGMA data_version`` while nobody else has written to
+    the database, and one indexed read of ``tenant_versions`` otherwise.
+    """
+
+    def __init__(self):
+        self._callbacks = []
+        self._watermark = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def on_change(self, callback):
+        """Call ``callback(institute_id, username)`` for every institute changed elsewhere"""
+        self._callbacks.append(callback)
+        return callback
+
+    def check(self, conn):
+        """Invalidate whatever changed since the last check"""
+        # data_version only moves when another connection commits
+        data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if getattr(self._local, 'conn', None) is conn and self._local.data_version == data_version:
+            return
+        self._local.conn = conn
+        self._local.data_version = data_version
+
+        with self._lock:
+            if self._watermark is None:
+                # Nothing is cached before the first check, so start from now
+                row = conn.execute('SELECT MAX(version) FROM tenant_versions').fetchone()
+                self._watermark = row[0] or 0
+                return
+
+            changes = conn.execute(
+                'SELECT institute_id, username, version FROM tenant_versions WHERE version > ?', (self._watermark,)
+            ).fetchall()
+            for institute_id, username, version in changes:
+                for callback in self._callbacks:
+                    callback(institute_id, username)
+                self._watermark = max(self._watermark, version)
+
+
+institute_pages = PageCache()
+
+tenant_versions = TenantVersionWatcher()
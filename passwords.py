@@ -0,0 +1,128 @@
+"""
+Password hashing on a small, bounded process pool
+
+Hashing is slow and CPU-bound on purpose. Run inline, a burst of logins (or
+a credential-stuffing run) would occupy every web worker and stall the
+public pages. Instead each web worker sends hashes to its own pool of
+PASSWORD_HASH_WORKERS processes, started lazily and run at a lower CPU
+priority. Once PASSWORD_HASH_MAX_PENDING hashes are waiting or running,
+further attempts fail fast with HashingBusy rather than queueing; a hash the
+caller stopped waiting for keeps its slot until it finishes. Keep that limit
+below GUNICORN_THREADS so a login burst always leaves threads free for
+pages. A pool whose process died (OOM killer, SIGKILL) is replaced.
+
+PASSWORD_HASH_METHOD is a full werkzeug method spec, e.g.
+``pbkdf2:sha256:600000`` or ``scrypt:32768:8:1``. A successful login
+checked against a hash made with a different method is rehashed with the
+current one in the same pool call, so raising the cost takes effect as
+users log in.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 1))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 2))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+PASSWORD_HASH_NICE = int(os.environ.get('PASSWORD_HASH_NICE', 10))
+
+
+class HashingBusy(Exception):
+    """PASSWORD_HASH_MAX_PENDING hashes are already queued in this worker"""
+
+
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != PASSWORD_HASH_METHOD
+
+
+def verify_and_rehash(password_hash, password):
+    """(matches, new hash or None); runs in the pool"""
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if needs_rehash(password_hash):
+        return True, generate_password_hash(password, PASSWORD_HASH_METHOD)
+    return True, None
+
+
+def make_hash(password):
+    return generate_password_hash(password, PASSWORD_HASH_METHOD)
+
+
+def lower_priority():
+    os.nice(PASSWORD_HASH_NICE)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+
+
+def pool():
+    """This process's hashing pool; a forked worker starts its own"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            # spawn, not fork: the web worker may be multi-threaded
+            _pool = ProcessPoolExecutor(PASSWORD_HASH_WORKERS, multiprocessing.get_context('spawn'),
+                                        initializer=lower_priority)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def discard_pool(broken):
+    """Forget ``broken`` so the next call starts a fresh pool"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is broken:
+            _pool = _pool_pid = None
+    broken.shutdown(wait=False)
+
+
+def submit(function, *args):
+    """Submit to the pool, replacing it once if a dead process broke it"""
+    for _ in range(2):
+        executor = pool()
+        try:
+            return executor, executor.submit(function, *args)
+        except BrokenProcessPool:
+            discard_pool(executor)
+    raise HashingBusy()
+
+
+def run(function, *args):
+    """Run ``function(*args)`` on the pool and wait for it; raises HashingBusy if the queue is full or stuck"""
+    if not _pending.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        executor, future = submit(function, *args)
+    except BaseException:
+        _pending.release()
+        raise
+    # The slot is freed when the hash is done or cancelled, not when we stop waiting
+    future.add_done_callback(lambda _: _pending.release())
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except TimeoutError:
+        future.cancel()
+        raise HashingBusy()
+    except BrokenProcessPool:
+        # The process died mid-hash; the next attempt gets a new pool
+        discard_pool(executor)
+        raise HashingBusy()
+
+
+def verify_password(password_hash, password):
+    """(matches, new hash to store or None) for ``password`` against ``password_hash``"""
+    return run(verify_and_rehash, password_hash, password)
+
+
+def hash_password(password):
+    """Hash ``password`` with PASSWORD_HASH_METHOD"""
+    return run(make_hash, password)
@@ -3,51 +3,33 @@ import os
 import json
 import uuid
 from datetime import datetime
-import sqlite3
 import hashlib
 import hmac
 
+from database import PAYMENTS_DATABASE, get_db, init_app as init_database
+from migrations import PAYMENT_MIGRATIONS, migrate
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('PAYMENT_SECRET_KEY', 'payment-secret-key')
 
+init_database(app)
+
 # Payment gateway configurations
 RAZORPAY_KEY_ID = os.environ.get('RAZORPAY_KEY_ID', 'rzp_test_key')
 RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET', 'rzp_test_secret')
+# No default: without the secret from the gateway dashboard webhooks are refused
+RAZORPAY_WEBHOOK_SECRET = os.environ.get('RAZORPAY_WEBHOOK_SECRET')
+
+if not RAZORPAY_WEBHOOK_SECRET:
+    print("[WEBHOOK] RAZORPAY_WEBHOOK_SECRET is not set; /webhook/razorpay will answer 503")
 
 def init_payment_db():
-    """Initialize payment database"""
-    conn = sqlite3.connect('payments.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS payment_transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            registration_id INTEGER NOT NULL,
-            institute_id INTEGER NOT NULL,
-            amount DECIMAL(10,2) NOT NULL,
-            currency TEXT DEFAULT 'INR',
-            payment_method TEXT,
-            gateway_payment_id TEXT,
-            gateway_order_id TEXT,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS payment_webhooks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            gateway TEXT NOT NULL,
-            event_type TEXT NOT NULL,
-            payload TEXT NOT NULL,
-            processed BOOLEAN DEFAULT FALSE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """Bring the payment database schema up to date"""
+    applied = migrate(get_db(PAYMENTS_DATABASE), PAYMENT_MIGRATIONS)
+    if applied:
+        print(f"[DB] Applied payment migrations: {', '.join(applied)}")
+
+init_payment_db()
 
 @app.route('/payment/create_order', methods=['POST'])
 def create_payment_order():
@@ -58,7 +40,7 @@ def create_payment_order():
         institute_id = data.get('institute_id')
         amount = data.get('amount', 1000)
         
-        conn = sqlite3.connect('payments.db')
+        conn = get_db(PAYMENTS_DATABASE)
         cursor = conn.cursor()
         
         order_id = f"order_{uuid.uuid4().hex[:12]}"
@@ -71,7 +53,6 @@ def create_payment_order():
         
         transaction_id = cursor.lastrowid
         conn.commit()
-        conn.close()
         
         return jsonify({
             'success': True,
@@ -93,37 +74,87 @@ def verify_payment():
         razorpay_payment_id = data.get('razorpay_payment_id')
         transaction_id = data.get('transaction_id')
         
-        conn = sqlite3.connect('payments.db')
+        conn = get_db(PAYMENTS_DATABASE)
         cursor = conn.cursor()
         
+        # Conditional write: a retried or concurrent verify cannot complete twice
         cursor.execute('''
             UPDATE payment_transactions 
             SET status = 'completed', 
                 gateway_payment_id = ?,
                 payment_method = 'razorpay',
                 updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
+            WHERE id = ? AND status != 'completed'
         ''', (razorpay_payment_id, transaction_id))
+        completed_now = cursor.rowcount == 1
         
         cursor.execute('''
-            SELECT registration_id, institute_id, amount 
+            SELECT registration_id, gateway_payment_id
             FROM payment_transactions 
             WHERE id = ?
         ''', (transaction_id,))
         
         transaction = cursor.fetchone()
         conn.commit()
-        conn.close()
+        
+        if transaction is None:
+            return jsonify({'success': False, 'error': 'Unknown transaction'}), 404
+        
+        # Repeats get the stored result; a different payment for a settled
+        # transaction is a conflict, not a second completion
+        if not completed_now and transaction[1] != razorpay_payment_id:
+            return jsonify({'success': False, 'error': 'Transaction already completed',
+                            'payment_id': transaction[1]}), 409
         
         return jsonify({
             'success': True,
-            'payment_id': razorpay_payment_id,
-            'registration_id': transaction[0] if transaction else None
+            'payment_id': transaction[1],
+            'registration_id': transaction[0],
+            'already_completed': not completed_now
         })
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def webhook_signature(payload, secret=None):
+    """Hex HMAC-SHA256 of the raw request body, as the gateway computes it"""
+    secret = secret or RAZORPAY_WEBHOOK_SECRET
+    return hmac.new(secret.encode(), payload, hashlib.sha256).hexdigest()
+
+def valid_signature(payload, signature):
+    """Constant-time check of the X-Razorpay-Signature header"""
+    try:
+        return hmac.compare_digest(webhook_signature(payload), signature)
+    except TypeError:
+        # compare_digest refuses non-ASCII strings; no real signature contains any
+        return False
+
+@app.route('/webhook/razorpay', methods=['POST'])
+def razorpay_webhook():
+    """Verify and store a gateway event; webhook_processor.py applies it later"""
+    if not RAZORPAY_WEBHOOK_SECRET:
+        return jsonify({'success': False, 'error': 'Webhooks are not configured'}), 503
+    
+    payload = request.get_data()
+    signature = request.headers.get('X-Razorpay-Signature', '')
+    if not valid_signature(payload, signature):
+        return jsonify({'success': False, 'error': 'Invalid signature'}), 400
+    
+    try:
+        event_type = json.loads(payload)['event']
+    except (ValueError, KeyError, TypeError):
+        return jsonify({'success': False, 'error': 'Malformed event'}), 400
+    
+    # Retries of an event we already hold cost one ignored insert
+    conn = get_db(PAYMENTS_DATABASE)
+    conn.execute('''
+        INSERT OR IGNORE INTO payment_webhooks (gateway, event_id, event_type, payload)
+        VALUES (?, ?, ?, ?)
+    ''', ('razorpay', request.headers.get('X-Razorpay-Event-Id'), event_type, payload.decode()))
+    conn.commit()
+    
+    return jsonify({'success': True})
+
 if __name__ == '__main__':
-    init_payment_db()
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    # Local development only; production runs under gunicorn (see Procfile_saas)
+    app.run(debug=False, port=int(os.environ.get('PORT', 5001)))
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""
+Registration payment state shared by every path that can complete a payment
+
+The aspirant's confirmation form, the gateway webhook processor and the
+reconciliation job all end in complete_registration(), so whichever gets
+there first sends the emails and the others become no-ops.
+"""
+
+from email_outbox import queue_email
+
+
+def complete_registration(cursor, registration_id, payment_id):
+    """Mark a registration paid and queue its emails, unless it already was; returns True if it was flipped
+
+    Runs in the caller's transaction. The conditional UPDATE takes the write
+    lock, so of any number of concurrent callers exactly one sees rowcount 1.
+    """
+    cursor.execute('''
+        UPDATE registrations
+        SET payment_status = 'completed', payment_id = ?
+        WHERE id = ? AND payment_status != 'completed'
+    ''', (payment_id, registration_id))
+    if cursor.rowcount == 0:
+        return False
+
+    cursor.execute('''
+        SELECT r.institute_id, r.name, r.email, r.phone, i.institute_name, i.email
+        FROM registrations r
+        JOIN institutes i ON r.institute_id = i.id
+        WHERE r.id = ?
+    ''', (registration_id,))
+    registration = cursor.fetchone()
+    if registration is None:
+        return True
+
+    institute_id, name, email, phone, institute_name, owner_email = registration
+
+    # Congratulations emails commit together with the status change
+    aspirant_subject = f"Payment Confirmed - Welcome to {institute_name}!"
+    aspirant_body = f"""
+    <h2>Congratulations {name}!</h2>
+    <p>Your payment has been confirmed and you are now enrolled with {institute_name}.</p>
+    <p>Payment ID: {payment_id}</p>
+    <p>We will contact you soon with further details.</p>
+    """
+
+    owner_subject = f"Payment Received - {name}"
+    owner_body = f"""
+    <h2>Payment Confirmation</h2>
+    <p>Student: {name}</p>
+    <p>Email: {email}</p>
+    <p>Phone: {phone}</p>
+    <p>Payment ID: {payment_id}</p>
+    <p>Status: Completed</p>
+    """
+
+    queue_email(cursor, email, aspirant_subject, aspirant_body, institute_id, 'aspirant_payment')
+    if owner_email:
+        queue_email(cursor, owner_email, owner_subject, owner_body, institute_id, 'owner_payment')
+    return True
@@ -3,47 +3,13 @@
 Quick fix for JSON parsing issues
 """
 
-import sqlite3
-import json
+from fix_database import fix_database
 
 def quick_fix():
     """Quick fix for testimonials JSON"""
     print("=== Quick Fix ===")
-    
-    conn = sqlite3.connect('coach_saas.db')
-    cursor = conn.cursor()
-    
-    # Get the problematic testimonials
-    cursor.execute('SELECT id, testimonials FROM configurations')
-    configs = cursor.fetchall()
-    
-    for config_id, testimonials in configs:
-        if testimonials:
-            try:
-                # Try to parse and re-save to ensure clean JSON
-                parsed = json.loads(testimonials)
-                clean_json = json.dumps(parsed)
-                
-                cursor.execute('''
-                    UPDATE configurations 
-                    SET testimonials = ? 
-                    WHERE id = ?
-                ''', (clean_json, config_id))
-                
-                print(f"Fixed config {config_id}")
-                
-            except Exception as e:
-                print(f"Error with config {config_id}: {e}")
-                # Set to empty array if parsing fails
-                cursor.execute('''
-                    UPDATE configurations 
-                    SET testimonials = ? 
-                    WHERE id = ?
-                ''', ('[]', config_id))
-    
-    conn.commit()
-    conn.close()
+    fix_database()
     print("Fix completed!")
 
 if __name__ == '__main__':
-    quick_fix()
\ No newline at end of file
+    quick_fix()
@@ -0,0 +1,290 @@
+"""
+Token-bucket rate limiting and admission control for the public write endpoints
+
+Each limited request takes one token from the bucket of its client IP and
+one from the bucket of the institute it targets. A bucket holds up to
+``requests`` tokens and refills at ``requests / seconds`` per second, so
+short bursts pass and sustained floods are refused. Refused requests get
+``429`` with ``Retry-After`` before they touch the main database. On top of
+that, a gunicorn worker answers ``429`` straight away once all but one of its
+threads are running public writes, instead of queueing more of them behind
+SQLite's write lock; the last thread stays free for pages.
+RATE_LIMIT_MAX_INFLIGHT lowers that cap (it never exceeds the thread count),
+or sets one for other servers; 0 disables it.
+
+Backends (RATE_LIMIT_BACKEND):
+    memory   buckets live in each worker process (default)
+    sqlite   buckets live in RATE_LIMIT_DATABASE, shared by every worker on
+             the host, so limits hold however many workers gunicorn runs
+    off      no rate limiting (admission control still applies)
+
+Limits are "requests/seconds" and can be overridden per scope and key, e.g.
+RATE_LIMIT_REGISTER_IP=5/60 or RATE_LIMIT_DOWNLOAD_INSTITUTE=300/60.
+
+The same backend (memory if limiting is off) keeps per-username login
+failure counts in ``failures``. After LOGIN_FREE_FAILURES failures within
+LOGIN_FAILURE_WINDOW seconds, each further failure locks the username out
+for twice as long as the previous one (from LOGIN_BACKOFF_SECONDS up to
+LOGIN_BACKOFF_MAX).
+
+Behind a reverse proxy set RATE_LIMIT_TRUSTED_PROXIES to the number of
+proxies that append to X-Forwarded-For (1 on Render); otherwise the socket
+peer is the client.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, request
+
+from database import RATE_LIMIT_DATABASE, get_connection
+from migrations import RATE_LIMIT_MIGRATIONS, migrate
+
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0))
+RATE_LIMIT_MAX_INFLIGHT = os.environ.get('RATE_LIMIT_MAX_INFLIGHT')
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000))
+
+LOGIN_FREE_FAILURES = int(os.environ.get('LOGIN_FREE_FAILURES', 5))
+LOGIN_FAILURE_WINDOW = int(os.environ.get('LOGIN_FAILURE_WINDOW', 900))
+LOGIN_BACKOFF_SECONDS = float(os.environ.get('LOGIN_BACKOFF_SECONDS', 1))
+LOGIN_BACKOFF_MAX = float(os.environ.get('LOGIN_BACKOFF_MAX', 900))
+
+# Shared buckets idle this long are full again and can be dropped
+RATE_LIMIT_PRUNE_SECONDS = 3600
+RATE_LIMIT_PRUNE_EVERY = 1000
+
+
+def limit_setting(scope, key, default):
+    """(requests, seconds) for ``scope``/``key`` from RATE_LIMIT_<SCOPE>_<KEY> or ``default``"""
+    value = os.environ.get(f'RATE_LIMIT_{scope}_{key}'.upper())
+    if not value:
+        return default
+    requests, seconds = value.split('/')
+    return int(requests), float(seconds)
+
+
+# scope -> {bucket key: (requests, seconds)}
+RATE_LIMITS = {
+    'register': {
+        'ip': limit_setting('register', 'ip', (10, 60)),
+        'institute': limit_setting('register', 'institute', (300, 60)),
+    },
+    'download': {
+        'ip': limit_setting('download', 'ip', (20, 60)),
+        'institute': limit_setting('download', 'institute', (600, 60)),
+    },
+    'confirm': {
+        'ip': limit_setting('confirm', 'ip', (10, 60)),
+    },
+}
+
+
+def lockout(failures):
+    """Seconds a username stays locked after its ``failures``-th failure in a row"""
+    if failures <= LOGIN_FREE_FAILURES:
+        return 0
+    return min(LOGIN_BACKOFF_MAX, LOGIN_BACKOFF_SECONDS * 2 ** (failures - LOGIN_FREE_FAILURES - 1))
+
+
+class MemoryBuckets:
+    """Per-process token buckets, least recently used dropped beyond RATE_LIMIT_MAX_KEYS"""
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now=None):
+        """Take one token; returns 0 if granted, else the seconds until one is available"""
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def locked_for(self, key, now=None):
+        """Seconds until ``key`` may try to log in again (0 = now)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            failures, updated = self._failures.get(key, (0, now))
+        return max(0, updated + lockout(failures) - now)
+
+    def fail(self, key, now=None):
+        """Count a failed login for ``key``; returns the lockout it now serves"""
+        now = time.time() if now is None else now
+        with self._lock:
+            failures, updated = self._failures.pop(key, (0, now))
+            failures = 1 if now - updated > LOGIN_FAILURE_WINDOW else failures + 1
+            self._failures[key] = (failures, now)
+            while len(self._failures) > self.max_keys:
+                self._failures.popitem(last=False)
+        return lockout(failures)
+
+    def succeed(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+class SQLiteBuckets:
+    """Token buckets in a small SQLite file shared by every worker on the host"""
+
+    def __init__(self, path=RATE_LIMIT_DATABASE):
+        self.path = path
+        self._migrated = False
+        self._takes = 0
+
+    def connection(self):
+        conn = get_connection(self.path)
+        if not self._migrated:
+            migrate(conn, RATE_LIMIT_MIGRATIONS)
+            self._migrated = True
+        return conn
+
+    def take(self, key, capacity, rate, now=None):
+        """Take one token; returns 0 if granted, else the seconds until one is available"""
+        now = time.time() if now is None else now
+        conn = self.connection()
+
+        # One statement refills and takes atomically; the WHERE leaves an empty bucket untouched
+        granted = conn.execute('''
+            INSERT INTO rate_buckets (key, tokens, updated) VALUES (?, ? - 1, ?)
+            ON CONFLICT (key) DO UPDATE
+            SET tokens = min(?, tokens + (? - updated) * ?) - 1, updated = excluded.updated
+            WHERE min(?, tokens + (? - updated) * ?) >= 1
+        ''', (key, capacity, now, capacity, now, rate, capacity, now, rate)).rowcount
+        wait = 0
+        if not granted:
+            row = conn.execute('SELECT tokens, updated FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            wait = (1 - min(capacity, row[0] + (now - row[1]) * rate)) / rate
+
+        self._takes += 1
+        if self._takes % RATE_LIMIT_PRUNE_EVERY == 0:
+            conn.execute('DELETE FROM rate_buckets WHERE updated < ?', (now - RATE_LIMIT_PRUNE_SECONDS,))
+        conn.commit()
+        return wait
+
+    def locked_for(self, key, now=None):
+        """Seconds until ``key`` may try to log in again (0 = now)"""
+        now = time.time() if now is None else now
+        row = self.connection().execute('SELECT failures, updated FROM login_failures WHERE key = ?', (key,)).fetchone()
+        return max(0, row[1] + lockout(row[0]) - now) if row else 0
+
+    def fail(self, key, now=None):
+        """Count a failed login for ``key``; returns the lockout it now serves"""
+        now = time.time() if now is None else now
+        conn = self.connection()
+        conn.execute('''
+            INSERT INTO login_failures (key, failures, updated) VALUES (?, 1, ?)
+            ON CONFLICT (key) DO UPDATE
+            SET failures = CASE WHEN updated < ? THEN 1 ELSE failures + 1 END, updated = excluded.updated
+        ''', (key, now, now - LOGIN_FAILURE_WINDOW))
+        failures = conn.execute('SELECT failures FROM login_failures WHERE key = ?', (key,)).fetchone()[0]
+        conn.execute('DELETE FROM login_failures WHERE updated < ?',
+                     (now - max(LOGIN_FAILURE_WINDOW, LOGIN_BACKOFF_MAX),))
+        conn.commit()
+        return lockout(failures)
+
+    def succeed(self, key):
+        conn = self.connection()
+        conn.execute('DELETE FROM login_failures WHERE key = ?', (key,))
+        conn.commit()
+
+
+BACKENDS = {
+    'memory': MemoryBuckets,
+    'sqlite': SQLiteBuckets,
+}
+
+buckets = BACKENDS[RATE_LIMIT_BACKEND]() if RATE_LIMIT_BACKEND in BACKENDS else None
+# Login back-off stays on even with RATE_LIMIT_BACKEND=off
+failures = buckets or MemoryBuckets()
+inflight = None
+stats = {'limited': 0, 'shed': 0}
+
+
+def set_max_inflight(limit):
+    """Admit at most ``limit`` public writes at once in this process (0 = no cap)"""
+    global inflight
+    inflight = threading.BoundedSemaphore(limit) if limit > 0 else None
+
+
+def configure_worker(threads):
+    """Size the in-flight cap to a worker with ``threads`` request threads (gunicorn's post_fork)"""
+    limit = max(threads - 1, 1)
+    if RATE_LIMIT_MAX_INFLIGHT:
+        limit = min(int(RATE_LIMIT_MAX_INFLIGHT), threads)
+    set_max_inflight(limit)
+
+
+# Outside gunicorn the thread count is unknown: only an explicit setting applies
+set_max_inflight(int(RATE_LIMIT_MAX_INFLIGHT or 0))
+
+
+def client_ip():
+    """Client address, taken from X-Forwarded-For only as far as trusted proxies wrote it"""
+    forwarded = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+    if RATE_LIMIT_TRUSTED_PROXIES and len(forwarded) >= RATE_LIMIT_TRUSTED_PROXIES:
+        return forwarded[-RATE_LIMIT_TRUSTED_PROXIES]
+    return request.remote_addr or '-'
+
+
+def check(scope, institute=None):
+    """Take a token from every bucket of ``scope`` for this request; returns seconds to wait (0 = allowed)"""
+    if buckets is None:
+        return 0
+    subjects = {'ip': client_ip(), 'institute': institute}
+    for name, (requests, seconds) in RATE_LIMITS[scope].items():
+        if subjects[name] is None:
+            continue
+        wait = buckets.take(f'{scope}:{name}:{subjects[name]}', requests, requests / seconds)
+        if wait:
+            return wait
+    return 0
+
+
+def too_many_requests(wait, message):
+    retry_after = max(1, math.ceil(wait))
+    response = jsonify({'error': message, 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def rate_limited(scope):
+    """Route decorator: throttle POSTs per client IP and institute, and shed them when the worker is saturated"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'POST':
+                return f(*args, **kwargs)
+
+            wait = check(scope, kwargs.get('username'))
+            if wait:
+                stats['limited'] += 1
+                return too_many_requests(wait, 'Too many requests, please try again shortly')
+
+            # Admission control: refuse now rather than queue behind the writers already running
+            slots = inflight
+            if slots is None:
+                return f(*args, **kwargs)
+            if not slots.acquire(blocking=False):
+                stats['shed'] += 1
+                return too_many_requests(1, 'Server busy, please try again shortly')
+            try:
+                return f(*args, **kwargs)
+            finally:
+                slots.release()
+        return decorated_function
+    return decorator
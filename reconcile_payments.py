@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Reconcile gateway transactions (payments.db) with registrations (coach_saas.db)
+
+payments.db is ATTACHed to the main database so mismatches are found by one
+joined query per chunk rather than a lookup per transaction:
+
+    unpaid     the transaction completed but the registration is not
+               marked paid; repaired with complete_registration(), which
+               also sends the confirmation emails
+    conflict   the registration is paid under a different payment id
+               (reported only)
+    orphan     the transaction points at a registration that does not
+               exist (reported only)
+
+Repairs are committed in chunks of --chunk rows. With --incremental only
+transactions updated since the stored watermark (minus a small overlap for
+rows that share its timestamp) are examined, so the job is cheap enough to
+run every few minutes from cron:
+
+    python reconcile_payments.py                  # full pass
+    python reconcile_payments.py --incremental
+    python reconcile_payments.py --dry-run        # report without repairing
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from database import DATABASE, PAYMENTS_DATABASE, connect
+from migrations import MIGRATIONS, PAYMENT_MIGRATIONS, migrate
+from payment_state import complete_registration
+
+RECONCILE_CHUNK_SIZE = int(os.environ.get('RECONCILE_CHUNK_SIZE', 1000))
+
+# updated_at has one-second resolution; re-examine this much before the watermark
+RECONCILE_OVERLAP_SECONDS = int(os.environ.get('RECONCILE_OVERLAP_SECONDS', 60))
+
+WATERMARK_JOB = 'payment_reconcile'
+
+
+def open_databases():
+    """Dedicated connection to coach_saas.db with payments.db attached as ``payments``"""
+    migrate(connect(PAYMENTS_DATABASE), PAYMENT_MIGRATIONS)
+    conn = connect(DATABASE)
+    migrate(conn, MIGRATIONS)
+    conn.execute('ATTACH DATABASE ? AS payments', (PAYMENTS_DATABASE,))
+    return conn
+
+
+def load_watermark(conn):
+    row = conn.execute('SELECT watermark FROM job_watermarks WHERE job = ?', (WATERMARK_JOB,)).fetchone()
+    return row[0] if row else None
+
+
+def save_watermark(conn, watermark):
+    conn.execute('''
+        INSERT INTO job_watermarks (job, watermark) VALUES (?, ?)
+        ON CONFLICT (job) DO UPDATE SET watermark = excluded.watermark, updated_at = CURRENT_TIMESTAMP
+    ''', (WATERMARK_JOB, watermark))
+    conn.commit()
+
+
+def find_mismatches(conn, after, upper, limit):
+    """Next ``limit`` mismatched transactions after keyset ``after`` = (updated_at, id), up to ``upper``"""
+    return conn.execute('''
+        SELECT t.id, t.updated_at, t.registration_id, t.gateway_payment_id,
+               CASE WHEN r.id IS NULL THEN 'orphan'
+                    WHEN r.payment_status = 'completed' THEN 'conflict'
+                    ELSE 'unpaid' END
+        FROM payments.payment_transactions t
+        LEFT JOIN registrations r ON r.id = t.registration_id
+        WHERE (t.updated_at, t.id) > (?, ?) AND t.updated_at <= ?
+          AND (r.id IS NULL
+               OR (t.status = 'completed'
+                   AND (r.payment_status IS NOT 'completed' OR r.payment_id IS NOT t.gateway_payment_id)))
+        ORDER BY t.updated_at, t.id
+        LIMIT ?
+    ''', (after[0], after[1], upper, limit)).fetchall()
+
+
+def reconcile(conn, incremental=False, dry_run=False, chunk_size=RECONCILE_CHUNK_SIZE):
+    """One reconciliation pass; returns a summary dict"""
+    started = time.perf_counter()
+    upper = conn.execute('SELECT MAX(updated_at) FROM payments.payment_transactions').fetchone()[0]
+    watermark = load_watermark(conn) if incremental else None
+    lower = ''
+    if watermark:
+        lower = conn.execute("SELECT datetime(?, ?)", (watermark, f'-{RECONCILE_OVERLAP_SECONDS} seconds')).fetchone()[0]
+
+    summary = {'mode': 'incremental' if watermark else 'full', 'from': lower or None, 'to': upper,
+               'checked': 0, 'unpaid': 0, 'conflict': 0, 'orphan': 0, 'repaired': 0, 'chunks': 0}
+    if upper is None:
+        return summary
+
+    summary['checked'] = conn.execute('''
+        SELECT COUNT(*) FROM payments.payment_transactions WHERE updated_at > ? AND updated_at <= ?
+    ''', (lower, upper)).fetchone()[0]
+
+    after = (lower, 0)
+    while True:
+        rows = find_mismatches(conn, after, upper, chunk_size)
+        if not rows:
+            break
+        summary['chunks'] += 1
+
+        cursor = conn.cursor()
+        for transaction_id, updated_at, registration_id, payment_id, kind in rows:
+            summary[kind] += 1
+            if kind == 'unpaid' and not dry_run:
+                summary['repaired'] += complete_registration(cursor, registration_id, payment_id)
+            elif kind != 'unpaid':
+                print(f"[RECONCILE] {kind}: transaction {transaction_id} -> registration {registration_id}")
+        conn.commit()
+        after = (rows[-1][1], rows[-1][0])
+
+    if not dry_run:
+        save_watermark(conn, upper)
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconcile payments.db with coach_saas.db')
+    parser.add_argument('--incremental', action='store_true', help='only transactions updated since the last run')
+    parser.add_argument('--dry-run', action='store_true', help='report mismatches without repairing them')
+    parser.add_argument('--chunk', type=int, default=RECONCILE_CHUNK_SIZE, help='rows per repair transaction')
+    args = parser.parse_args()
+
+    conn = open_databases()
+    summary = reconcile(conn, args.incremental, args.dry_run, args.chunk)
+    print("[RECONCILE] " + ', '.join(f"{key}={value}" for key, value in summary.items()))
+    conflicts = summary['conflict'] + summary['orphan']
+    return 1 if conflicts or (args.dry_run and summary['unpaid']) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,19 @@
+"""
+gunicorn worker used by gunicorn.conf.py
+
+The stock gthread worker can accept one more connection in the same loop
+iteration in which a request thread flags it for a max_requests restart,
+then exits without serving it, so every recycle drops a request. This one
+stops accepting as soon as it is flagged; the connection stays in the
+listen backlog for a sibling or the replacement worker.
+"""
+
+from gunicorn.workers.gthread import ThreadWorker as _GThreadWorker
+
+
+class ThreadWorker(_GThreadWorker):
+    """gthread worker whose max_requests restarts never drop a connection"""
+
+    def accept(self, server, listener):
+        if self.alive:
+            super().accept(server, listener)
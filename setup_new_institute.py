@@ -6,10 +6,12 @@ This script helps quickly replicate the setup for new institutions
 
 import os
 import shutil
-import sqlite3
 from werkzeug.security import generate_password_hash
 import json
 
+from database import connect
+from migrations import migrate
+
 def setup_new_institute():
     """Interactive setup for new institute"""
     print("=== Coach Institute SaaS - New Institute Setup ===")
@@ -31,50 +33,11 @@ def setup_new_institute():
             print("Setup cancelled.")
             return
     
-    # Initialize database
-    conn = sqlite3.connect(db_name)
+    # Initialize database: platform PRAGMAs plus the versioned schema
+    conn = connect(db_name)
+    migrate(conn)
     cursor = conn.cursor()
     
-    # Create tables
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS institutes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            institute_name TEXT NOT NULL,
-            offer_text TEXT,
-            upi_id TEXT,
-            email TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS configurations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            institute_id INTEGER,
-            why_choose_us TEXT,
-            pdf_title TEXT,
-            pdf_filename TEXT,
-            testimonials TEXT,
-            FOREIGN KEY (institute_id) REFERENCES institutes (id)
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS registrations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            institute_id INTEGER,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            payment_status TEXT DEFAULT 'pending',
-            payment_id TEXT,
-            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (institute_id) REFERENCES institutes (id)
-        )
-    ''')
-    
     # Insert institute data
     cursor.execute('''
         INSERT INTO institutes (username, password_hash, institute_name, email, upi_id)
@@ -0,0 +1,176 @@
+"""
+Sharded, streamed and cached sitemaps
+
+/sitemap.xml is a sitemap index pointing at /sitemap-<n>.xml shards. Shard n
+holds the active institutes whose id falls in
+[(n - 1) * SITEMAP_SHARD_SIZE + 1, n * SITEMAP_SHARD_SIZE], so an institute
+never moves between shards and a change only invalidates the shard it lives
+in. Shards are streamed row by row from SQLite while the bytes are kept for
+the next request; <lastmod> comes from tenant_versions.updated_at.
+"""
+
+import os
+import threading
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from http_cache import parse_timestamp
+
+# The sitemap protocol allows at most 50,000 URLs (and 50 MB) per file
+SITEMAP_SHARD_SIZE = min(int(os.environ.get('SITEMAP_SHARD_SIZE', 10000)), 50000)
+
+# URLs written per yielded chunk while streaming a shard
+STREAM_CHUNK_URLS = 500
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+
+def shard_for(institute_id):
+    """Shard number (1-based) an institute id belongs to"""
+    return (institute_id - 1) // SITEMAP_SHARD_SIZE + 1
+
+
+def shard_bounds(shard):
+    """Inclusive institute id range covered by ``shard``"""
+    return (shard - 1) * SITEMAP_SHARD_SIZE + 1, shard * SITEMAP_SHARD_SIZE
+
+
+def shard_count(cursor):
+    """Number of shards needed for every institute id handed out so far"""
+    cursor.execute('SELECT MAX(id) FROM institutes')
+    max_id = cursor.fetchone()[0] or 0
+    return shard_for(max_id) if max_id else 1
+
+
+def lastmod(timestamp):
+    """W3C datetime for a <lastmod> element"""
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+
+class SitemapCache:
+    """Per-shard metadata and bodies, plus the rendered index, per URL root"""
+
+    def __init__(self):
+        self._shards = {}
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def generation(self):
+        """Token to pass to the put methods; puts are dropped after an invalidation"""
+        with self._lock:
+            return self._generation
+
+    def get_shard(self, shard):
+        """Cached {'version', 'updated_at', 'bodies'} for ``shard`` or None"""
+        with self._lock:
+            return self._shards.get(shard)
+
+    def put_shard_metadata(self, shard, version, updated_at, generation):
+        with self._lock:
+            if generation != self._generation:
+                return None
+            entry = self._shards.setdefault(shard, {'version': version, 'updated_at': updated_at, 'bodies': {}})
+            return entry
+
+    def put_shard_body(self, shard, url_root, body, generation):
+        with self._lock:
+            entry = self._shards.get(shard)
+            if entry is not None and generation == self._generation:
+                entry['bodies'][url_root] = body
+
+    def get_index(self, url_root):
+        with self._lock:
+            return self._indexes.get(url_root)
+
+    def put_index(self, url_root, index, generation):
+        with self._lock:
+            if generation == self._generation:
+                self._indexes[url_root] = index
+
+    def invalidate(self, institute_id):
+        """Forget the shard holding ``institute_id`` and every index"""
+        with self._lock:
+            self._generation += 1
+            self._shards.pop(shard_for(institute_id), None)
+            self._indexes.clear()
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._shards.clear()
+            self._indexes.clear()
+
+
+sitemaps = SitemapCache()
+
+
+def shard_metadata(cursor, shard):
+    """Highest tenant version and latest update in ``shard``, cached until it changes"""
+    entry = sitemaps.get_shard(shard)
+    if entry is not None:
+        return entry
+
+    generation = sitemaps.generation()
+    cursor.execute('''
+        SELECT MAX(version), MAX(updated_at) FROM tenant_versions
+        WHERE institute_id BETWEEN ? AND ?
+    ''', shard_bounds(shard))
+    version, updated_at = cursor.fetchone()
+    entry = sitemaps.put_shard_metadata(shard, version or 0, updated_at, generation)
+    return entry or {'version': version or 0, 'updated_at': updated_at, 'bodies': {}}
+
+
+def index_body(shard_urls):
+    """Sitemap index XML for [(url, lastmod or None)]"""
+    parts = [XML_HEADER, '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for url, modified in shard_urls:
+        parts.append(f'    <sitemap>\n        <loc>{escape(url)}</loc>\n')
+        if modified:
+            parts.append(f'        <lastmod>{modified}</lastmod>\n')
+        parts.append('    </sitemap>\n')
+    parts.append('</sitemapindex>\n')
+    return ''.join(parts).encode()
+
+
+def stream_shard(cursor, shard, url_root, generation):
+    """Yield shard XML in chunks straight off the cursor, caching the full body at the end"""
+    chunks = []
+
+    def emit(text):
+        data = text.encode()
+        chunks.append(data)
+        return data
+
+    parts = [XML_HEADER, '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    if shard == 1:
+        parts.append(
+            f'    <url>\n        <loc>{escape(url_root)}</loc>\n'
+            '        <changefreq>daily</changefreq>\n        <priority>1.0</priority>\n    </url>\n'
+        )
+
+    # The unary + keeps the planner on the id range instead of the is_active index
+    cursor.execute('''
+        SELECT i.username, v.updated_at
+        FROM institutes i
+        LEFT JOIN tenant_versions v ON v.institute_id = i.id
+        WHERE i.id BETWEEN ? AND ? AND +i.is_active = TRUE
+        ORDER BY i.id
+    ''', shard_bounds(shard))
+
+    written = 0
+    for username, updated_at in cursor:
+        url = escape(f"{url_root}institute/{quote(username)}")
+        parts.append(f'    <url>\n        <loc>{url}</loc>\n')
+        if updated_at:
+            parts.append(f'        <lastmod>{lastmod(parse_timestamp(updated_at))}</lastmod>\n')
+        parts.append('        <changefreq>weekly</changefreq>\n        <priority>0.8</priority>\n    </url>\n')
+        written += 1
+        if written % STREAM_CHUNK_URLS == 0:
+            yield emit(''.join(parts))
+            parts = []
+
+    parts.append('</urlset>\n')
+    yield emit(''.join(parts))
+
+    sitemaps.put_shard_body(shard, url_root, b''.join(chunks), generation)
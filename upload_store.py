@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Content-addressed, deduplicated upload storage
+
+An upload is streamed to a temp file in chunks while it is hashed, then kept
+once under ``uploads/blobs/<aa>/<sha256>.<ext>`` however many tenants upload
+the same bytes. The ``uploads`` table maps the tenant-visible filename
+(``<username>_<file>``) to its blob, and triggers keep
+``upload_blobs.refcount`` equal to the number of such rows. Blobs nobody
+references for BLOB_GC_GRACE_HOURS are deleted by collect_garbage().
+
+Because a blob's name is its content hash, /blobs/<sha256>.<ext> URLs never
+change meaning and are served as immutable.
+
+    python upload_store.py gc        # delete unreferenced blobs
+    python upload_store.py import    # move pre-store files into the store
+"""
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from database import get_connection
+from migrations import migrate
+
+BLOB_FOLDER = 'blobs'
+# Files derived from a blob (resized images), deleted along with it
+VARIANT_FOLDER = 'variants'
+CHUNK_SIZE = 64 * 1024
+
+# Unreferenced blobs survive this long, so an upload in flight can still claim them
+BLOB_GC_GRACE_HOURS = int(os.environ.get('BLOB_GC_GRACE_HOURS', 24))
+
+
+def blob_relpath(sha256, extension):
+    """Blob location relative to the upload folder"""
+    return os.path.join(BLOB_FOLDER, sha256[:2], f'{sha256}.{extension}')
+
+
+def blob_url(sha256, extension):
+    return f'/blobs/{sha256}.{extension}'
+
+
+def variant_dir(sha256):
+    """Folder, relative to the upload folder, holding the files derived from a blob"""
+    return os.path.join(VARIANT_FOLDER, sha256[:2], sha256)
+
+
+def spool(stream, upload_folder):
+    """Copy ``stream`` to a temp file next to the blobs; returns (path, sha256, size)"""
+    folder = os.path.join(upload_folder, BLOB_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=folder, prefix='.upload-', delete=False) as tmp:
+        try:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+    return tmp.name, digest.hexdigest(), size
+
+
+def store(conn, upload_folder, stream, filename, institute_id, kind):
+    """Save ``stream`` as tenant file ``filename`` in the caller's transaction; returns (sha256, extension)
+
+    The write lock is taken before the blob file is placed, so collect_garbage()
+    can never delete a blob this call has just decided to reuse.
+    """
+    tmp_path, sha256, size = spool(stream, upload_folder)
+    try:
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')
+        conn.execute('''
+            INSERT OR IGNORE INTO upload_blobs (sha256, extension, size)
+            VALUES (?, ?, ?)
+        ''', (sha256, filename.rsplit('.', 1)[-1].lower(), size))
+        extension = conn.execute('SELECT extension FROM upload_blobs WHERE sha256 = ?', (sha256,)).fetchone()[0]
+
+        path = os.path.join(upload_folder, blob_relpath(sha256, extension))
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+
+        conn.execute('''
+            INSERT INTO uploads (institute_id, kind, filename, sha256)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (filename) DO UPDATE
+            SET institute_id = excluded.institute_id, kind = excluded.kind,
+                sha256 = excluded.sha256, created_at = CURRENT_TIMESTAMP
+        ''', (institute_id, kind, filename, sha256))
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        # Left over when the blob already existed (or on failure)
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return sha256, extension
+
+
+def resolve(cursor, filename):
+    """(sha256, extension) of the blob behind tenant file ``filename``, or None"""
+    cursor.execute('''
+        SELECT b.sha256, b.extension
+        FROM uploads u
+        JOIN upload_blobs b ON b.sha256 = u.sha256
+        WHERE u.filename = ?
+    ''', (filename,))
+    return cursor.fetchone()
+
+
+def release(cursor, institute_id, kind, keep):
+    """Drop the institute's ``kind`` uploads for which ``keep(filename, url)`` is false"""
+    cursor.execute('''
+        SELECT u.id, u.filename, b.sha256, b.extension
+        FROM uploads u
+        JOIN upload_blobs b ON b.sha256 = u.sha256
+        WHERE u.institute_id = ? AND u.kind = ?
+    ''', (institute_id, kind))
+    dropped = [(upload_id,) for upload_id, filename, sha256, extension in cursor.fetchall()
+               if not keep(filename, blob_url(sha256, extension))]
+    cursor.executemany('DELETE FROM uploads WHERE id = ?', dropped)
+    return len(dropped)
+
+
+def stale_files(upload_folder, grace_hours):
+    """Blob-folder files older than ``grace_hours``: [(path, sha256 or None for temp files)]"""
+    cutoff = time.time() - grace_hours * 3600
+    found = []
+    for root, _, names in os.walk(os.path.join(upload_folder, BLOB_FOLDER)):
+        for name in names:
+            path = os.path.join(root, name)
+            if os.path.getmtime(path) < cutoff:
+                found.append((path, None if name.startswith('.upload-') else name.split('.', 1)[0]))
+    return found
+
+
+def collect_garbage(conn, upload_folder, grace_hours=BLOB_GC_GRACE_HOURS):
+    """Delete blobs unreferenced for ``grace_hours`` and files no blob row owns; returns bytes freed"""
+    candidates = stale_files(upload_folder, grace_hours)
+
+    # Holding the write lock keeps store() from reusing a blob while it is deleted
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = conn.execute('''
+            SELECT sha256, extension, size FROM upload_blobs
+            WHERE refcount = 0 AND unreferenced_at <= datetime('now', ?)
+        ''', (f'-{grace_hours} hours',)).fetchall()
+        freed = sum(size for _, _, size in rows)
+        for sha256, extension, _ in rows:
+            try:
+                os.unlink(os.path.join(upload_folder, blob_relpath(sha256, extension)))
+            except FileNotFoundError:
+                pass
+            shutil.rmtree(os.path.join(upload_folder, variant_dir(sha256)), ignore_errors=True)
+        conn.executemany('DELETE FROM upload_blobs WHERE sha256 = ?', [(row[0],) for row in rows])
+        conn.executemany('DELETE FROM image_jobs WHERE sha256 = ?', [(row[0],) for row in rows])
+
+        # Temp files of crashed uploads, and blobs whose transaction rolled back
+        for path, sha256 in candidates:
+            owned = sha256 and conn.execute('SELECT 1 FROM upload_blobs WHERE sha256 = ?', (sha256,)).fetchone()
+            if not owned and os.path.exists(path):
+                freed += os.path.getsize(path)
+                os.unlink(path)
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return freed
+
+
+def import_legacy_files(conn, upload_folder):
+    """Move files saved directly in the upload folder into the store; returns how many"""
+    imported = 0
+    for name in sorted(os.listdir(upload_folder)):
+        path = os.path.join(upload_folder, name)
+        if not os.path.isfile(path) or name.startswith('.'):
+            continue
+
+        # Files were saved as <username>_<original name>; usernames may contain '_'
+        institute_id = None
+        parts = name.split('_')
+        for end in range(len(parts) - 1, 0, -1):
+            row = conn.execute('SELECT id FROM institutes WHERE username = ?', ('_'.join(parts[:end]),)).fetchone()
+            if row:
+                institute_id = row[0]
+                break
+
+        kind = 'testimonial' if '_testimonial_' in name else 'pdf'
+        with open(path, 'rb') as f:
+            store(conn, upload_folder, f, name, institute_id, kind)
+        conn.commit()
+        os.unlink(path)
+        imported += 1
+    return imported
+
+
+def main(argv):
+    upload_folder = os.environ.get('UPLOAD_FOLDER', 'uploads')
+    command = argv[0] if argv else None
+    conn = get_connection()
+    migrate(conn)
+
+    if command == 'gc':
+        freed = collect_garbage(conn, upload_folder)
+        print(f"[UPLOADS] Freed {freed} bytes")
+    elif command == 'import':
+        print(f"[UPLOADS] Imported {import_legacy_files(conn, upload_folder)} files")
+    else:
+        print("Usage: python upload_store.py gc|import")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
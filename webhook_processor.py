@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Batch processor for stored payment gateway webhooks
+
+/webhook/razorpay only verifies and stores events. This worker (the
+``webhooks:`` entry in Procfile_saas) reads unprocessed events in chunks of
+WEBHOOK_BATCH_SIZE and applies each chunk to payment_transactions
+(payments.db) and registrations (coach_saas.db) in one transaction per
+database. It then marks the events processed. Every step is conditional on
+the current status, so a chunk that is interrupted and re-read applies
+nothing twice.
+
+    python webhook_processor.py          # run until SIGTERM
+    python webhook_processor.py --once   # process what is stored, then exit
+"""
+
+import json
+import os
+import signal
+import sys
+import time
+
+from database import DATABASE, PAYMENTS_DATABASE, get_connection
+from migrations import MIGRATIONS, PAYMENT_MIGRATIONS, migrate
+from payment_state import complete_registration
+
+WEBHOOK_BATCH_SIZE = int(os.environ.get('WEBHOOK_BATCH_SIZE', 500))
+WEBHOOK_POLL_INTERVAL = float(os.environ.get('WEBHOOK_POLL_INTERVAL', 1))
+
+# Event type -> payment_transactions status it moves the order to
+EVENT_STATUS = {
+    'payment.captured': 'completed',
+    'order.paid': 'completed',
+    'payment.failed': 'failed',
+}
+
+
+def payment_entity(event):
+    """The payment object inside a gateway event"""
+    return event['payload']['payment']['entity']
+
+
+def apply_batch(payments_conn, main_conn, limit=WEBHOOK_BATCH_SIZE):
+    """Apply one chunk of unprocessed events; returns how many were read"""
+    payments_conn.execute('BEGIN IMMEDIATE')
+    try:
+        events = payments_conn.execute('''
+            SELECT id, event_type, payload FROM payment_webhooks
+            WHERE processed = FALSE
+            ORDER BY id
+            LIMIT ?
+        ''', (limit,)).fetchall()
+
+        results = []
+        completions = []
+        for webhook_id, event_type, payload in events:
+            status = EVENT_STATUS.get(event_type)
+            if status is None:
+                results.append((None, webhook_id))
+                continue
+            try:
+                payment = payment_entity(json.loads(payload))
+                order_id, payment_id = payment['order_id'], payment['id']
+            except (ValueError, KeyError, TypeError) as e:
+                results.append((f'malformed event: {e}', webhook_id))
+                continue
+
+            # A late payment.failed never undoes a completed order
+            payments_conn.execute('''
+                UPDATE payment_transactions
+                SET status = ?, gateway_payment_id = ?, payment_method = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE gateway_order_id = ? AND status != 'completed'
+            ''', (status, payment_id, payment.get('method'), order_id))
+
+            transaction = payments_conn.execute('''
+                SELECT registration_id, status, gateway_payment_id FROM payment_transactions
+                WHERE gateway_order_id = ?
+            ''', (order_id,)).fetchone()
+            if transaction is None:
+                results.append((f'unknown order {order_id}', webhook_id))
+                continue
+            if transaction[1] == 'completed':
+                completions.append((transaction[0], transaction[2]))
+            results.append((None, webhook_id))
+
+        # Registrations live in the other database: one grouped transaction there
+        if completions:
+            cursor = main_conn.cursor()
+            for registration_id, payment_id in completions:
+                complete_registration(cursor, registration_id, payment_id)
+            main_conn.commit()
+
+        payments_conn.executemany('''
+            UPDATE payment_webhooks
+            SET processed = TRUE, processed_at = CURRENT_TIMESTAMP, last_error = ?
+            WHERE id = ?
+        ''', results)
+        payments_conn.commit()
+    except Exception:
+        payments_conn.rollback()
+        main_conn.rollback()
+        raise
+    return len(events)
+
+
+def connections():
+    """(payments.db, coach_saas.db) connections with up-to-date schemas"""
+    payments_conn = get_connection(PAYMENTS_DATABASE)
+    main_conn = get_connection(DATABASE)
+    migrate(payments_conn, PAYMENT_MIGRATIONS)
+    migrate(main_conn, MIGRATIONS)
+    return payments_conn, main_conn
+
+
+def process_all(payments_conn, main_conn):
+    """Apply batches until no unprocessed events remain; returns how many were read"""
+    total = 0
+    while True:
+        processed = apply_batch(payments_conn, main_conn)
+        total += processed
+        if processed < WEBHOOK_BATCH_SIZE:
+            return total
+
+
+def run_worker():
+    """Process webhooks until SIGTERM/SIGINT"""
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    signal.signal(signal.SIGINT, lambda *args: stopping.append(True))
+
+    payments_conn, main_conn = connections()
+    print(f"[WEBHOOKS] Worker started (batch {WEBHOOK_BATCH_SIZE}, poll {WEBHOOK_POLL_INTERVAL}s)")
+
+    while not stopping:
+        try:
+            processed = apply_batch(payments_conn, main_conn)
+        except Exception as e:
+            print(f"[WEBHOOKS] Batch failed: {e}")
+            processed = 0
+        if processed < WEBHOOK_BATCH_SIZE:
+            time.sleep(WEBHOOK_POLL_INTERVAL)
+
+    print("[WEBHOOKS] Worker stopped")
+
+
+def main(args):
+    if '--once' in args:
+        print(f"Processed {process_all(*connections())} webhook events")
+    else:
+        run_worker()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))